@@ -1,18 +1,33 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks, UploadFile, File
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 import os
 import json
 from pathlib import Path
 import logging
-import tempfile
-import shutil
-import asyncio
-from typing import Optional, Dict, Any
-import uuid
+from typing import Optional, Dict, Any, Tuple
 
-from knowledge_base import init_knowledge_base, get_knowledge_base, LinguisticKnowledgeBase
+from knowledge_base import (
+    init_knowledge_base, get_knowledge_base, LinguisticKnowledgeBase, SEARCH_SCORERS,
+    compute_file_hash, DEFAULT_DB_PATH
+)
+from metadata_columns import validate_filters
+from search_response import (
+    shape_results, merge_batch_results, query_fingerprint, encode_cursor, decode_cursor,
+    check_cursor_generation, page_fetch_size, StaleCursorError, MIN_SNIPPET_CHARS, MAX_SNIPPET_CHARS
+)
+from pdf_extraction import extract_pdfs, extract_pdf_chunks_async, PDF_EXTRACT_WORKERS
+from executors import run_in_thread, loop_lag_monitor, OPERATION_LIMITS, shutdown as shutdown_executors
+from job_queue import JobQueue, JOB_RUNNING
+from repository_watcher import RepositoryWatcher, WATCH_REPOSITORY
+from file_inventory import FileInventory
+from upload_stream import receive_upload, UploadRejected
+from serving_role import (
+    elect_role, make_writer_proxy, IndexRefresher, WriterLock, WriterProxy,
+    ROLE_WRITER, READER_ROUTES
+)
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -23,6 +38,7 @@ HOST = os.getenv("HOST", "0.0.0.0")
 PORT = int(os.getenv("PORT", "8000"))
 ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "http://localhost:5173,http://127.0.0.1:5173,http://localhost:3000,http://127.0.0.1:3000").split(",")
 MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE", "50")) * 1024 * 1024  # 默认50MB
+MAX_BATCH_QUERIES = int(os.getenv("MAX_BATCH_QUERIES", "32"))  # 批量检索单次请求的最大查询数
 
 app = FastAPI(title="Linguistic Knowledge Base API", version="1.0.0")
 
@@ -39,10 +55,41 @@ app.add_middleware(
 class SearchRequest(BaseModel):
     query: str
     n_results: int = 5
+    scorer: Optional[str] = None  # "tfidf"、"bm25" 或 "keyword"，默认 tfidf
+    # 元数据过滤，如 {"type": "paper", "publication_date": {"gte": "2010"}}
+    filters: Optional[Dict[str, Any]] = None
+    # 指定时用命中词附近不超过该字符数的高亮片段代替完整文档块
+    snippet_chars: Optional[int] = None
+    # 只返回这些元数据字段，默认返回全部
+    fields: Optional[List[str]] = None
+    # 上一页响应中的 next_cursor，用于获取下一页；游标产生之后索引已更新时返回 409
+    cursor: Optional[str] = None
 
 class SearchResponse(BaseModel):
     results: List[Dict[str, Any]]
     total_found: int
+    scorer: Optional[str] = None  # 实际使用的打分方式
+    next_cursor: Optional[str] = None  # 还有更多结果时返回
+
+class BatchSearchQuery(BaseModel):
+    query: str
+    n_results: int = 5
+    scorer: Optional[str] = None  # 默认使用批量请求的 scorer
+    filters: Optional[Dict[str, Any]] = None
+
+class BatchSearchRequest(BaseModel):
+    queries: List[BatchSearchQuery]
+    scorer: Optional[str] = None
+    # 与单个检索相同，作用于返回的所有文档块
+    snippet_chars: Optional[int] = None
+    fields: Optional[List[str]] = None
+
+class BatchSearchResponse(BaseModel):
+    # 与 queries 一一对应：{"query", "scorer", "hits": [{"chunk", "distance"}], "total_found"}
+    results: List[Dict[str, Any]]
+    # 去重后的文档块，hits 中的 chunk 为此列表的下标
+    chunks: List[Dict[str, Any]]
+    total_chunks: int
 
 class KnowledgeBaseInfo(BaseModel):
     total_documents: int
@@ -67,6 +114,9 @@ class PaperUploadRequest(BaseModel):
     keywords: Optional[str] = None
     publication_date: Optional[str] = None
 
+class BatchRequest(BaseModel):
+    paths: Optional[List[str]] = None  # 文件或目录，默认 repository 目录
+
 class StatusResponse(BaseModel):
     status: str
     message: str
@@ -77,30 +127,112 @@ knowledge_base: Optional[LinguisticKnowledgeBase] = None
 processing_status: str = "ready"  # idle, processing, completed, error
 last_operation: Optional[str] = None
 last_operation_time: Optional[str] = None
-current_task_id: Optional[str] = None
-current_task: Optional[asyncio.Task] = None
-task_cancelled: bool = False
+# 持久化的导入任务队列，知识库初始化后创建
+job_queue: Optional[JobQueue] = None
+# repository 目录监视，WATCH_REPOSITORY=false 时不启动
+repository_watcher: Optional[RepositoryWatcher] = None
+# 多进程服务中的角色：写进程负责导入与索引维护（任务队列、目录监视只在写进程运行），只读副本跟随其提交
+serving_role: str = ROLE_WRITER
+writer_lock: Optional[WriterLock] = None
+writer_proxy: Optional[WriterProxy] = None
+index_refresher: Optional[IndexRefresher] = None
+
+# 上传文件的保存目录；上传过程中先写入同一文件系统下的暂存目录，完成后改名到最终位置
+PUBLIC_DIR = Path("../public")
+REPOSITORY_DIR = PUBLIC_DIR / "repository"
+UPLOAD_STAGING_DIR = REPOSITORY_DIR / ".incoming"
+# public 目录下PDF与CSV文件数的缓存，状态接口不再每次遍历目录
+file_inventory = FileInventory(PUBLIC_DIR, (".pdf", ".csv"))
+
+def place_upload(staging_path: Path, content_hash: str, filename: str) -> Tuple[Path, bool]:
+    """
+    把暂存文件改名到按内容寻址的最终位置（哈希前缀 + 原文件名），同一文件系统内只改名不复制；
+    最终位置已有相同内容时删除暂存文件。返回 (最终路径, 是否新放置)
+    """
+    final_path = REPOSITORY_DIR / f"{content_hash[:16]}_{Path(filename).name}"
+    if final_path.exists():
+        staging_path.unlink(missing_ok=True)
+        return final_path, False
+    os.replace(staging_path, final_path)
+    return final_path, True
+
+@app.middleware("http")
+async def route_to_writer(request: Request, call_next):
+    """只读副本只处理检索与状态接口，其余 /api 请求转发给写进程"""
+    path = request.url.path
+    if (serving_role == ROLE_WRITER or request.method == "OPTIONS"
+            or not path.startswith("/api/") or path in READER_ROUTES):
+        return await call_next(request)
+    if writer_proxy is None:
+        return JSONResponse(status_code=503, content={"detail": "当前工作进程为只读副本，且未配置写进程地址 WRITER_URL"})
+    return await writer_proxy.forward(request)
 
 @app.on_event("startup")
 async def startup_event():
     """应用启动时初始化知识库"""
-    global knowledge_base, processing_status
+    global knowledge_base, processing_status, job_queue, repository_watcher
+    global serving_role, writer_lock, writer_proxy, index_refresher
+    loop_lag_monitor.start()
+    try:
+        await file_inventory.refresh()
+    except Exception as e:
+        logger.error(f"扫描文件清单失败: {e}")
     try:
         # 从环境变量获取API密钥
         openai_api_key = os.getenv("OPENAI_API_KEY")
-        knowledge_base = init_knowledge_base(openai_api_key=openai_api_key)
+        serving_role, writer_lock = elect_role(DEFAULT_DB_PATH)
+        if serving_role != ROLE_WRITER:
+            # 只读副本：打开已提交的分段，定期跟随写进程提交的新代数
+            knowledge_base = await run_in_thread("ingest", init_knowledge_base, openai_api_key=openai_api_key,
+                                                 read_only=True)
+            writer_proxy = make_writer_proxy()
+            index_refresher = IndexRefresher(knowledge_base)
+            index_refresher.start()
+            processing_status = "ready"
+            logger.info(f"知识库只读副本初始化完成 (pid {os.getpid()})")
+            return
+        
+        knowledge_base = await run_in_thread("ingest", init_knowledge_base, openai_api_key=openai_api_key)
         processing_status = "ready"
         logger.info("知识库初始化完成")
+        
+        # 恢复上次未完成的导入任务
+        job_queue = JobQueue(Path(knowledge_base.db_path) / "jobs.json", run_batch_job)
+        await job_queue.start()
+        
+        # 监视 repository 目录，只导入新增、修改和删除的文件
+        if WATCH_REPOSITORY:
+            repository_watcher = RepositoryWatcher(
+                REPOSITORY_DIR, Path(knowledge_base.db_path) / "repository_snapshot.json",
+                apply_repository_changes, compute_file_hash
+            )
+            repository_watcher.start()
     except Exception as e:
         processing_status = "error"
         logger.error(f"知识库初始化失败: {e}")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """停止目录监视与任务调度（未完成的任务下次启动时恢复），关闭延迟监控与执行池"""
+    if repository_watcher:
+        await repository_watcher.stop()
+    if job_queue:
+        await job_queue.stop()
+    if index_refresher:
+        await index_refresher.stop()
+    if writer_proxy:
+        await writer_proxy.close()
+    if writer_lock:
+        writer_lock.release()
+    await loop_lag_monitor.stop()
+    shutdown_executors()
+
 @app.post("/api/init", response_model=StatusResponse)
 async def initialize_knowledge_base(request: InitRequest):
     """初始化知识库"""
     global knowledge_base
     try:
-        knowledge_base = init_knowledge_base(openai_api_key=request.openai_api_key)
+        knowledge_base = await run_in_thread("ingest", init_knowledge_base, openai_api_key=request.openai_api_key)
         
         return StatusResponse(
             status="success",
@@ -122,7 +254,7 @@ async def get_knowledge_base_info():
         raise HTTPException(status_code=400, detail="知识库未初始化")
     
     try:
-        info = knowledge_base.get_collection_info()
+        info = knowledge_base.get_collection_info(include_files=False)
         
         # 简化状态信息，确保能正确返回
         enhanced_info = {
@@ -143,15 +275,10 @@ async def get_system_status():
     
     try:
         if knowledge_base:
-            info = knowledge_base.get_collection_info()
+            info = knowledge_base.get_collection_info(include_files=False)
             
-            # 只统计 repository 目录下的文件
-            repository_dir = Path("../public/repository")
-            if repository_dir.exists():
-                pdf_files = list(repository_dir.rglob("*.pdf"))
-                total_files = len(pdf_files)
-            else:
-                total_files = 0
+            # 只统计 repository 目录下的文件（读取缓存的文件清单）
+            total_files = (await file_inventory.counts(REPOSITORY_DIR))[".pdf"]
             
             return {
                 "status": "ready",
@@ -166,12 +293,7 @@ async def get_system_status():
             }
         else:
             # 即使未初始化，也统计文件数
-            repository_dir = Path("../public/repository")
-            if repository_dir.exists():
-                pdf_files = list(repository_dir.rglob("*.pdf"))
-                total_files = len(pdf_files)
-            else:
-                total_files = 0
+            total_files = (await file_inventory.counts(REPOSITORY_DIR))[".pdf"]
             
             return {
                 "status": "not_initialized",
@@ -196,17 +318,121 @@ async def search_knowledge_base(request: SearchRequest):
     if not knowledge_base:
         raise HTTPException(status_code=400, detail="知识库未初始化")
     
+    if request.scorer and request.scorer not in SEARCH_SCORERS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"不支持的打分方式: {request.scorer}。支持的方式: {', '.join(SEARCH_SCORERS)}"
+        )
+    if request.snippet_chars is not None and not MIN_SNIPPET_CHARS <= request.snippet_chars <= MAX_SNIPPET_CHARS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"snippet_chars 应在 {MIN_SNIPPET_CHARS} 到 {MAX_SNIPPET_CHARS} 之间"
+        )
+    fingerprint = query_fingerprint(request.query, request.scorer, request.filters)
+    try:
+        validate_filters(request.filters)
+        offset, cursor_generation = decode_cursor(request.cursor, fingerprint) if request.cursor else (0, None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     try:
         # 增加默认结果数量，让AI获得更全面的信息
         n_results = max(request.n_results, 10)  # 至少返回10个结果
-        results = knowledge_base.search(request.query, n_results)
+        # 按页窗口对齐取回结果（至少多取一条用于判断是否还有下一页），同一窗口内的后续页命中检索缓存
+        search_result = await run_in_thread(
+            "search", knowledge_base.search_with_info,
+            request.query, page_fetch_size(offset, n_results), scorer=request.scorer, filters=request.filters
+        )
+        if cursor_generation is not None:
+            # 游标产生之后索引已更新时拒绝，避免翻页时重复或遗漏结果
+            check_cursor_generation(cursor_generation, search_result["generation"])
+        page = search_result["results"][offset:offset + n_results]
+        has_more = len(search_result["results"]) > offset + n_results
+        results = await run_in_thread(
+            "search", shape_results, page, request.query, request.snippet_chars, request.fields
+        )
+        next_cursor = None
+        if has_more:
+            next_cursor = encode_cursor(fingerprint, offset + n_results, search_result["generation"])
         return SearchResponse(
             results=results,
-            total_found=len(results)
+            total_found=len(results),
+            scorer=search_result["scorer"],
+            next_cursor=next_cursor
         )
+    except StaleCursorError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"搜索失败: {str(e)}")
 
+@app.post("/api/search/batch", response_model=BatchSearchResponse)
+async def search_knowledge_base_batch(request: BatchSearchRequest):
+    """
+    批量搜索知识库：每个查询可指定结果数、打分方式与过滤条件，条件相同的查询一次向量化完成；
+    多个查询命中的同一文档块只返回一次。结果数按请求返回，不像单个检索那样至少返回10个
+    """
+    global knowledge_base
+    if not knowledge_base:
+        raise HTTPException(status_code=400, detail="知识库未初始化")
+    
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="queries 不能为空")
+    if len(request.queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(status_code=400, detail=f"单次最多 {MAX_BATCH_QUERIES} 个查询")
+    if request.snippet_chars is not None and not MIN_SNIPPET_CHARS <= request.snippet_chars <= MAX_SNIPPET_CHARS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"snippet_chars 应在 {MIN_SNIPPET_CHARS} 到 {MAX_SNIPPET_CHARS} 之间"
+        )
+    specs = []
+    for i, item in enumerate(request.queries):
+        scorer = item.scorer or request.scorer
+        if scorer and scorer not in SEARCH_SCORERS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"第 {i + 1} 个查询不支持的打分方式: {scorer}。支持的方式: {', '.join(SEARCH_SCORERS)}"
+            )
+        if item.n_results < 1:
+            raise HTTPException(status_code=400, detail=f"第 {i + 1} 个查询的 n_results 应为正数")
+        try:
+            validate_filters(item.filters)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"第 {i + 1} 个查询: {e}")
+        specs.append({"query": item.query, "n_results": item.n_results, "scorer": scorer, "filters": item.filters})
+    
+    try:
+        outputs = await run_in_thread("search", knowledge_base.search_many, specs)
+        queries = [spec["query"] for spec in specs]
+        chunks, hits = await run_in_thread(
+            "search", merge_batch_results, queries, [output["results"] for output in outputs],
+            request.snippet_chars, request.fields
+        )
+        results = [
+            {"query": query, "scorer": output["scorer"], "hits": query_hits, "total_found": len(query_hits)}
+            for query, output, query_hits in zip(queries, outputs, hits)
+        ]
+        return BatchSearchResponse(results=results, chunks=chunks, total_chunks=len(chunks))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"批量搜索失败: {str(e)}")
+
+@app.get("/api/search-cache")
+async def get_search_cache_stats():
+    """获取检索缓存的命中统计"""
+    global knowledge_base
+    if not knowledge_base:
+        raise HTTPException(status_code=400, detail="知识库未初始化")
+    
+    return knowledge_base.get_search_cache_stats()
+
+@app.get("/api/extraction-cache")
+async def get_extraction_cache_stats():
+    """获取PDF提取缓存的命中统计"""
+    global knowledge_base
+    if not knowledge_base:
+        raise HTTPException(status_code=400, detail="知识库未初始化")
+    
+    return knowledge_base.get_extraction_cache_stats()
+
 @app.post("/api/add-document")
 async def add_document(request: DocumentRequest):
     """添加文档到知识库"""
@@ -221,91 +447,136 @@ async def add_document(request: DocumentRequest):
         
         documents = []
         
+        # 内容相同的文件（无论路径）不再重复提取和索引
+        content_hash = await run_in_thread("io", compute_file_hash, str(file_path))
+        existing_source = knowledge_base.find_source_by_hash(content_hash)
+        if existing_source:
+            # 该路径原先的内容已变化，旧文档块不能继续留在索引中
+            removed = await run_in_thread("ingest", knowledge_base.drop_superseded_source,
+                                          str(file_path), existing_source)
+            return {"message": "内容相同的文档已存在，跳过", "existing_source": existing_source,
+                    "removed_chunks": removed}
+        
         if request.file_type.lower() == "pdf":
-            # 处理PDF文件
-            text = knowledge_base.extract_text_from_pdf(str(file_path))
-            if text:
+            # 处理PDF文件：按页流式提取并切块
+            extracted = await extract_pdf_chunks_async(str(file_path), content_hash, knowledge_base.extraction_cache)
+            if extracted and extracted["chunks"]:
                 documents.append({
-                    "content": text,
+                    "chunks": extracted["chunks"],
                     "metadata": {
                         "source": str(file_path),
                         "type": "pdf",
-                        "filename": file_path.name
+                        "filename": file_path.name,
+                        "pages": extracted["pages"],
+                        "content_hash": content_hash
                     }
                 })
         
         elif request.file_type.lower() == "csv":
-            # 处理CSV文件
-            documents = knowledge_base.process_csv_data(str(file_path))
+            # 处理CSV文件：分块读取，逐块写入索引
+            summary = await run_in_thread("ingest", knowledge_base.ingest_csv, str(file_path), content_hash)
+            if not summary["rows"]:
+                return {"message": "没有找到可处理的文档"}
+            return {"message": f"成功添加 {summary['rows']} 个文档", "reindexed": bool(summary["reindexed"])}
         
         else:
             raise HTTPException(status_code=400, detail="不支持的文件类型")
         
         if documents:
-            knowledge_base.add_documents(documents)
-            return {"message": f"成功添加 {len(documents)} 个文档"}
+            summary = await run_in_thread("ingest", knowledge_base.add_documents, documents)
+            return {"message": f"成功添加 {len(documents)} 个文档", "reindexed": bool(summary["reindexed"])}
         else:
             return {"message": "没有找到可处理的文档"}
             
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"添加文档失败: {str(e)}")
 
-@app.post("/api/upload-paper")
+@app.post("/api/upload-paper", openapi_extra={
+    "requestBody": {"content": {"multipart/form-data": {"schema": {
+        "type": "object",
+        "required": ["file"],
+        "properties": {
+            "file": {"type": "string", "format": "binary"},
+            "title": {"type": "string"},
+            "authors": {"type": "string"},
+            "abstract": {"type": "string"},
+            "keywords": {"type": "string"},
+            "publication_date": {"type": "string"},
+        },
+    }}}}
+})
 async def upload_paper(
-    file: UploadFile = File(...),
+    request: Request,
     title: Optional[str] = None,
     authors: Optional[str] = None,
     abstract: Optional[str] = None,
     keywords: Optional[str] = None,
     publication_date: Optional[str] = None
 ):
-    """上传论文文件到知识库"""
+    """
+    上传论文文件到知识库。请求体直接按流解析：文件边接收边写入暂存文件并计算内容哈希（只写一次磁盘），
+    超过 MAX_FILE_SIZE 时立即中止；论文元数据可以作为表单字段或查询参数提供
+    """
     global knowledge_base
     if not knowledge_base:
         raise HTTPException(status_code=400, detail="知识库未初始化")
     
-    # 检查文件类型
+    # 检查文件类型与大小：在读取文件内容之前（表单头）或接收过程中检查，不合要求时立即中止
     allowed_types = ["pdf", "docx", "txt"]
-    file_extension = file.filename.split(".")[-1].lower() if file.filename else ""
+    try:
+        upload = await receive_upload(request, UPLOAD_STAGING_DIR, MAX_FILE_SIZE, allowed_types)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     
-    if file_extension not in allowed_types:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"不支持的文件类型: {file_extension}。支持的类型: {', '.join(allowed_types)}"
-        )
-    
-            # 检查文件大小限制
-        if file.size and file.size > MAX_FILE_SIZE:
-            raise HTTPException(
-                status_code=400,
-                detail=f"文件过大: {file.size / 1024 / 1024:.1f}MB。最大允许: {MAX_FILE_SIZE / 1024 / 1024:.0f}MB"
-            )
+    filename = upload.filename
+    file_extension = filename.split(".")[-1].lower()
+    staging_path = upload.path
+    content_hash, file_size = upload.content_hash, upload.size
+    title = title or upload.fields.get("title")
+    authors = authors or upload.fields.get("authors")
+    abstract = abstract or upload.fields.get("abstract")
+    keywords = keywords or upload.fields.get("keywords")
+    publication_date = publication_date or upload.fields.get("publication_date")
     
     try:
-        # 创建临时文件
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f".{file_extension}") as temp_file:
-            # 写入上传的文件内容
-            shutil.copyfileobj(file.file, temp_file)
-            temp_file_path = temp_file.name
+        # 内容相同的论文已入库时直接返回，不再提取文本或在repository目录保存副本
+        existing_source = knowledge_base.find_source_by_hash(content_hash)
+        if existing_source:
+            staging_path.unlink(missing_ok=True)
+            logger.info(f"内容相同的论文已存在，跳过: {filename} (已有: {existing_source})")
+            return {
+                "message": "内容相同的论文已存在，未重复保存",
+                "filename": filename,
+                "duplicate": True,
+                "existing_source": existing_source,
+                "documents_added": 0,
+                "file_size": file_size
+            }
+        
+        # 改名到按内容寻址的最终位置，之后直接从该位置提取
+        final_file_path, placed = await run_in_thread("io", place_upload, staging_path, content_hash, filename)
+        file_inventory.invalidate()
+        final_filename = final_file_path.name
+        saved_path = str(final_file_path)
         
         try:
             documents = []
-            extracted_text = ""
+            text_length = 0
             
             if file_extension == "pdf":
-                # 处理PDF文件
-                text = knowledge_base.extract_text_from_pdf(temp_file_path)
-                if text and text.strip():
-                    extracted_text = text
+                # 处理PDF文件：按页流式提取并切块，块上记录起止页码
+                extracted = await extract_pdf_chunks_async(saved_path, content_hash, knowledge_base.extraction_cache)
+                if extracted and extracted["chunks"]:
+                    text_length = extracted["characters"]
                     # 创建元数据，只包含非空值
                     metadata = {
-                        "source": file.filename,
+                        "source": filename,
                         "type": "paper",
                         "file_type": "pdf",
-                        "title": title or file.filename.replace(f".{file_extension}", ""),
+                        "title": title or filename.replace(f".{file_extension}", ""),
                         "upload_time": str(Path().cwd()),
-                        "file_size": file.size,
-                        "pages": len(text.split('\n')) // 50 + 1  # 估算页数
+                        "file_size": file_size,
+                        "pages": extracted["pages"]
                     }
                     
                     # 只添加非空的元数据字段
@@ -319,7 +590,7 @@ async def upload_paper(
                         metadata["publication_date"] = publication_date
                     
                     documents.append({
-                        "content": text,
+                        "chunks": extracted["chunks"],
                         "metadata": metadata
                     })
                 else:
@@ -332,18 +603,18 @@ async def upload_paper(
                 # 处理Word文档
                 try:
                     import docx
-                    doc = docx.Document(temp_file_path)
+                    doc = await run_in_thread("io", docx.Document, saved_path)
                     text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
                     if text.strip():
-                        extracted_text = text
+                        text_length = len(text)
                         # 创建元数据，只包含非空值
                         metadata = {
-                            "source": file.filename,
+                            "source": filename,
                             "type": "paper",
                             "file_type": "docx",
-                            "title": title or file.filename.replace(f".{file_extension}", ""),
+                            "title": title or filename.replace(f".{file_extension}", ""),
                             "upload_time": str(Path().cwd()),
-                            "file_size": file.size,
+                            "file_size": file_size,
                             "paragraphs": len(doc.paragraphs)
                         }
                         
@@ -375,18 +646,17 @@ async def upload_paper(
             elif file_extension == "txt":
                 # 处理文本文件
                 try:
-                    with open(temp_file_path, 'r', encoding='utf-8') as f:
-                        text = f.read()
+                    text = await run_in_thread("io", Path(saved_path).read_text, encoding='utf-8')
                     if text.strip():
-                        extracted_text = text
+                        text_length = len(text)
                         # 创建元数据，只包含非空值
                         metadata = {
-                            "source": file.filename,
+                            "source": filename,
                             "type": "paper",
                             "file_type": "txt",
-                            "title": title or file.filename.replace(f".{file_extension}", ""),
+                            "title": title or filename.replace(f".{file_extension}", ""),
                             "upload_time": str(Path().cwd()),
-                            "file_size": file.size,
+                            "file_size": file_size,
                             "characters": len(text),
                             "lines": len(text.split('\n'))
                         }
@@ -413,18 +683,17 @@ async def upload_paper(
                 except UnicodeDecodeError:
                     # 尝试其他编码
                     try:
-                        with open(temp_file_path, 'r', encoding='gbk') as f:
-                            text = f.read()
+                        text = await run_in_thread("io", Path(saved_path).read_text, encoding='gbk')
                         if text.strip():
-                            extracted_text = text
+                            text_length = len(text)
                             # 创建元数据，只包含非空值
                             metadata = {
-                                "source": file.filename,
+                                "source": filename,
                                 "type": "paper",
                                 "file_type": "txt",
-                                "title": title or file.filename.replace(f".{file_extension}", ""),
+                                "title": title or filename.replace(f".{file_extension}", ""),
                                 "upload_time": str(Path().cwd()),
-                                "file_size": file.size,
+                                "file_size": file_size,
                                 "characters": len(text),
                                 "lines": len(text.split('\n')),
                                 "encoding": "gbk"
@@ -462,45 +731,28 @@ async def upload_paper(
                         # 过滤掉值为None的元数据字段
                         doc["metadata"] = {k: v for k, v in doc["metadata"].items() if v is not None}
                 
-                # 保存文件到repository目录
-                repository_dir = Path("../public/repository")
-                repository_dir.mkdir(exist_ok=True)
-                
-                # 生成唯一的文件名（避免重名）
-                base_name = Path(file.filename).stem
-                counter = 1
-                final_filename = file.filename
-                
-                while (repository_dir / final_filename).exists():
-                    name_parts = Path(file.filename).stem, Path(file.filename).suffix
-                    final_filename = f"{name_parts[0]}_{counter}{name_parts[1]}"
-                    counter += 1
-                
-                final_file_path = repository_dir / final_filename
-                
-                # 复制文件到repository目录
-                shutil.copy2(temp_file_path, final_file_path)
                 logger.info(f"文件已保存到repository目录: {final_file_path}")
                 
                 # 更新元数据中的source路径
                 for doc in documents:
                     doc["metadata"]["source"] = str(final_file_path)
                     doc["metadata"]["repository_filename"] = final_filename
+                    doc["metadata"]["content_hash"] = content_hash
                 
                 # 添加到知识库
-                knowledge_base.add_documents(documents)
+                await run_in_thread("ingest", knowledge_base.add_documents, documents)
                 
                 # 获取文档统计信息
-                doc_info = knowledge_base.get_collection_info()
+                doc_info = knowledge_base.get_collection_info(include_files=False)
                 
                 return {
                     "message": f"论文上传成功，已保存到repository目录",
-                    "filename": file.filename,
+                    "filename": filename,
                     "repository_filename": final_filename,
                     "file_type": file_extension,
                     "documents_added": len(documents),
-                    "file_size": file.size,
-                    "text_length": len(extracted_text),
+                    "file_size": file_size,
+                    "text_length": text_length,
                     "collection_info": {
                         "total_documents": doc_info.get("total_documents", 0),
                         "collection_name": doc_info.get("collection_name", ""),
@@ -520,12 +772,12 @@ async def upload_paper(
                     detail="文件内容为空，无法添加到知识库"
                 )
                 
-        finally:
-            # 清理临时文件
-            try:
-                os.unlink(temp_file_path)
-            except OSError:
-                logger.warning(f"无法删除临时文件: {temp_file_path}")
+        except BaseException:
+            # 未能入库时删除本次放置的文件，repository目录只保留已索引的论文
+            if placed:
+                final_file_path.unlink(missing_ok=True)
+                file_inventory.invalidate()
+            raise
             
     except HTTPException:
         # 重新抛出HTTP异常
@@ -537,163 +789,261 @@ async def upload_paper(
             detail=f"论文上传失败: {str(e)}"
         )
 
-@app.post("/api/add-documents-batch")
-async def add_documents_batch(background_tasks: BackgroundTasks):
-    """批量添加文档（后台任务）"""
-    global knowledge_base, current_task_id, current_task, task_cancelled
+def collect_batch_files(paths: Optional[List[str]] = None) -> List[str]:
+    """批量任务的文件列表：给定路径（文件或目录）下的PDF，默认为 repository 目录"""
+    targets = [Path(p) for p in paths] if paths else [REPOSITORY_DIR]
+    files = []
+    for target in targets:
+        if target.is_dir():
+            files.extend(str(f) for f in sorted(target.rglob("*.pdf")))
+        elif target.suffix.lower() == ".pdf" and target.exists():
+            files.append(str(target))
+    return list(dict.fromkeys(files))
+
+async def run_batch_job(job: Dict[str, Any], queue: JobQueue):
+    """
+    执行批量导入任务；每个文件提交到索引后记录断点，重启后从剩余文件继续。
+    目录监视提交的任务（watch）带有监视器扫描时算出的内容哈希与快照中的旧哈希，不再重新读取文件计算
+    """
+    job_id = job["id"]
+    progress = job["progress"]
+    progress["workers"] = PDF_EXTRACT_WORKERS
+    files = queue.remaining_files(job)
+    logger.info(f"开始批量处理，剩余 {len(files)}/{progress['total_files']} 个PDF文件")
     
-    if not knowledge_base:
-        raise HTTPException(status_code=400, detail="知识库未初始化")
+    # 获取已存在的文档源文件列表
+    existing_sources = knowledge_base.collection.get_existing_sources()
     
-    # 如果已有任务在运行，返回错误
-    if current_task and not current_task.done():
-        return {
-            "status": "error",
-            "message": "已有任务正在运行，请等待完成或先取消当前任务",
-            "current_task_id": current_task_id
-        }
+    known_hashes = job["params"].get("hashes") or {}
+    previous_hashes = job["params"].get("previous_hashes") or {}
     
-    # 重置取消标志
-    task_cancelled = False
+    # 按内容哈希判断：内容已入库（同路径未变化，或其他路径的相同文件）直接计数，
+    # 新文件与内容已变化的文件交给提取进程池
+    to_extract = []
+    content_hashes = {}
+    # 旧数据（未记录哈希）中需要整体替换的来源
+    replace_sources = set()
+    for file_path_str in files:
+        if queue.is_cancelled(job_id):
+            return
+        if not os.path.exists(file_path_str):
+            await queue.file_done(job, file_path_str, error=f"文件不存在: {file_path_str}", persist=False)
+            continue
+        content_hash = known_hashes.get(file_path_str)
+        if not content_hash:
+            content_hash = await run_in_thread("io", compute_file_hash, file_path_str)
+        known_source = knowledge_base.find_source_by_hash(content_hash)
+        if known_source:
+            duplicate = known_source != file_path_str
+            if duplicate:
+                logger.info(f"内容相同的文件已存在，跳过: {Path(file_path_str).name} (已有: {known_source})")
+                if file_path_str in existing_sources:
+                    # 该路径的内容改成了与其他文件相同，删除旧内容的文档块
+                    await run_in_thread("ingest", knowledge_base.drop_superseded_source,
+                                        file_path_str, known_source)
+            await queue.file_done(job, file_path_str, duplicate=duplicate, persist=False)
+        elif (file_path_str in existing_sources
+              and knowledge_base.collection.get_source_hash(file_path_str) is None):
+            if previous_hashes.get(file_path_str):
+                # 监视器快照中记录过该文件的旧内容，说明内容确实变化了，替换旧数据
+                logger.info(f"文件内容已变化，重新索引: {Path(file_path_str).name}")
+                replace_sources.add(file_path_str)
+                to_extract.append(file_path_str)
+                content_hashes[file_path_str] = content_hash
+            else:
+                # 旧数据没有记录哈希，无法判断是否变化，按路径视为已处理
+                logger.info(f"文件已存在，跳过: {Path(file_path_str).name}")
+                await queue.file_done(job, file_path_str, persist=False)
+        else:
+            to_extract.append(file_path_str)
+            content_hashes[file_path_str] = content_hash
+    await queue.save()
     
-    async def process_documents():
-        """异步处理文档的函数"""
-        global current_task_id, task_cancelled
+    # 进程池并行提取，提取结果按完成顺序逐个写入索引（写入方唯一）
+    added_files = 0
+    async for file_path_str, extracted, error in extract_pdfs(
+        to_extract, is_cancelled=lambda: queue.is_cancelled(job_id),
+        content_hashes=content_hashes, cache=knowledge_base.extraction_cache
+    ):
+        # 检查是否被取消（以文件为粒度）
+        if queue.is_cancelled(job_id):
+            logger.info("任务被用户取消")
+            break
         
+        pdf_name = Path(file_path_str).name
+        progress["current_file"] = pdf_name
         try:
-            # 只处理 repository 目录下的文档
-            repository_dir = Path("../public/repository")
-            
-            if not repository_dir.exists():
-                logger.warning("repository 目录不存在")
-                return
-            
-            # 统计文件总数
-            pdf_files = list(repository_dir.rglob("*.pdf"))
-            total_files = len(pdf_files)
-            
-            if total_files == 0:
-                logger.info("repository 目录中没有PDF文件")
-                return
-            
-            logger.info(f"开始批量处理 repository 目录，总计 {total_files} 个PDF文件")
-            
-            processed_files = 0
-            errors = []
-            added_files = 0
-            
-            # 获取已存在的文档源文件列表
-            existing_sources = knowledge_base.collection.get_existing_sources()
-            logger.info(f"知识库中已有 {len(existing_sources)} 个文档源")
-            
-            # 处理PDF文件
-            for pdf_file in pdf_files:
-                # 检查是否被取消
-                if task_cancelled:
-                    logger.info("任务被用户取消")
-                    break
-                
-                try:
-                    # 检查文件是否已经处理过
-                    file_path_str = str(pdf_file)
-                    if file_path_str in existing_sources:
-                        logger.info(f"文件已存在，跳过: {pdf_file.name}")
-                        processed_files += 1
-                        continue
-                    
-                    text = knowledge_base.extract_text_from_pdf(file_path_str)
-                    if text:
-                        documents = [{
-                            "content": text,
-                            "metadata": {
-                                "source": file_path_str,
-                                "type": "pdf",
-                                "filename": pdf_file.name,
-                                "processed_time": str(Path().cwd())
-                            }
-                        }]
-                        knowledge_base.add_documents(documents)
-                        processed_files += 1
-                        added_files += 1
-                        existing_sources.add(file_path_str)  # 添加到已处理列表
-                        logger.info(f"成功处理PDF文件: {pdf_file.name} ({processed_files}/{total_files})")
-                    else:
-                        logger.warning(f"PDF文件内容为空: {pdf_file.name}")
-                        processed_files += 1
-                        
-                except Exception as e:
-                    error_msg = f"处理PDF文件失败 {pdf_file}: {e}"
-                    errors.append(error_msg)
-                    logger.error(error_msg)
-                    processed_files += 1  # 即使失败也计数
-            
-            if task_cancelled:
-                logger.info(f"任务被取消，已处理 {processed_files}/{total_files} 个文件")
+            if error:
+                raise Exception(error)
+            if extracted and extracted["chunks"]:
+                documents = [{
+                    "chunks": extracted["chunks"],
+                    "metadata": {
+                        "source": file_path_str,
+                        "type": "pdf",
+                        "filename": pdf_name,
+                        "processed_time": str(Path().cwd()),
+                        "pages": extracted["pages"],
+                        "content_hash": content_hashes[file_path_str]
+                    }
+                }]
+                summary = await run_in_thread("ingest", knowledge_base.add_documents, documents,
+                                              replace=file_path_str in replace_sources)
+                added_files += 1
+                await queue.file_done(job, file_path_str, added_chunks=summary["added_chunks"])
+                logger.info(f"成功处理PDF文件: {pdf_name} ({progress['processed_files']}/{progress['total_files']})")
             else:
-                logger.info(f"批量文档处理完成: 总计 {total_files} 个文件，成功处理 {processed_files} 个，新增 {added_files} 个，错误 {len(errors)} 个")
-            
+                logger.warning(f"PDF文件内容为空: {pdf_name}")
+                await queue.file_done(job, file_path_str)
         except Exception as e:
-            logger.error(f"批量处理文档失败: {e}")
-        finally:
-            # 清理任务状态
-            current_task = None
-            current_task_id = None
+            error_msg = f"处理PDF文件失败 {file_path_str}: {e}"
+            logger.error(error_msg)
+            await queue.file_done(job, file_path_str, error=error_msg)  # 即使失败也计数
     
-    # 创建新任务
-    current_task_id = str(uuid.uuid4())
-    current_task = asyncio.create_task(process_documents())
+    # 批量添加结束后统一更新IDF权重
+    if added_files > 0:
+        await run_in_thread("ingest", knowledge_base.optimize_index)
     
-    # 立即返回，包含文件统计信息
-    repository_dir = Path("../public/repository")
-    if repository_dir.exists():
-        pdf_files = list(repository_dir.rglob("*.pdf"))
-        total_files = len(pdf_files)
+    if queue.is_cancelled(job_id):
+        logger.info(f"任务被取消，已处理 {progress['processed_files']}/{progress['total_files']} 个文件")
     else:
-        total_files = 0
+        logger.info(f"批量文档处理完成: 总计 {progress['total_files']} 个文件，新增 {progress['added_files']} 个，"
+                    f"错误 {len(progress['errors'])} 个")
+
+async def apply_repository_changes(changed: Dict[str, Dict[str, Optional[str]]], deleted: List[str]) -> bool:
+    """
+    把 repository 目录的变化应用到知识库：已删除文件的文档块标记删除，新增和修改的文件连同监视器算出的新旧哈希
+    提交为导入任务（内容变化的文件由 add_documents 按哈希删除旧文档块后重新索引）；上一批仍在导入时返回 False，下次扫描再处理
+    """
+    file_inventory.invalidate()
+    if not knowledge_base or not job_queue:
+        return False
+    if any(job["kind"] == "watch" for job in job_queue.active_jobs()):
+        return False
+    
+    for path in deleted:
+        # 只按完整路径删除，不按文件名匹配其他目录中的同名文件
+        if knowledge_base.collection.check_document_exists(path):
+            await run_in_thread("ingest", knowledge_base.delete_source, path)
+    if changed:
+        paths = list(changed)
+        await job_queue.submit("watch", {
+            "paths": paths,
+            "hashes": {path: change["hash"] for path, change in changed.items()},
+            "previous_hashes": {path: change["previous_hash"] for path, change in changed.items()
+                                if change["previous_hash"]},
+        }, paths)
+    return True
+
+@app.post("/api/add-documents-batch")
+async def add_documents_batch(request: Optional[BatchRequest] = None):
+    """提交批量导入任务（默认处理 repository 目录下的PDF），任务排队执行"""
+    if not knowledge_base or not job_queue:
+        raise HTTPException(status_code=400, detail="知识库未初始化")
+    
+    paths = request.paths if request else None
+    files = await run_in_thread("io", collect_batch_files, paths)
+    job = await job_queue.submit("batch", {"paths": paths}, files)
     
     return {
         "status": "processing",
-        "message": f"批量处理已启动",
-        "total_files": total_files,
+        "message": f"批量处理已启动" if job["status"] == JOB_RUNNING else "批量处理已加入队列",
+        "total_files": len(files),
         "processed_files": 0,
         "operation": "batch_processing",
-        "task_id": current_task_id
+        "task_id": job["id"],
+        "job_status": job["status"]
     }
 
+@app.get("/api/jobs")
+async def list_jobs():
+    """列出导入任务（含已结束的历史任务）"""
+    if not job_queue:
+        raise HTTPException(status_code=400, detail="知识库未初始化")
+    jobs = sorted(job_queue.jobs.values(), key=lambda j: j["created_at"], reverse=True)
+    return {
+        "jobs": [JobQueue.summary(job) for job in jobs],
+        "max_parallel": job_queue.max_parallel
+    }
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """获取单个任务的状态与进度"""
+    job = job_queue.jobs.get(job_id) if job_queue else None
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return JobQueue.summary(job)
+
+@app.post("/api/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """
+    取消任务：排队中的任务立即取消，运行中的任务在当前文件处理完后停止；
+    只设置取消标记并返回 202，最终状态通过 /api/jobs/{job_id} 或 /api/task-status 查询
+    """
+    job = job_queue.jobs.get(job_id) if job_queue else None
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if not await job_queue.cancel(job_id):
+        return {"status": "error", "message": "任务已结束", "task_id": job_id}
+    return JSONResponse(status_code=202, content={
+        "status": "success",
+        "message": job["message"],
+        "task_id": job_id,
+        "job": JobQueue.summary(job)
+    })
+
+@app.post("/api/optimize-index", response_model=StatusResponse)
+async def optimize_index(full_refit: bool = False):
+    """重算IDF权重；full_refit=true 时重建词表"""
+    global knowledge_base
+    if not knowledge_base:
+        raise HTTPException(status_code=400, detail="知识库未初始化")
+    
+    try:
+        result = await run_in_thread("ingest", knowledge_base.optimize_index, full_refit=full_refit)
+        return StatusResponse(
+            status="success",
+            message="索引维护完成",
+            details=result
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"索引维护失败: {str(e)}")
+
+@app.get("/api/watcher")
+async def get_watcher_status():
+    """repository 目录监视状态"""
+    if not repository_watcher:
+        return {"enabled": False}
+    return repository_watcher.stats()
+
+@app.post("/api/watcher/scan")
+async def trigger_repository_scan():
+    """立即扫描一次 repository 目录"""
+    if not repository_watcher:
+        raise HTTPException(status_code=400, detail="目录监视未启用")
+    changes = await repository_watcher.scan()
+    return {"status": "success", "changes": changes}
+
 @app.post("/api/cancel-task")
 async def cancel_current_task():
-    """取消当前正在运行的任务"""
-    global current_task, task_cancelled, current_task_id
-    
-    if not current_task or current_task.done():
+    """取消所有排队中和运行中的任务；运行中的任务在当前文件处理完后停止，返回 202，由客户端轮询 /api/task-status"""
+    active = job_queue.active_jobs() if job_queue else []
+    if not active:
         return {
             "status": "error",
             "message": "没有正在运行的任务"
         }
     
     try:
-        # 设置取消标志
-        task_cancelled = True
-        
-        # 取消任务
-        current_task.cancel()
-        
-        # 等待任务完成
-        try:
-            await current_task
-        except asyncio.CancelledError:
-            pass
+        for job in active:
+            await job_queue.cancel(job["id"])
         
-        # 清理状态
-        current_task = None
-        current_task_id = None
-        task_cancelled = False
-        
-        return {
+        return JSONResponse(status_code=202, content={
             "status": "success",
-            "message": "任务已成功取消",
-            "task_id": current_task_id
-        }
+            "message": active[0]["message"],
+            "task_id": active[0]["id"],
+            "job_status": active[0]["status"]
+        })
         
     except Exception as e:
         return {
@@ -703,43 +1053,43 @@ async def cancel_current_task():
 
 @app.get("/api/task-status")
 async def get_task_status():
-    """获取当前任务状态"""
-    global current_task, current_task_id, task_cancelled
-    
-    if not current_task:
+    """获取当前任务状态：有排队或运行中的任务时返回最早的一个，否则返回最近结束且尚未报告的任务"""
+    if not job_queue:
         return {
             "status": "idle",
             "message": "没有正在运行的任务",
             "task_id": None
         }
     
-    if current_task.done():
-        if current_task.cancelled():
-            status = "cancelled"
-            message = "任务已被取消"
-        elif current_task.exception():
-            status = "error"
-            message = f"任务执行出错: {current_task.exception()}"
-        else:
-            status = "completed"
-            message = "任务已完成"
-        
-        # 清理已完成的任务
-        current_task = None
-        current_task_id = None
-        task_cancelled = False
-        
+    active = job_queue.active_jobs()
+    if active:
+        job = active[0]
         return {
-            "status": status,
-            "message": message,
-            "task_id": current_task_id
+            "status": "running",
+            "job_status": job["status"],
+            "message": job["message"],
+            "task_id": job["id"],
+            "cancellable": not job["cancel_requested"],
+            "queued_jobs": len(active) - 1,
+            "progress": dict(job["progress"])
+        }
+    
+    job = job_queue.latest_job()
+    if not job or job.get("reported"):
+        return {
+            "status": "idle",
+            "message": "没有正在运行的任务",
+            "task_id": None
         }
     
+    # 已结束的任务只报告一次
+    job["reported"] = True
+    await job_queue.save()
     return {
-        "status": "running",
-        "message": "任务正在运行中",
-        "task_id": current_task_id,
-        "cancellable": True
+        "status": job["status"],
+        "message": job["message"],
+        "task_id": job["id"],
+        "progress": dict(job["progress"])
     }
 
 @app.delete("/api/clear")
@@ -754,7 +1104,7 @@ async def clear_knowledge_base():
         last_operation = "clearing"
         last_operation_time = str(Path().cwd())
         
-        knowledge_base.clear_collection()
+        await run_in_thread("ingest", knowledge_base.clear_collection)
         
         processing_status = "ready"
         last_operation = "clearing_completed"
@@ -774,6 +1124,27 @@ async def clear_knowledge_base():
         last_operation_time = str(Path().cwd())
         raise HTTPException(status_code=500, detail=f"清空失败: {str(e)}")
 
+@app.delete("/api/documents/{source:path}")
+async def delete_document(source: str):
+    """删除单个源文件的全部文档块（可传完整源路径或文件名），检索立即生效，空间由后台压缩回收"""
+    global knowledge_base
+    if not knowledge_base:
+        raise HTTPException(status_code=400, detail="知识库未初始化")
+    
+    try:
+        result = await run_in_thread("ingest", knowledge_base.delete_source, source)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"删除失败: {str(e)}")
+    
+    if not result["deleted_chunks"]:
+        raise HTTPException(status_code=404, detail=f"文档不存在: {source}")
+    
+    return StatusResponse(
+        status="success",
+        message=f"已删除 {result['deleted_chunks']} 个文档块",
+        details=result
+    )
+
 @app.get("/api/health")
 async def health_check():
     """健康检查"""
@@ -782,7 +1153,14 @@ async def health_check():
         "status": "healthy", 
         "knowledge_base_initialized": knowledge_base is not None,
         "processing_status": "ready" if knowledge_base else "not_initialized",
-        "timestamp": str(Path().cwd())
+        "timestamp": str(Path().cwd()),
+        # 事件循环延迟：持续偏高说明有同步代码阻塞了事件循环
+        "event_loop_lag": loop_lag_monitor.stats(),
+        "operation_limits": OPERATION_LIMITS,
+        # 多进程服务：本进程角色与当前服务的索引代数
+        "serving_role": serving_role,
+        "pid": os.getpid(),
+        "index_generation": knowledge_base.collection.storage.generation if knowledge_base else None
     }
 
 @app.get("/api/progress")
@@ -791,14 +1169,12 @@ async def get_processing_progress():
     try:
         # 检查是否有正在进行的批量处理
         # 这里可以通过检查日志或临时文件来判断进度
-        public_dir = Path("../public")
-        pdf_files = list(public_dir.rglob("*.pdf"))
-        csv_files = list(public_dir.rglob("*.csv"))
-        total_files = len(pdf_files) + len(csv_files)
+        counts = await file_inventory.counts()
+        total_files = counts[".pdf"] + counts[".csv"]
         
         # 获取当前知识库中的文档数
         if knowledge_base:
-            current_docs = knowledge_base.get_collection_info().get("total_documents", 0)
+            current_docs = knowledge_base.get_collection_info(include_files=False).get("total_documents", 0)
         else:
             current_docs = 0
         
@@ -806,7 +1182,8 @@ async def get_processing_progress():
             "status": "processing" if total_files > 0 else "idle",
             "total_files": total_files,
             "current_documents": current_docs,
-            "message": f"总计 {total_files} 个文件，当前知识库有 {current_docs} 个文档"
+            "message": f"总计 {total_files} 个文件，当前知识库有 {current_docs} 个文档",
+            "inventory": file_inventory.stats()
         }
     except Exception as e:
         return {
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+CSV导入吞吐基准（行/秒）
+
+分别测量：逐行 iterrows 生成行文档（改造前的写法）、分块向量化生成行文档、
+以及分块导入到一个临时知识库（生成文档 + 写入分段与索引）的吞吐。
+给定 --target 时，完整导入的吞吐低于目标则以非零状态退出。
+
+用法（在 backend 目录下）:
+    python benchmarks/csv_ingest_throughput.py --target 2000
+"""
+
+import sys
+import time
+import argparse
+import logging
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from csv_ingestion import iter_csv_documents, CSV_CHUNK_ROWS  # noqa: E402
+from knowledge_base import LinguisticKnowledgeBase  # noqa: E402
+
+DEFAULT_CSV = "../public/cldf-datasets-wals-014143f/cldf/values.csv"
+
+
+def iterrows_documents(csv_path: str):
+    """改造前的写法：一次读入整个文件，逐行拼接内容与元数据"""
+    df = pd.read_csv(csv_path)
+    documents = []
+    for idx, row in df.iterrows():
+        content = f"数据记录 {idx + 1}:\n"
+        for col, value in row.items():
+            if pd.notna(value):
+                content += f"{col}: {value}\n"
+        metadata = {"source": csv_path, "type": "csv_data", "row_index": idx, "columns": str(list(df.columns))}
+        for col, value in row.items():
+            if pd.notna(value):
+                metadata[col] = value if isinstance(value, (int, float, str, bool)) else str(value)
+        documents.append({"content": content, "metadata": metadata})
+    return documents
+
+
+def report(name, rows, seconds):
+    rate = rows / seconds if seconds > 0 else float("inf")
+    print(f"{name:<20} rows={rows:<8} {seconds:8.2f}s  {rate:10.0f} rows/s")
+    return rate
+
+
+def main(args):
+    csv_path = str(Path(args.csv).resolve())
+
+    if not args.skip_iterrows:
+        started = time.perf_counter()
+        old = iterrows_documents(csv_path)
+        report("iterrows render", len(old), time.perf_counter() - started)
+
+    started = time.perf_counter()
+    rows = 0
+    new = []
+    for documents in iter_csv_documents(csv_path, args.chunk_rows):
+        rows += len(documents)
+        if not args.skip_iterrows:
+            new.extend(documents)
+    report("vectorized render", rows, time.perf_counter() - started)
+
+    if not args.skip_iterrows:
+        mismatched = sum(a["content"] != b["content"] for a, b in zip(old, new))
+        print(f"content mismatches vs iterrows: {mismatched} / {len(old)}")
+        del old, new
+
+    with tempfile.TemporaryDirectory() as tmp:
+        kb = LinguisticKnowledgeBase(str(Path(tmp) / "knowledge_db"))
+        started = time.perf_counter()
+        summary = kb.ingest_csv(csv_path, chunk_rows=args.chunk_rows)
+        rate = report("full ingest", summary["rows"], time.perf_counter() - started)
+
+    if args.target and rate < args.target:
+        print(f"FAIL: {rate:.0f} rows/s below target {args.target} rows/s")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default=DEFAULT_CSV, help="导入的CSV文件")
+    parser.add_argument("--chunk-rows", type=int, default=CSV_CHUNK_ROWS, help="每块的行数")
+    parser.add_argument("--target", type=float, default=0, help="完整导入的目标吞吐（行/秒），低于目标时退出码为1")
+    parser.add_argument("--skip-iterrows", action="store_true", help="跳过改造前写法的对比")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    sys.exit(main(args))
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+检索延迟基准：导入大PDF的同时持续检索，检索延迟应保持平稳
+
+在同一个事件循环中直接调用路由函数：先测空闲时的检索延迟，再在 /api/add-document
+导入一个PDF期间持续检索，对比两段的延迟分布与事件循环延迟。
+--inline 模拟改造前的行为（在事件循环线程上同步解析与写入），用于对比。
+
+用法（在 backend 目录下）:
+    python benchmarks/search_during_ingest.py --pdf "../public/repository/xxx.pdf"
+"""
+
+import os
+import sys
+import time
+import shutil
+import asyncio
+import argparse
+import logging
+import tempfile
+from pathlib import Path
+
+# 关闭检索缓存，保证每次检索都真实执行
+os.environ.setdefault("SEARCH_CACHE_SIZE", "0")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import api  # noqa: E402
+from knowledge_base import LinguisticKnowledgeBase  # noqa: E402
+from executors import loop_lag_monitor  # noqa: E402
+
+QUERIES = [
+    "grammatical gender agreement",
+    "kinship terminology complexity",
+    "language endangerment documentation",
+    "phoneme inventory population size",
+    "creole simplicity",
+    "social complexity lexicon",
+]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def summarize(name, latencies):
+    ms = [v * 1000 for v in latencies]
+    print(f"{name:<12} n={len(ms):<5} p50={percentile(ms, 0.5):8.2f}ms  "
+          f"p95={percentile(ms, 0.95):8.2f}ms  max={max(ms, default=0):8.2f}ms")
+
+
+async def timed_search(i):
+    request = api.SearchRequest(query=QUERIES[i % len(QUERIES)], n_results=10)
+    started = time.perf_counter()
+    await api.search_knowledge_base(request)
+    return time.perf_counter() - started
+
+
+async def search_loop(stop: asyncio.Event, interval: float):
+    latencies = []
+    i = 0
+    while not stop.is_set():
+        latencies.append(await timed_search(i))
+        i += 1
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def inline_ingest(pdf_path: str):
+    """改造前的写法：在事件循环线程上同步解析PDF并写入索引"""
+    # 先让出一次，使检索与延迟监控已在等待，阻塞会体现在它们的延迟上
+    await asyncio.sleep(0)
+    text = api.knowledge_base.extract_text_from_pdf(pdf_path)
+    api.knowledge_base.add_documents([{
+        "content": text,
+        "metadata": {"source": pdf_path, "type": "pdf", "filename": Path(pdf_path).name},
+    }])
+
+
+async def main(args):
+    loop_lag_monitor.start()
+
+    baseline = [await timed_search(i) for i in range(args.baseline)]
+    summarize("idle", baseline)
+    idle_lag = loop_lag_monitor.stats()
+
+    pdf_path = str(Path(args.pdf).resolve())
+    stop = asyncio.Event()
+    searches = asyncio.create_task(search_loop(stop, args.interval))
+    started = time.perf_counter()
+    if args.inline:
+        await inline_ingest(pdf_path)
+    else:
+        await api.add_document(api.DocumentRequest(file_path=pdf_path, file_type="pdf"))
+    ingest_seconds = time.perf_counter() - started
+    # 留出一个监控周期，记录导入结束时的延迟样本
+    await asyncio.sleep(loop_lag_monitor.interval * 2)
+    stop.set()
+    during = await searches
+
+    summarize("during", during)
+    print(f"ingest took {ingest_seconds:.2f}s ({'inline' if args.inline else 'executor'})")
+    print(f"event loop lag idle:   {idle_lag}")
+    print(f"event loop lag ingest: {loop_lag_monitor.stats()}")
+    await loop_lag_monitor.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", required=True, help="导入期间使用的PDF文件")
+    parser.add_argument("--db", default="./knowledge_db", help="知识库目录，会先复制到临时目录，不修改原数据")
+    parser.add_argument("--baseline", type=int, default=50, help="空闲时的检索次数")
+    parser.add_argument("--interval", type=float, default=0.01, help="导入期间两次检索之间的间隔（秒）")
+    parser.add_argument("--inline", action="store_true", help="在事件循环线程上同步导入（改造前的行为）")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_copy = Path(tmp) / "knowledge_db"
+        shutil.copytree(args.db, db_copy)
+        api.knowledge_base = LinguisticKnowledgeBase(str(db_copy))
+        asyncio.run(main(args))
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+检索响应体积与序列化耗时基准
+
+对一组查询分别按原始形式（完整文档块 + 全部元数据）和整形后的形式
+（高亮片段 + 指定元数据字段）生成 /api/search 的响应，比较 JSON 字节数与序列化耗时。
+检索本身只执行一次，两种形式使用相同的结果。
+知识库以只读方式打开，需要已有分段索引（服务启动过一次即可）。
+
+用法（在 backend 目录下）:
+    python benchmarks/search_payload.py --snippet-chars 200 --fields title source
+"""
+
+import sys
+import time
+import argparse
+import logging
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from api import SearchResponse  # noqa: E402
+from knowledge_base import LinguisticKnowledgeBase  # noqa: E402
+from search_response import shape_results  # noqa: E402
+
+DEFAULT_QUERIES = [
+    "language contact and creoles",
+    "word order typology",
+    "tone and climate",
+    "phoneme inventory size",
+    "adjectives semantic space",
+    "ejectives altitude",
+]
+
+
+def serialize(results, repeat: int):
+    """按接口的方式构造响应模型并序列化，返回 (字节数, 单次耗时秒)"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        body = SearchResponse(results=results, total_found=len(results)).model_dump_json().encode("utf-8")
+    return len(body), (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="./knowledge_db")
+    parser.add_argument("--n-results", type=int, default=10)
+    parser.add_argument("--snippet-chars", type=int, default=200)
+    parser.add_argument("--fields", nargs="*", default=["title", "source"])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--queries", nargs="*", default=DEFAULT_QUERIES)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    kb = LinguisticKnowledgeBase(args.db, read_only=True)
+
+    full_bytes = shaped_bytes = 0
+    full_seconds = shaped_seconds = 0.0
+    for query in args.queries:
+        results = kb.search(query, args.n_results)
+        size, seconds = serialize(results, args.repeat)
+        start = time.perf_counter()
+        shaped = shape_results(results, query, args.snippet_chars, args.fields)
+        shape_seconds = time.perf_counter() - start
+        shaped_size, shaped_serialize = serialize(shaped, args.repeat)
+        full_bytes += size
+        shaped_bytes += shaped_size
+        full_seconds += seconds
+        shaped_seconds += shaped_serialize + shape_seconds
+        print(f"{query[:30]:<32} full={size:>8}B {seconds * 1000:7.3f}ms  "
+              f"shaped={shaped_size:>7}B {(shaped_serialize + shape_seconds) * 1000:7.3f}ms")
+
+    print(f"{'total':<32} full={full_bytes:>8}B {full_seconds * 1000:7.3f}ms  "
+          f"shaped={shaped_bytes:>7}B {shaped_seconds * 1000:7.3f}ms")
+    print(f"整形后响应体积为原来的 {shaped_bytes / max(full_bytes, 1):.0%}，"
+          f"整形加序列化耗时为原来的 {shaped_seconds / max(full_seconds, 1e-9):.0%}")
+
+
+if __name__ == "__main__":
+    main()
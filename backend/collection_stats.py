@@ -0,0 +1,108 @@
+"""
+集合统计
+文档块总数、每个源文件的文档块数、文件类型与首次添加时间随添加/删除增量维护，
+随 manifest 一起原子提交，信息与状态接口直接读取，不再遍历全部元数据
+"""
+
+from typing import Any, Dict, Iterable, Optional
+
+# 持久化格式版本，不一致时从元数据重新统计
+STATS_FORMAT_VERSION = 1
+
+
+def filename_of(source: str) -> str:
+    """提取文件名，去除路径"""
+    return source.split('/')[-1] if '/' in source else source
+
+
+class CollectionStats:
+    """
+    按源路径记录 {文档块数, 文件类型, 首次添加时间}，并按文件名汇总（同名文件以最早添加的来源为准）
+    """
+
+    def __init__(self):
+        self.total_chunks = 0
+        # 源路径 -> {"chunks", "file_type", "first_added"}，dict 保持添加顺序
+        self.sources: Dict[str, Dict[str, Any]] = {}
+        # 文件名 -> 汇总信息（get_source_files_info 的返回格式）
+        self.files: Dict[str, Dict[str, Any]] = {}
+        # 文件名 -> 同名的源路径（按添加顺序）
+        self._file_sources: Dict[str, Dict[str, None]] = {}
+
+    def add(self, metadatas: Iterable[Dict]):
+        """登记一批新增的文档块"""
+        touched = set()
+        for meta in metadatas:
+            self.total_chunks += 1
+            source = meta.get("source")
+            if not source:
+                continue
+            entry = self.sources.get(source)
+            if entry is None:
+                entry = self.sources[source] = {
+                    "chunks": 0,
+                    "file_type": meta.get("type", "unknown"),
+                    "first_added": meta.get("processed_time", "unknown"),
+                }
+                self._file_sources.setdefault(filename_of(source), {})[source] = None
+            entry["chunks"] += 1
+            touched.add(filename_of(source))
+        for filename in touched:
+            self._refresh_file(filename)
+
+    def remove(self, metadatas: Iterable[Dict]):
+        """登记一批被删除的文档块；文档块数归零的来源随之移除"""
+        touched = set()
+        for meta in metadatas:
+            self.total_chunks -= 1
+            source = meta.get("source")
+            entry = self.sources.get(source) if source else None
+            if entry is None:
+                continue
+            entry["chunks"] -= 1
+            if entry["chunks"] <= 0:
+                del self.sources[source]
+                del self._file_sources[filename_of(source)][source]
+            touched.add(filename_of(source))
+        for filename in touched:
+            self._refresh_file(filename)
+
+    def _refresh_file(self, filename: str):
+        """重算一个文件名的汇总（只涉及同名的来源）"""
+        sources = self._file_sources.get(filename)
+        if not sources:
+            self._file_sources.pop(filename, None)
+            self.files.pop(filename, None)
+            return
+        first = self.sources[next(iter(sources))]
+        self.files[filename] = {
+            "filename": filename,
+            "chunks_count": sum(self.sources[source]["chunks"] for source in sources),
+            "file_type": first["file_type"],
+            "first_added": first["first_added"],
+        }
+
+    def file_info(self) -> Dict[str, Dict[str, Any]]:
+        return {filename: dict(info) for filename, info in self.files.items()}
+
+    def to_dict(self) -> Dict[str, Any]:
+        """可JSON序列化的形式（写入 manifest）"""
+        return {
+            "format_version": STATS_FORMAT_VERSION,
+            "total_chunks": self.total_chunks,
+            "sources": self.sources,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> Optional["CollectionStats"]:
+        """从 manifest 恢复；格式不符时返回 None"""
+        if not data or data.get("format_version") != STATS_FORMAT_VERSION:
+            return None
+        stats = cls()
+        stats.total_chunks = int(data["total_chunks"])
+        stats.sources = {source: dict(entry) for source, entry in data["sources"].items()}
+        for source in stats.sources:
+            stats._file_sources.setdefault(filename_of(source), {})[source] = None
+        for filename in stats._file_sources:
+            stats._refresh_file(filename)
+        return stats
@@ -0,0 +1,75 @@
+"""
+CSV数据导入
+按固定行数分块读取CSV，每块用列级向量化操作生成行文档（不再逐行 iterrows），
+内存占用与块大小成正比；知识库按块分批写入索引
+"""
+
+import os
+import logging
+from functools import reduce
+from typing import Any, Dict, Iterator, List
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 每次读取并写入索引的行数
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", "5000"))
+
+
+def render_csv_rows(df: pd.DataFrame, csv_path: str, row_offset: int = 0) -> List[Dict[str, Any]]:
+    """
+    把一块CSV数据转换为行文档，内容与元数据格式与逐行处理时相同：
+    内容为 "数据记录 N:\\n" 加上每个非空单元格的 "列名: 值\\n"，
+    元数据包含来源、行号、列名列表以及每个非空单元格的值
+    """
+    if df.empty:
+        return []
+    n_rows = len(df)
+    row_indices = range(row_offset, row_offset + n_rows)
+
+    # 按列生成 "列名: 值\n" 片段，空值为空串，再逐列拼接
+    headers = pd.Series([f"数据记录 {i + 1}:\n" for i in row_indices], index=df.index, dtype=object)
+    pieces = []
+    for col in df.columns:
+        values = df[col]
+        piece = (f"{col}: " + values.astype(str) + "\n").astype(object)
+        pieces.append(piece.where(values.notna(), ""))
+    contents = reduce(lambda left, right: left + right, pieces, headers).tolist()
+
+    columns = str(list(df.columns))
+    # 按列取出Python原生类型的值与非空标记；空值单元格不写入元数据
+    names = list(df.columns)
+    values_by_col = [df[col].tolist() for col in names]
+    present_by_col = [df[col].notna().tolist() for col in names]
+    documents = []
+    for i, (row_index, content) in enumerate(zip(row_indices, contents)):
+        metadata = {
+            "source": csv_path,
+            "type": "csv_data",
+            "row_index": row_index,
+            "columns": columns
+        }
+        for col, values, present in zip(names, values_by_col, present_by_col):
+            if not present[i]:
+                continue
+            value = values[i]
+            if isinstance(value, (list, tuple)):
+                metadata[f"{col}_list"] = str(value)
+            elif isinstance(value, dict):
+                metadata[f"{col}_dict"] = str(value)
+            elif isinstance(value, (int, float, str, bool)):
+                metadata[col] = value
+            else:
+                metadata[col] = str(value)
+        documents.append({"content": content, "metadata": metadata})
+    return documents
+
+
+def iter_csv_documents(csv_path: str, chunk_rows: int = CSV_CHUNK_ROWS) -> Iterator[List[Dict[str, Any]]]:
+    """按块读取CSV，逐块产出行文档列表；行号跨块连续"""
+    row_offset = 0
+    for df in pd.read_csv(csv_path, chunksize=max(1, chunk_rows)):
+        documents = render_csv_rows(df, csv_path, row_offset)
+        row_offset += len(df)
+        yield documents
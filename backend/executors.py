@@ -0,0 +1,140 @@
+"""
+执行层
+把CPU密集（PDF解析、向量化、打分）和IO密集（分段写入）的操作派发到有界线程池/进程池，
+每类操作有独立的并发上限，事件循环只负责调度；同时提供事件循环延迟监控
+"""
+
+import os
+import time
+import asyncio
+import logging
+import functools
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 进程池大小（PDF提取），默认与CPU核数相同
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+# 进程池的启动方式：服务进程有多个线程（线程池、文件监视），fork 可能复制其他线程持有的锁导致工作进程死锁，
+# 并让工作进程继承整个已加载的索引；默认 spawn，可设为 forkserver（预加载提取模块，启动更快）
+PROCESS_START_METHOD = os.getenv("PROCESS_START_METHOD", "spawn")
+# 线程池大小（检索、写入、其他阻塞调用）
+THREAD_POOL_WORKERS = int(os.getenv("THREAD_POOL_WORKERS", str(min(32, (os.cpu_count() or 1) + 4))))
+
+# 每类操作的并发上限；写入（ingest）只允许一个，保证索引只有一个写入方
+OPERATION_LIMITS = {
+    "search": int(os.getenv("SEARCH_CONCURRENCY", "8")),
+    "ingest": 1,
+    "extract": int(os.getenv("EXTRACT_CONCURRENCY", str(PDF_EXTRACT_WORKERS))),
+    "io": int(os.getenv("IO_CONCURRENCY", "4")),
+}
+
+_thread_pool: Optional[ThreadPoolExecutor] = None
+_process_pool: Optional[ProcessPoolExecutor] = None
+# 信号量绑定到创建它的事件循环，按循环分别创建
+_semaphores: Dict[int, Dict[str, asyncio.Semaphore]] = {}
+
+
+def get_thread_pool() -> ThreadPoolExecutor:
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(max_workers=THREAD_POOL_WORKERS, thread_name_prefix="kb-worker")
+    return _thread_pool
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        context = multiprocessing.get_context(PROCESS_START_METHOD)
+        if PROCESS_START_METHOD == "forkserver":
+            context.set_forkserver_preload(["pdf_extraction"])
+        _process_pool = ProcessPoolExecutor(max_workers=max(1, PDF_EXTRACT_WORKERS), mp_context=context)
+    return _process_pool
+
+
+def _semaphore(operation: str) -> asyncio.Semaphore:
+    loop_semaphores = _semaphores.setdefault(id(asyncio.get_running_loop()), {})
+    semaphore = loop_semaphores.get(operation)
+    if semaphore is None:
+        if operation not in OPERATION_LIMITS:
+            raise ValueError(f"未知的操作类型: {operation}")
+        semaphore = loop_semaphores[operation] = asyncio.Semaphore(max(1, OPERATION_LIMITS[operation]))
+    return semaphore
+
+
+async def run_in_thread(operation: str, func: Callable, *args, **kwargs) -> Any:
+    """在线程池中执行阻塞调用，同类操作的并发数受 OPERATION_LIMITS 限制"""
+    loop = asyncio.get_running_loop()
+    async with _semaphore(operation):
+        return await loop.run_in_executor(get_thread_pool(), functools.partial(func, *args, **kwargs))
+
+
+async def run_in_process(operation: str, func: Callable, *args) -> Any:
+    """在进程池中执行CPU密集的调用（函数与参数必须可pickle）"""
+    loop = asyncio.get_running_loop()
+    async with _semaphore(operation):
+        return await loop.run_in_executor(get_process_pool(), func, *args)
+
+
+def shutdown():
+    """关闭线程池与进程池"""
+    global _thread_pool, _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+    if _thread_pool is not None:
+        _thread_pool.shutdown(wait=False)
+        _thread_pool = None
+
+
+class EventLoopLagMonitor:
+    """
+    事件循环延迟监控：周期性 sleep(interval)，实际唤醒时间超出 interval 的部分即为延迟，
+    反映事件循环被同步代码阻塞的程度
+    """
+
+    def __init__(self, interval: float = 0.1, window: int = 600):
+        self.interval = interval
+        self._samples = deque(maxlen=window)
+        self._max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - started - self.interval)
+            self._samples.append(lag)
+            self._max_lag = max(self._max_lag, lag)
+
+    def stats(self) -> Dict[str, Any]:
+        """最近窗口内的延迟统计（毫秒）"""
+        samples = sorted(self._samples)
+        if not samples:
+            return {"samples": 0, "current_ms": 0.0, "avg_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+        return {
+            "samples": len(samples),
+            "current_ms": round(self._samples[-1] * 1000, 2),
+            "avg_ms": round(sum(samples) / len(samples) * 1000, 2),
+            "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000, 2),
+            "max_ms": round(self._max_lag * 1000, 2),
+        }
+
+
+loop_lag_monitor = EventLoopLagMonitor()
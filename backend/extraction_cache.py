@@ -0,0 +1,147 @@
+"""
+提取结果磁盘缓存
+按 (文件内容哈希, 提取器版本) 缓存PDF提取并切块的结果（gzip压缩的JSON），
+清空知识库后重建、分词或索引格式变化时只需重新向量化，不必重新解析PDF；
+缓存总大小有上限，超出时按最近使用时间淘汰
+"""
+
+import os
+import time
+import json
+import gzip
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from segment_store import atomic_write_bytes
+
+logger = logging.getLogger(__name__)
+
+# 缓存总大小上限（MB）
+EXTRACTION_CACHE_MAX_MB = int(os.getenv("EXTRACTION_CACHE_MAX_MB", "512"))
+
+
+class ExtractionCache:
+    """以文件为单位的LRU缓存；最近使用时间记录在文件的修改时间上，重启后仍然有效"""
+
+    def __init__(self, directory: Path, version: str, max_bytes: int = EXTRACTION_CACHE_MAX_MB * 1024 * 1024):
+        self.directory = Path(directory)
+        self.version = version
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # 文件名 -> [大小, 最近使用时间]
+        self._entries: Dict[str, list] = {}
+        for path in self.directory.glob("*.json.gz"):
+            stat = path.stat()
+            self._entries[path.name] = [stat.st_size, stat.st_mtime]
+        self.total_bytes = sum(size for size, _ in self._entries.values())
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _name(self, content_hash: str) -> str:
+        return f"{content_hash}-{self.version}.json.gz"
+
+    def get(self, content_hash: Optional[str]) -> Optional[Dict[str, Any]]:
+        """命中时返回缓存的提取结果并刷新最近使用时间，未命中返回 None"""
+        if not self.enabled or not content_hash:
+            return None
+        name = self._name(content_hash)
+        path = self.directory / name
+        with self._lock:
+            if name not in self._entries:
+                self.misses += 1
+                return None
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                result = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取提取缓存失败 {path}: {e}")
+            self._remove(name)
+            with self._lock:
+                self.misses += 1
+            return None
+
+        # 刷新修改时间作为最近使用时间
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+            entry = self._entries.get(name)
+            if entry is not None:
+                entry[1] = time.time()
+        return result
+
+    def put(self, content_hash: Optional[str], result: Dict[str, Any]):
+        """写入提取结果（原子写入），然后按需淘汰最久未使用的条目"""
+        if not self.enabled or not content_hash:
+            return
+        name = self._name(content_hash)
+        data = gzip.compress(json.dumps(result, ensure_ascii=False).encode("utf-8"), compresslevel=5)
+        if len(data) > self.max_bytes:
+            return
+        atomic_write_bytes(self.directory / name, data)
+        with self._lock:
+            previous = self._entries.get(name)
+            if previous is not None:
+                self.total_bytes -= previous[0]
+            self._entries[name] = [len(data), os.path.getmtime(self.directory / name)]
+            self.total_bytes += len(data)
+            victims = []
+            if self.total_bytes > self.max_bytes:
+                for victim, (size, _) in sorted(self._entries.items(), key=lambda item: item[1][1]):
+                    if self.total_bytes <= self.max_bytes:
+                        break
+                    if victim == name:
+                        continue
+                    victims.append(victim)
+                    self.total_bytes -= size
+                for victim in victims:
+                    del self._entries[victim]
+                self.evictions += len(victims)
+        for victim in victims:
+            self._unlink(victim)
+
+    def _remove(self, name: str):
+        with self._lock:
+            entry = self._entries.pop(name, None)
+            if entry is not None:
+                self.total_bytes -= entry[0]
+        self._unlink(name)
+
+    def _unlink(self, name: str):
+        try:
+            (self.directory / name).unlink()
+        except OSError:
+            pass
+
+    def clear(self):
+        with self._lock:
+            names = list(self._entries)
+            self._entries.clear()
+            self.total_bytes = 0
+        for name in names:
+            self._unlink(name)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "size_mb": round(self.total_bytes / 1024 / 1024, 2),
+                "max_size_mb": round(self.max_bytes / 1024 / 1024, 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "version": self.version,
+            }
@@ -0,0 +1,142 @@
+"""
+文件清单缓存
+按目录缓存各后缀的文件数量，状态接口直接读取缓存（常数时间）；
+刷新时逐个 stat 目录，只重新列出修改时间变化的目录（目录中增删、改名文件都会改变目录的修改时间），
+缓存超过刷新间隔或被标记失效（上传、目录监视发现变化）时在后台刷新
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from executors import run_in_thread
+
+logger = logging.getLogger(__name__)
+
+# 缓存的最长有效时间（秒），超过后下次读取时在后台按目录修改时间增量刷新
+INVENTORY_REFRESH_INTERVAL = float(os.getenv("INVENTORY_REFRESH_INTERVAL", "30"))
+
+
+class FileInventory:
+    """
+    root 目录下按后缀统计的文件清单；counts(directory) 返回 root 或其任一子目录（递归）的文件数
+    """
+
+    def __init__(self, root: str, suffixes: Iterable[str] = (".pdf", ".csv"),
+                 refresh_interval: float = INVENTORY_REFRESH_INTERVAL):
+        self.root = os.path.normpath(str(root))
+        self.suffixes = tuple(suffixes)
+        self.refresh_interval = refresh_interval
+        # 目录 -> (修改时间, 本目录各后缀文件数, 子目录列表)
+        self._dirs: Dict[str, Tuple[int, Dict[str, int], List[str]]] = {}
+        # 目录 -> 递归的各后缀文件数（刷新时汇总）
+        self._totals: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        self._dirty = True
+        self._refresh_task: Optional[asyncio.Task] = None
+        self.scanned_at: Optional[float] = None
+        self.last_refresh: Dict[str, int] = {"directories": 0, "listed": 0}
+
+    def _empty(self) -> Dict[str, int]:
+        return {suffix: 0 for suffix in self.suffixes}
+
+    def _list_directory(self, directory: str) -> Tuple[Dict[str, int], List[str]]:
+        counts, subdirs = self._empty(), []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                        continue
+                except OSError:
+                    continue
+                suffix = os.path.splitext(entry.name)[1]
+                if suffix in counts:
+                    counts[suffix] += 1
+        return counts, subdirs
+
+    def refresh_sync(self) -> Dict[str, int]:
+        """增量刷新：修改时间未变的目录沿用缓存的列表，只对变化的目录调用 scandir"""
+        with self._lock:
+            self._dirty = False
+            dirs, listed, order = {}, 0, []
+            stack = [self.root]
+            while stack:
+                directory = stack.pop()
+                try:
+                    mtime_ns = os.stat(directory).st_mtime_ns
+                except OSError:
+                    continue
+                cached = self._dirs.get(directory)
+                if cached and cached[0] == mtime_ns:
+                    dirs[directory] = cached
+                else:
+                    try:
+                        counts, subdirs = self._list_directory(directory)
+                    except OSError:
+                        continue
+                    dirs[directory] = (mtime_ns, counts, subdirs)
+                    listed += 1
+                order.append(directory)
+                stack.extend(dirs[directory][2])
+
+            # 子目录总在父目录之后入栈，倒序汇总即可得到递归计数
+            totals = {}
+            for directory in reversed(order):
+                total = dict(dirs[directory][1])
+                for subdir in dirs[directory][2]:
+                    for suffix, count in totals.get(subdir, {}).items():
+                        total[suffix] += count
+                totals[directory] = total
+
+            self._dirs, self._totals = dirs, totals
+            self.scanned_at = time.time()
+            self.last_refresh = {"directories": len(dirs), "listed": listed}
+            if listed:
+                logger.debug(f"文件清单刷新 {self.root}: {len(dirs)} 个目录，重新列出 {listed} 个")
+            return self._totals.get(self.root, self._empty())
+
+    async def refresh(self) -> Dict[str, int]:
+        return await run_in_thread("io", self.refresh_sync)
+
+    def invalidate(self):
+        """标记缓存失效，下次读取时在后台刷新"""
+        self._dirty = True
+
+    def is_stale(self) -> bool:
+        return (self._dirty or self.scanned_at is None
+                or time.time() - self.scanned_at > self.refresh_interval)
+
+    def _schedule_refresh(self):
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.get_running_loop().create_task(self._refresh_in_background())
+
+    async def _refresh_in_background(self):
+        try:
+            await self.refresh()
+        except Exception as e:
+            logger.error(f"刷新文件清单失败 {self.root}: {e}")
+
+    async def counts(self, directory: Optional[str] = None) -> Dict[str, int]:
+        """
+        返回目录（默认 root）下递归的各后缀文件数；从未扫描过时等待首次扫描，
+        之后直接返回缓存，缓存过期时另起后台刷新
+        """
+        if self.scanned_at is None:
+            await self.refresh()
+        elif self.is_stale():
+            self._schedule_refresh()
+        key = os.path.normpath(str(directory)) if directory is not None else self.root
+        return dict(self._totals.get(key, self._empty()))
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "root": self.root,
+            "scanned_at": self.scanned_at,
+            "stale": self.is_stale(),
+            "refresh_interval": self.refresh_interval,
+            "last_refresh": self.last_refresh,
+        }
@@ -0,0 +1,377 @@
+"""
+倒排索引关键词检索与 BM25 打分
+每个分段保存一份倒排表（词 -> 文档下标 + 词频）及文档长度，均为可内存映射的 .npy 文件，
+查询在各分段的有序词表上二分查找，只读取包含查询词的倒排表，代价与读取的倒排表长度成正比
+"""
+
+import os
+import re
+import math
+import json
+import logging
+from bisect import bisect_left
+from collections import Counter
+from collections.abc import Sequence
+from pathlib import Path
+from typing import List, Dict, Tuple, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# 前缀（部分）匹配最多展开的词数，避免过短的查询词读取过多倒排表
+MAX_PREFIX_EXPANSION = 200
+
+# Okapi BM25 参数
+BM25_K1 = float(os.getenv("BM25_K1", "1.5"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+
+# 倒排表文件（旧格式为 postings_terms.json + postings.npz，整体读入内存）
+TERMS_NAME = "postings_terms.npy"
+TERM_OFFSETS_NAME = "postings_term_offsets.npy"
+POSTINGS_ARRAYS = ("offsets", "doc_ids", "tfs", "lengths")
+TERM_ENCODING = "utf-8"
+TERM_ERRORS = "surrogatepass"
+
+
+def tokenize(text: str) -> List[str]:
+    """小写化并切分为词"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class TermTable(Sequence):
+    """
+    有序词表：所有词的UTF-8字节依次拼接，按下标访问时才解码。
+    UTF-8 字节序与码点序一致，可直接在内存映射的文件上二分查找
+    """
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self._data = data
+        self._offsets = offsets
+
+    @classmethod
+    def from_terms(cls, terms: List[str]) -> "TermTable":
+        encoded = [term.encode(TERM_ENCODING, TERM_ERRORS) for term in terms]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(term) for term in encoded])
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        if index < 0 or index >= len(self):
+            raise IndexError("term index out of range")
+        return self._data[self._offsets[index]:self._offsets[index + 1]].tobytes().decode(TERM_ENCODING, TERM_ERRORS)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class PostingsBlock:
+    """一个分段的倒排表，CSR式布局：terms[i] 的倒排表为 doc_ids/tfs[offsets[i]:offsets[i+1]]，terms 有序"""
+
+    def __init__(self, terms: Sequence, offsets, doc_ids, tfs, lengths):
+        self.terms = terms
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.lengths = lengths
+
+    @property
+    def n_docs(self) -> int:
+        return int(self.lengths.shape[0])
+
+    @property
+    def total_tokens(self) -> int:
+        return int(self.lengths.sum())
+
+    def find(self, term: str) -> int:
+        """词在有序词表中的下标，不存在时返回 -1"""
+        i = bisect_left(self.terms, term)
+        return i if i < len(self.terms) and self.terms[i] == term else -1
+
+    def postings(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """某个词在本分段中的 (分段内文档下标, 词频)，不存在时返回 None"""
+        i = self.find(term)
+        if i < 0:
+            return None
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.doc_ids[start:end], self.tfs[start:end]
+
+    def prefix_terms(self, prefix: str, limit: int) -> List[str]:
+        """以 prefix 开头的其他词，按词序最多 limit 个"""
+        terms = []
+        i = bisect_left(self.terms, prefix)
+        while i < len(self.terms) and len(terms) < limit:
+            term = self.terms[i]
+            if not term.startswith(prefix):
+                break
+            if term != prefix:
+                terms.append(term)
+            i += 1
+        return terms
+
+    @classmethod
+    def build(cls, documents: List[str]) -> "PostingsBlock":
+        """对一批文档分词并建立倒排表"""
+        postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        lengths = np.zeros(len(documents), dtype=np.int32)
+        for doc_id, doc in enumerate(documents):
+            tokens = tokenize(doc)
+            lengths[doc_id] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                entry = postings.get(term)
+                if entry is None:
+                    entry = postings[term] = ([], [])
+                entry[0].append(doc_id)
+                entry[1].append(tf)
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        for i, term in enumerate(terms):
+            offsets[i + 1] = offsets[i] + len(postings[term][0])
+        doc_ids = np.fromiter((d for term in terms for d in postings[term][0]), dtype=np.int32, count=int(offsets[-1]))
+        tfs = np.fromiter((t for term in terms for t in postings[term][1]), dtype=np.int32, count=int(offsets[-1]))
+        return cls(terms, offsets, doc_ids, tfs, lengths)
+
+    @classmethod
+    def concat(cls, blocks: List["PostingsBlock"]) -> "PostingsBlock":
+        """按顺序拼接多个分段的倒排表，文档下标依次平移"""
+        merged: Dict[str, Tuple[List[np.ndarray], List[np.ndarray]]] = {}
+        base = 0
+        for block in blocks:
+            for i, term in enumerate(block.terms):
+                start, end = block.offsets[i], block.offsets[i + 1]
+                entry = merged.setdefault(term, ([], []))
+                entry[0].append(block.doc_ids[start:end] + base)
+                entry[1].append(block.tfs[start:end])
+            base += block.n_docs
+
+        terms = sorted(merged)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        doc_parts, tf_parts = [], []
+        for i, term in enumerate(terms):
+            doc_part = np.concatenate(merged[term][0])
+            doc_parts.append(doc_part)
+            tf_parts.append(np.concatenate(merged[term][1]))
+            offsets[i + 1] = offsets[i] + doc_part.shape[0]
+        lengths = np.concatenate([block.lengths for block in blocks]) if blocks else np.zeros(0, dtype=np.int32)
+        return cls(
+            terms,
+            offsets,
+            np.concatenate(doc_parts).astype(np.int32) if doc_parts else np.zeros(0, dtype=np.int32),
+            np.concatenate(tf_parts).astype(np.int32) if tf_parts else np.zeros(0, dtype=np.int32),
+            lengths,
+        )
+
+    def save(self, directory: Path):
+        """每个数组一个 .npy 文件，读取时内存映射，多个进程共享同一份页缓存"""
+        terms = self.terms if isinstance(self.terms, TermTable) else TermTable.from_terms(self.terms)
+        np.save(directory / TERMS_NAME, terms._data)
+        np.save(directory / TERM_OFFSETS_NAME, terms._offsets)
+        for name in POSTINGS_ARRAYS:
+            np.save(directory / f"postings_{name}.npy", getattr(self, name))
+
+    @classmethod
+    def load(cls, directory: Path) -> "PostingsBlock":
+        """以只读内存映射打开倒排表；旧格式的分段整体读入内存"""
+        if not (directory / TERMS_NAME).exists():
+            with open(directory / "postings_terms.json", "r", encoding="utf-8") as f:
+                terms = json.load(f)
+            with np.load(directory / "postings.npz") as data:
+                return cls(terms, data["offsets"], data["doc_ids"], data["tfs"], data["lengths"])
+        terms = TermTable(np.load(directory / TERMS_NAME, mmap_mode="r"),
+                          np.load(directory / TERM_OFFSETS_NAME, mmap_mode="r"))
+        arrays = [np.load(directory / f"postings_{name}.npy", mmap_mode="r") for name in POSTINGS_ARRAYS]
+        return cls(terms, *arrays)
+
+
+class KeywordScorer:
+    """
+    关键词检索与 BM25 打分；子类提供 n_docs、total_tokens、postings、prefix_terms、lengths_of 与 _deleted_counts，
+    文档下标为全局行号
+    """
+
+    n_docs: int
+    total_tokens: int
+
+    @property
+    def avg_doc_length(self) -> float:
+        """语料平均文档长度（词数）"""
+        return self.total_tokens / self.n_docs if self.n_docs else 0.0
+
+    def document_frequency(self, term: str) -> int:
+        return int(self.postings(term)[0].shape[0])
+
+    def keyword_search(self, query: str, n_results: int,
+                       mask: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """
+        关键词检索：完全匹配计2分，前缀（部分）匹配计1分，
+        再叠加匹配密度；只读取查询词及其前缀扩展词的倒排表。
+        mask 为候选行掩码（如元数据过滤结果），不在掩码内的文档不参与打分
+        """
+        tokens = tokenize(query)
+        query_words = [word for word in tokens if len(word) > 2] or tokens
+        if not query_words or self.n_docs == 0:
+            return []
+
+        per_word = []
+        for word in query_words:
+            exact_ids = self.postings(word)[0]
+            partial_parts = [self.postings(term)[0] for term in self.prefix_terms(word)]
+            partial_ids = np.unique(np.concatenate(partial_parts)) if partial_parts else exact_ids[:0]
+            if exact_ids.size:
+                partial_ids = np.setdiff1d(partial_ids, exact_ids, assume_unique=True)
+            per_word.append((exact_ids, partial_ids))
+
+        candidates = np.unique(np.concatenate([ids for pair in per_word for ids in pair]))
+        if mask is not None:
+            candidates = candidates[mask[candidates]]
+        if candidates.size == 0:
+            return []
+
+        exact_matches = np.zeros(candidates.shape[0], dtype=np.float64)
+        partial_matches = np.zeros(candidates.shape[0], dtype=np.float64)
+        for exact_ids, partial_ids in per_word:
+            exact_matches += np.isin(candidates, exact_ids, assume_unique=True)
+            partial_matches += np.isin(candidates, partial_ids, assume_unique=True)
+
+        score = exact_matches * 2 + partial_matches
+        lengths = self.lengths_of(candidates).astype(np.float64)
+        density = np.divide(score, lengths, out=np.zeros_like(score), where=lengths > 0)
+        final_score = score * 0.7 + density * 0.3
+
+        # 优先考虑完全匹配数，其次是最终分数
+        order = np.lexsort((-final_score, -exact_matches))[:n_results]
+        return [(int(candidates[i]), float(final_score[i])) for i in order]
+
+    def bm25_search(self, query: str, n_results: int, mask: Optional[np.ndarray] = None,
+                    k1: float = BM25_K1, b: float = BM25_B,
+                    deleted: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """
+        Okapi BM25 打分，只对查询词倒排表中（且在 mask 内）的候选文档做一次向量化计算。
+        deleted 为墓碑掩码：文档总数、文档频率与平均文档长度都不计已删除的行，
+        压缩前后同一查询的分数一致
+        """
+        query_terms = Counter(tokenize(query))
+        n_docs, total_tokens = self.n_docs, self.total_tokens
+        if deleted is not None:
+            n_dead, dead_tokens = self._deleted_counts(deleted)
+            n_docs -= n_dead
+            total_tokens -= dead_tokens
+        if not query_terms or n_docs <= 0:
+            return []
+
+        avg_length = total_tokens / n_docs or 1.0
+        id_parts, score_parts = [], []
+        for term, query_tf in query_terms.items():
+            doc_ids, tfs = self.postings(term)
+            if doc_ids.size == 0:
+                continue
+            df = doc_ids.shape[0]
+            if deleted is not None:
+                df -= int(np.count_nonzero(deleted[doc_ids[doc_ids < deleted.shape[0]]]))
+                if df <= 0:
+                    continue
+            idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+            if mask is not None:
+                keep = mask[doc_ids]
+                doc_ids, tfs = doc_ids[keep], tfs[keep]
+                if doc_ids.size == 0:
+                    continue
+            tfs = tfs.astype(np.float64)
+            norm = k1 * (1.0 - b + b * self.lengths_of(doc_ids) / avg_length)
+            id_parts.append(doc_ids)
+            score_parts.append(query_tf * idf * tfs * (k1 + 1.0) / (tfs + norm))
+
+        if not id_parts:
+            return []
+
+        candidates, inverse = np.unique(np.concatenate(id_parts), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(score_parts))
+        k = min(n_results, candidates.shape[0])
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k] if k < candidates.shape[0] else np.arange(candidates.shape[0])
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(candidates[i]), float(scores[i])) for i in top]
+
+
+class InvertedIndex(KeywordScorer):
+    """
+    按行号顺序组合各分段倒排表的索引，文档下标为全局行号；查询时逐个分段二分查找并平移下标，
+    分段的倒排表可以是内存映射的，不再合并成一份进程内的词典。
+    追加分段只扩展本对象的分段列表，检索方通过 snapshot() 取得当时分段列表的副本，不会读到之后追加的行
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._blocks: List[PostingsBlock] = []
+        self._starts: List[int] = []
+        # 墓碑统计缓存 [(墓碑掩码, 墓碑行数, 墓碑行词数)]，与快照共享，见 _deleted_counts
+        self._deleted_cache: List[Optional[Tuple[np.ndarray, int, int]]] = [None]
+        self.n_docs = 0
+        self.total_tokens = 0
+
+    def add_block(self, start: int, block: PostingsBlock):
+        """登记从全局行号 start 开始的一个分段"""
+        self._blocks.append(block)
+        self._starts.append(start)
+        self.n_docs = start + block.n_docs
+        self.total_tokens += block.total_tokens
+
+    def lengths_of(self, doc_ids: np.ndarray) -> np.ndarray:
+        """一组文档的词数"""
+        starts = np.asarray(self._starts, dtype=np.int64)
+        owners = np.searchsorted(starts, doc_ids, side="right") - 1
+        lengths = np.empty(doc_ids.shape[0], dtype=np.int64)
+        for owner in np.unique(owners):
+            selected = owners == owner
+            lengths[selected] = self._blocks[owner].lengths[doc_ids[selected] - starts[owner]]
+        return lengths
+
+    def _deleted_counts(self, deleted: np.ndarray) -> Tuple[int, int]:
+        """墓碑行数及其词数之和；墓碑变化时掩码整体替换，同一个掩码只统计一次"""
+        cached = self._deleted_cache[0]
+        if cached is None or cached[0] is not deleted:
+            rows = np.flatnonzero(deleted[:self.n_docs])
+            cached = self._deleted_cache[0] = (deleted, int(rows.shape[0]), int(self.lengths_of(rows).sum()))
+        return cached[1], cached[2]
+
+    def postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """返回某个词的 (文档下标, 词频)；各分段按行号顺序登记，下标递增"""
+        id_parts, tf_parts = [], []
+        for start, block in zip(self._starts, self._blocks):
+            found = block.postings(term)
+            if found is not None:
+                id_parts.append(found[0].astype(np.int64) + start)
+                tf_parts.append(found[1])
+        if not id_parts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int32)
+        if len(id_parts) == 1:
+            return id_parts[0], np.asarray(tf_parts[0])
+        return np.concatenate(id_parts), np.concatenate(tf_parts)
+
+    def prefix_terms(self, prefix: str) -> List[str]:
+        """以 prefix 开头的其他词：各分段有序词表上二分查找，合并后按词序取前 MAX_PREFIX_EXPANSION 个"""
+        terms = set()
+        for block in self._blocks:
+            terms.update(block.prefix_terms(prefix, MAX_PREFIX_EXPANSION))
+        return sorted(terms)[:MAX_PREFIX_EXPANSION]
+
+    def snapshot(self) -> "InvertedIndex":
+        """当前分段列表的只读副本（调用方持有写锁，保证不在追加分段的中途），代价与分段数成正比"""
+        view = InvertedIndex.__new__(InvertedIndex)
+        view._blocks = list(self._blocks)
+        view._starts = list(self._starts)
+        view._deleted_cache = self._deleted_cache
+        view.n_docs = self.n_docs
+        view.total_tokens = self.total_tokens
+        return view
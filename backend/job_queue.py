@@ -0,0 +1,235 @@
+"""
+持久化的导入任务队列
+任务状态与进度写入 jobs.json（原子替换），重启后未完成的任务从最后一个已提交的文件继续；
+同时运行的任务数受 INGEST_JOB_PARALLELISM 限制，取消以文件为粒度生效
+"""
+
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from segment_store import atomic_write_bytes
+from executors import run_in_thread
+
+logger = logging.getLogger(__name__)
+
+# 同时运行的任务数
+INGEST_JOB_PARALLELISM = int(os.getenv("INGEST_JOB_PARALLELISM", "1"))
+# 保留的已结束任务数量
+JOB_HISTORY_LIMIT = int(os.getenv("JOB_HISTORY_LIMIT", "50"))
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_CANCELLED = "cancelled"
+JOB_ERROR = "error"
+ACTIVE_STATUSES = (JOB_QUEUED, JOB_RUNNING)
+
+
+def _now() -> float:
+    return round(time.time(), 3)
+
+
+def _total_size(files: List[str]) -> int:
+    """文件总字节数（不存在的文件不计），在线程池中执行"""
+    total = 0
+    for path in files:
+        try:
+            total += os.path.getsize(path)
+        except OSError:
+            pass
+    return total
+
+
+class JobQueue:
+    """
+    任务队列：每个任务是一个可JSON序列化的字典，runner(job, queue) 负责执行；
+    runner 每提交一个文件调用 file_done 记录断点，并通过 is_cancelled 检查取消请求
+    """
+
+    def __init__(self, path: Path, runner: Callable[[Dict[str, Any], "JobQueue"], Awaitable[None]],
+                 max_parallel: int = INGEST_JOB_PARALLELISM):
+        self.path = Path(path)
+        self.runner = runner
+        self.max_parallel = max(1, max_parallel)
+        self.jobs: Dict[str, Dict[str, Any]] = self._load()
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._save_lock: Optional[asyncio.Lock] = None
+        self._started = False
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                jobs = json.load(f).get("jobs", [])
+            return {job["id"]: job for job in jobs}
+        except Exception as e:
+            logger.error(f"读取任务队列失败 {self.path}: {e}")
+            return {}
+
+    async def save(self):
+        """原子写入 jobs.json；写入按调用顺序串行执行"""
+        if self._save_lock is None:
+            self._save_lock = asyncio.Lock()
+        async with self._save_lock:
+            data = json.dumps({"jobs": list(self.jobs.values())}, ensure_ascii=False).encode("utf-8")
+            await run_in_thread("io", atomic_write_bytes, self.path, data)
+
+    async def start(self):
+        """恢复上次未完成的任务（运行中的任务重新排队，从断点继续）并开始调度"""
+        self._started = True
+        resumed = 0
+        for job in self.jobs.values():
+            if job["status"] == JOB_RUNNING:
+                job["status"] = JOB_QUEUED
+                job["resumed"] = job.get("resumed", 0) + 1
+                resumed += 1
+        if resumed:
+            logger.info(f"恢复 {resumed} 个未完成的导入任务")
+            await self.save()
+        self._dispatch()
+
+    async def stop(self):
+        """停止调度并等待运行中的任务退出；任务保持运行状态，下次启动时恢复"""
+        self._started = False
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def submit(self, kind: str, params: Dict[str, Any], files: List[str]) -> Dict[str, Any]:
+        """提交任务；files 为待处理文件列表（提交时确定，恢复时据此计算剩余文件）"""
+        total_bytes = await run_in_thread("io", _total_size, files)
+        job = {
+            "id": str(uuid.uuid4()),
+            "kind": kind,
+            "params": params,
+            "status": JOB_QUEUED,
+            "message": "任务排队中",
+            "created_at": _now(),
+            "started_at": None,
+            "finished_at": None,
+            "cancel_requested": False,
+            "files": files,
+            "done_files": [],
+            "progress": {
+                "total_files": len(files),
+                "processed_files": 0,
+                "added_files": 0,
+                "skipped_duplicates": 0,
+                "total_bytes": total_bytes,
+                "processed_bytes": 0,
+                "added_chunks": 0,
+                "current_file": None,
+                "errors": [],
+            },
+        }
+        self.jobs[job["id"]] = job
+        self._trim_history()
+        await self.save()
+        self._dispatch()
+        return job
+
+    def _trim_history(self):
+        finished = [job for job in self.jobs.values() if job["status"] not in ACTIVE_STATUSES]
+        for job in sorted(finished, key=lambda j: j["created_at"])[:max(0, len(finished) - JOB_HISTORY_LIMIT)]:
+            del self.jobs[job["id"]]
+
+    def _dispatch(self):
+        """按提交顺序启动排队的任务，直到达到并行上限"""
+        if not self._started:
+            return
+        queued = sorted((job for job in self.jobs.values() if job["status"] == JOB_QUEUED),
+                        key=lambda j: j["created_at"])
+        for job in queued:
+            if len(self._tasks) >= self.max_parallel:
+                break
+            job["status"] = JOB_RUNNING
+            job["message"] = "任务正在运行中"
+            job["started_at"] = job["started_at"] or _now()
+            self._tasks[job["id"]] = asyncio.get_running_loop().create_task(self._run(job))
+
+    async def _run(self, job: Dict[str, Any]):
+        await self.save()
+        try:
+            await self.runner(job, self)
+            if job["cancel_requested"]:
+                job["status"], job["message"] = JOB_CANCELLED, "任务已被取消"
+            else:
+                job["status"], job["message"] = JOB_COMPLETED, "任务已完成"
+        except asyncio.CancelledError:
+            # 服务关闭：保持运行状态，重启后恢复
+            raise
+        except Exception as e:
+            logger.error(f"导入任务失败 {job['id']}: {e}")
+            job["status"], job["message"] = JOB_ERROR, f"任务执行出错: {e}"
+        finally:
+            self._tasks.pop(job["id"], None)
+        job["progress"]["current_file"] = None
+        job["finished_at"] = _now()
+        await self.save()
+        self._dispatch()
+
+    def remaining_files(self, job: Dict[str, Any]) -> List[str]:
+        """尚未提交的文件（恢复时跳过已完成的文件）"""
+        done = set(job["done_files"])
+        return [f for f in job["files"] if f not in done]
+
+    def is_cancelled(self, job_id: str) -> bool:
+        job = self.jobs.get(job_id)
+        return job is None or job["cancel_requested"]
+
+    async def file_done(self, job: Dict[str, Any], file_path: str, added_chunks: int = 0,
+                        error: Optional[str] = None, duplicate: bool = False, persist: bool = True):
+        """记录一个文件已处理（断点）并更新进度；persist=False 时由调用方稍后统一保存"""
+        progress = job["progress"]
+        job["done_files"].append(file_path)
+        progress["processed_files"] += 1
+        try:
+            progress["processed_bytes"] += os.path.getsize(file_path)
+        except OSError:
+            pass
+        if added_chunks:
+            progress["added_files"] += 1
+            progress["added_chunks"] += added_chunks
+        if duplicate:
+            progress["skipped_duplicates"] += 1
+        if error:
+            progress["errors"].append(error)
+        if persist:
+            await self.save()
+
+    async def cancel(self, job_id: str) -> bool:
+        """
+        请求取消任务：排队中的任务立即取消，运行中的任务只设置取消标记，在当前文件处理完后停止；
+        不等待任务结束，调用方通过任务状态查询最终结果
+        """
+        job = self.jobs.get(job_id)
+        if job is None or job["status"] not in ACTIVE_STATUSES:
+            return False
+        job["cancel_requested"] = True
+        if job["status"] == JOB_QUEUED:
+            job["status"], job["message"] = JOB_CANCELLED, "任务已被取消"
+            job["finished_at"] = _now()
+        else:
+            job["message"] = "正在取消，当前文件处理完后停止"
+        await self.save()
+        return True
+
+    def active_jobs(self) -> List[Dict[str, Any]]:
+        return sorted((job for job in self.jobs.values() if job["status"] in ACTIVE_STATUSES),
+                      key=lambda j: j["created_at"])
+
+    def latest_job(self) -> Optional[Dict[str, Any]]:
+        return max(self.jobs.values(), key=lambda j: j["created_at"], default=None)
+
+    @staticmethod
+    def summary(job: Dict[str, Any]) -> Dict[str, Any]:
+        """对外返回的任务信息（不含文件列表）"""
+        return {key: value for key, value in job.items() if key not in ("files", "done_files")}
@@ -1,72 +1,805 @@
 import os
-import json
-import pandas as pd
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings
-import PyPDF2
 import logging
 import pickle
 import hashlib
+import shutil
+import threading
 
 # 添加轻量级嵌入支持
 try:
-    from sklearn.feature_extraction.text import TfidfVectorizer
-    from sklearn.metrics.pairwise import cosine_similarity
+    from sklearn.feature_extraction.text import CountVectorizer
     import numpy as np
+    import scipy.sparse as sp
     SKLEARN_AVAILABLE = True
 except ImportError:
     SKLEARN_AVAILABLE = False
 
+from segment_store import (
+    SegmentStorage, Segment, LazyDocumentList, ChunkTexts, VOCABULARY_NAME_FORMAT, IDF_NAME_FORMAT
+)
+from inverted_index import InvertedIndex, PostingsBlock
+from metadata_columns import MetadataColumns, ColumnBlock
+from collection_stats import CollectionStats, filename_of
+from search_cache import SearchCache, make_cache_key
+from pdf_extraction import extract_pdf_text, extract_pdf_chunks, make_text_splitter, EXTRACTION_CACHE_VERSION, CHUNK_SIZE
+from extraction_cache import ExtractionCache
+from csv_ingestion import iter_csv_documents, CSV_CHUNK_ROWS
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 持久化索引格式版本，格式变化时递增以触发重建
+INDEX_FORMAT_VERSION = 2
+
+# 向量化参数，与原 TfidfVectorizer 配置一致（smooth_idf + l2 归一化）
+VECTORIZER_PARAMS = {
+    "max_features": 10000,
+    "stop_words": "english",
+    "ngram_range": (1, 2),
+}
+
+# 可选的检索打分方式
+SCORER_TFIDF = "tfidf"
+SCORER_BM25 = "bm25"
+SCORER_KEYWORD = "keyword"
+SEARCH_SCORERS = (SCORER_TFIDF, SCORER_BM25, SCORER_KEYWORD)
+DEFAULT_SCORER = os.getenv("DEFAULT_SCORER", SCORER_TFIDF)
+
+# 计算文件哈希时每次读取的字节数
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# 默认的知识库目录
+DEFAULT_DB_PATH = "./knowledge_db"
+
+# 只读副本打开分段时，旧代数文件被写进程清理后重新读取 manifest 的次数
+READ_ONLY_OPEN_ATTEMPTS = 3
+
+
+class ReadOnlyStoreError(RuntimeError):
+    """只读副本上调用了修改索引的操作"""
+
+def compute_file_hash(file_path: str) -> str:
+    """分块读取文件计算 SHA-256，内存占用与文件大小无关"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
 class LightweightDocumentStore:
-    """轻量级文档存储，完全独立的存储方案"""
+    """
+    轻量级文档存储，基于追加式分段的独立存储方案。
+    read_only=True 时为只读副本：只打开写进程已提交的分段（文本、词频矩阵、倒排表与元数据列内存映射），
+    不写入、不清理；previous 为同一目录上一代的只读副本，未变化的分段直接复用其已打开的数据，
+    新 manifest 只是追加分段、新增墓碑或原样合并分段时，元数据、源索引、文档频率与行范数在上一代的基础上增量更新。
+    元数据字典、源索引、墓碑掩码与行范数仍是每个进程各自的内存
+    """
     
-    def __init__(self, db_path: str = "./knowledge_db"):
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, read_only: bool = False,
+                 previous: Optional["LightweightDocumentStore"] = None):
         self.db_path = Path(db_path)
+        self.read_only = read_only
         self.db_path.mkdir(exist_ok=True)
+        # 旧版本的整体pickle文件与索引目录，仅用于迁移和清理
         self.documents_file = self.db_path / "documents.pkl"
         self.metadata_file = self.db_path / "metadata.pkl"
         self.vectors_file = self.db_path / "vectors.pkl"
+        self.legacy_index_dir = self.db_path / "index"
+        
+        self.storage = SegmentStorage(self.db_path)
+        self.keyword_index = InvertedIndex()
+        self.postings_blocks: List[PostingsBlock] = []
+        self.columns = MetadataColumns()
+        self._lock = threading.RLock()
+        # 索引代数：任何影响检索结果的变更都会递增，用于缓存失效；重新加载的副本接着上一代递增
+        self.index_generation = previous.index_generation + 1 if previous else 0
+        self._merge_thread: Optional[threading.Thread] = None
+        self._compact_thread: Optional[threading.Thread] = None
+        self._refit_thread: Optional[threading.Thread] = None
+        # 全量重建互斥执行（后台重建与 optimize_index 触发的重建）
+        self._refit_lock = threading.Lock()
+        self.small_segment_docs = int(os.getenv("SMALL_SEGMENT_DOCS", "500"))
+        self.max_small_segments = int(os.getenv("MAX_SMALL_SEGMENTS", "8"))
+        # 已删除（墓碑）文档块占比超过该值时启动后台压缩
+        self.compaction_threshold = float(os.getenv("COMPACTION_THRESHOLD", "0.1"))
+        
+        # 增量索引状态：每个分段一个原始词频矩阵 + 文档频率，IDF 与行范数由其派生
+        self.reweight_threshold = float(os.getenv("INDEX_REWEIGHT_THRESHOLD", "0.1"))
+        self.refit_threshold = float(os.getenv("INDEX_REFIT_THRESHOLD", "0.5"))
+        self._reset_index()
         
         # 加载现有数据
-        self.documents = self._load_data(self.documents_file, [])
-        self.metadata = self._load_data(self.metadata_file, [])
-        self.vectors = self._load_data(self.vectors_file, None)
+        if not read_only and not self.storage.exists and self.documents_file.exists():
+            self._migrate_legacy_files()
+        self._reusable = self._reusable_segments(previous) if previous else {}
+        self._load_segments(previous)
+        self._reusable = {}
+    
+    @classmethod
+    def open_read_only(cls, db_path: str, previous: Optional["LightweightDocumentStore"] = None):
+        """
+        打开只读副本；读取 manifest 后、打开分段前旧代数的文件可能已被写进程清理，
+        此时重新读取 manifest 再打开
+        """
+        for attempt in range(READ_ONLY_OPEN_ATTEMPTS):
+            try:
+                return cls(db_path, read_only=True, previous=previous)
+            except FileNotFoundError as e:
+                if attempt == READ_ONLY_OPEN_ATTEMPTS - 1:
+                    raise
+                logger.debug(f"分段已被清理，重新读取manifest: {e}")
+    
+    @staticmethod
+    def _reusable_segments(previous: "LightweightDocumentStore") -> Dict[str, Dict[str, Any]]:
+        """上一代副本中各分段已加载的数据（分段内容不可变，按名称复用；墓碑按新 manifest 重新读取）"""
+        reusable = {}
+        start = 0
+        column_blocks = previous.columns.blocks
+        if len(column_blocks) != len(previous.segments):
+            column_blocks = [None] * len(previous.segments)
+        for segment, postings, columns in zip(previous.segments, previous.postings_blocks, column_blocks):
+            reusable[segment.name] = {
+                "segment": segment,
+                "metadata": previous.metadata[start:start + segment.n_docs],
+                "postings": postings,
+                "columns": columns,
+            }
+            start += segment.n_docs
+        return reusable
+    
+    def _carried_rows(self, previous: "LightweightDocumentStore") -> Optional[int]:
+        """
+        新的分段列表是否保留了上一代副本的全部行号：上一代的分段依次原样保留（可能新增墓碑）或被原样合并
+        （合并的输入可以包括上一代之后追加的分段），之后只追加新分段。
+        是则返回沿用的行数，否则（压缩、清空改变了行号）返回 None
+        """
+        old_names = [segment.name for segment in previous.segments]
+        i = 0
+        for segment in self.segments:
+            if i == len(old_names):
+                break
+            merged_from = segment.merged_from[:len(old_names) - i]
+            if segment.name == old_names[i]:
+                i += 1
+            elif merged_from and old_names[i:i + len(merged_from)] == merged_from:
+                i += len(merged_from)
+            else:
+                return None
+        return len(previous.documents) if i == len(old_names) else None
+    
+    def _check_writable(self):
+        if self.read_only:
+            raise ReadOnlyStoreError("只读副本不能修改索引，请通过写进程操作")
+    
+    def _reset_index(self):
+        """重置向量索引状态"""
+        self.vectorizer = None
+        self.vocabulary_id = None
+        self.count_blocks = []
+        self.doc_freq = None
+        self.idf = None
+        self.idf_file = None
+        self.row_norms = None
+        self.is_fitted = False
+        self.idf_stale = False
+        self.docs_since_reweight = 0
+        self.docs_since_refit = 0
+    
+    def _migrate_legacy_files(self):
+        """把旧版 documents.pkl / metadata.pkl 迁移为一个分段"""
+        documents = self._load_data(self.documents_file, [])
+        metadata = self._load_data(self.metadata_file, [])
+        if not documents or len(documents) != len(metadata):
+            logger.warning(f"旧版数据文件不完整，跳过迁移: {len(documents)} 个文档, {len(metadata)} 条元数据")
+            return
+        logger.info(f"迁移旧版存储文件到分段格式，文档数量: {len(documents)}")
+        segment = self.storage.write_segment(ChunkTexts.from_documents(documents), metadata,
+                                             postings=PostingsBlock.build(documents))
+        self.storage.commit([segment], {})
+    
+    def _load_segments(self, previous: Optional["LightweightDocumentStore"] = None):
+        """
+        打开已提交的分段：元数据立即加载，文本按需加载，词频矩阵、倒排表与元数据列内存映射；
+        只读副本立即打开文本映射，之后写进程清理旧分段也不影响已打开的文件
+        """
+        segments = self.storage.open_segments()
+        for segment in segments:
+            reused = self._reusable.get(segment.name)
+            if reused is not None:
+                segment.adopt_texts(reused["segment"])
+            elif self.read_only:
+                segment.open_texts()
+        self._replace_segments(segments)
+        carried = self._carried_rows(previous) if previous is not None else None
+        if carried is not None:
+            self._load_appended_rows(previous, carried)
+        else:
+            self.metadata = []
+            for segment in self.segments:
+                reused = self._reusable.get(segment.name)
+                self.metadata.extend(reused["metadata"] if reused is not None else segment.load_metadata())
+            self._rebuild_source_index()
+        self._load_stats()
+        self._load_columns()
+        self._load_keyword_index()
+        if not self.read_only:
+            self.storage.garbage_collect()
         
-        # 初始化向量化器
-        try:
-            from sklearn.feature_extraction.text import TfidfVectorizer
-            from sklearn.metrics.pairwise import cosine_similarity
-            import numpy as np
-            
-            self.vectorizer = TfidfVectorizer(
-                max_features=10000,
-                stop_words='english',
-                ngram_range=(1, 2)
-            )
-            # 如果有文档，重新训练向量化器
-            if self.documents and len(self.documents) > 0:
+        if not SKLEARN_AVAILABLE:
+            logger.warning("sklearn导入失败，使用简单搜索")
+        elif self.segments:
+            # 优先加载持久化的索引，过期或版本不符时才重新训练
+            if self._load_index(previous if carried is not None else None, carried or 0):
+                logger.info(f"已加载持久化索引，文档数量: {len(self.documents)}, 分段数量: {len(self.segments)}")
+            elif self.read_only:
+                # 只读副本不重建索引，等待写进程提交新的索引后重新加载
+                logger.warning("持久化索引不可用，只读副本暂时使用关键词检索")
+            else:
                 try:
                     logger.info(f"重新训练向量化器，文档数量: {len(self.documents)}")
-                    self.vectors = self.vectorizer.fit_transform(self.documents)
-                    self.is_fitted = True
+                    self.refit()
                     logger.info("向量化器训练成功")
                 except Exception as e:
                     logger.error(f"向量化器训练失败: {e}")
-                    self.vectors = None
-                    self.is_fitted = False
+                    self._reset_index()
+    
+    def _load_appended_rows(self, previous: "LightweightDocumentStore", carried: int):
+        """
+        在上一代副本的基础上加载新增的行：沿用前 carried 行的元数据，源索引只移除新增墓碑的行、登记新分段的行，
+        代价与新增的行数及来源数成正比，不再按全部行重建。上一代副本的结构不做修改，进行中的查询仍可使用
+        """
+        metadata = previous.metadata[:carried]
+        appended = []
+        start = 0
+        for segment in self.segments:
+            end = start + segment.n_docs
+            if end > carried:
+                # 合并后的分段可能跨过 carried，只取其后的部分
+                appended.extend(segment.load_metadata()[max(carried - start, 0):])
+            start = end
+        newly_deleted = np.flatnonzero(self.deleted[:carried] & ~previous.deleted[:carried])
+        
+        touched = {metadata[row].get("source") for row in newly_deleted}
+        touched.update(meta.get("source") for meta in appended)
+        index = self._copy_source_index(previous, touched)
+        self._unindex_rows(newly_deleted, metadata, index)
+        self._index_sources(carried, appended, self.deleted[carried:], index)
+        metadata.extend(appended)
+        self.metadata = metadata
+        self._use_source_index(index)
+    
+    def _copy_source_index(self, other: "LightweightDocumentStore", sources) -> Tuple[Dict, Dict, Dict, Dict]:
+        """复制另一个副本的源索引；外层字典浅复制，只有 sources 涉及的区间列表与文件名登记另行复制，之后可以就地修改"""
+        source_chunks = dict(other._source_chunks)
+        filename_sources = dict(other._filename_sources)
+        for source in sources:
+            if not source:
+                continue
+            if source in source_chunks:
+                source_chunks[source] = [list(chunk_range) for chunk_range in source_chunks[source]]
+            filename = self._filename_of(source)
+            if filename in filename_sources:
+                filename_sources[filename] = dict(filename_sources[filename])
+        return source_chunks, filename_sources, dict(other._hash_sources), dict(other._source_hashes)
+    
+    def _segment_columns(self, segment: Segment, metadatas: List[Dict]) -> ColumnBlock:
+        """分段的元数据列：优先内存映射分段中保存的列，旧分段从元数据编码"""
+        block = segment.load_columns()
+        return block if block is not None else ColumnBlock.build(metadatas, self.columns.fields)
+    
+    def _load_columns(self):
+        """按分段加载元数据列，未变化的分段复用上一代已打开的列"""
+        columns = MetadataColumns()
+        start = 0
+        for segment in self.segments:
+            reused = self._reusable.get(segment.name)
+            block = reused["columns"] if reused is not None else None
+            if block is None:
+                block = self._segment_columns(segment, self.metadata[start:start + segment.n_docs])
+            columns.append_block(block)
+            start += segment.n_docs
+        self.columns = columns
+    
+    def _load_keyword_index(self):
+        """加载各分段的倒排表；缺少倒排表的旧分段会补建并重写一次"""
+        self.keyword_index.clear()
+        self.postings_blocks = []
+        upgraded = []
+        for segment in self.segments:
+            reused = self._reusable.get(segment.name)
+            block = reused["postings"] if reused is not None else segment.load_postings()
+            if block is None:
+                block = PostingsBlock.build(segment.documents)
+                # 只读副本只在内存中补建，由写进程负责重写分段
+                if not self.read_only:
+                    segment = self.storage.write_segment(
+                        segment.load_texts(), segment.load_metadata(), segment.load_counts(),
+                        segment.vocabulary_id, postings=block
+                    )
+            upgraded.append(segment)
+            self.postings_blocks.append(block)
+        
+        if any(a is not b for a, b in zip(upgraded, self.segments)):
+            logger.info("已为旧分段补建倒排索引")
+            upgraded = [self.storage.with_tombstones(new, old.deleted_mask) if old.n_deleted else new
+                        for old, new in zip(self.segments, upgraded)]
+            self.storage.commit(upgraded)
+            self._replace_segments(upgraded)
+        
+        self.keyword_index = self._build_keyword_index(self.postings_blocks)
+    
+    @staticmethod
+    def _build_keyword_index(blocks: List[PostingsBlock]) -> InvertedIndex:
+        """按顺序登记各分段的倒排表，文档下标为全局行号"""
+        index = InvertedIndex()
+        start = 0
+        for block in blocks:
+            index.add_block(start, block)
+            start += block.n_docs
+        return index
+    
+    @staticmethod
+    def _compute_idf(doc_freq, n_docs: int):
+        """按 sklearn 的 smooth_idf 公式计算IDF"""
+        return np.log((1.0 + n_docs) / (1.0 + doc_freq)) + 1.0
+    
+    @staticmethod
+    def _compute_row_norms(counts, idf):
+        """计算每个文档TF-IDF向量的L2范数（不物化加权矩阵）"""
+        squared = counts.multiply(counts).tocsr()
+        return np.sqrt(squared @ (idf ** 2))
+    
+    def _index_params(self) -> Dict[str, Any]:
+        """可JSON序列化的向量化参数"""
+        return {key: list(value) if isinstance(value, tuple) else value
+                for key, value in VECTORIZER_PARAMS.items()}
+    
+    def _index_info(self) -> Dict[str, Any]:
+        """写入 manifest 的索引状态"""
+        if not self.is_fitted:
+            return {}
+        return {
+            "format_version": INDEX_FORMAT_VERSION,
+            "vectorizer_params": self._index_params(),
+            "vocabulary_id": self.vocabulary_id,
+            "idf_file": self.idf_file,
+            "idf_stale": self.idf_stale,
+            "docs_since_reweight": self.docs_since_reweight,
+            "docs_since_refit": self.docs_since_refit,
+        }
+    
+    def _load_index(self, previous: Optional["LightweightDocumentStore"] = None, carried: int = 0) -> bool:
+        """
+        从分段加载词频矩阵并恢复索引状态，校验失败返回False。
+        previous 为沿用了前 carried 行的上一代副本：词表相同时文档频率只累加新分段，
+        IDF 文件也相同时前 carried 行的行范数直接沿用
+        """
+        info = self.storage.index_info
+        if info.get("format_version") != INDEX_FORMAT_VERSION:
+            logger.info(f"索引版本不匹配: {info.get('format_version')} != {INDEX_FORMAT_VERSION}")
+            return False
+        if info.get("vectorizer_params") != self._index_params():
+            logger.info("向量化参数已变化，需要重建索引")
+            return False
+        vocabulary_id = info.get("vocabulary_id")
+        if any(not s.has_counts or s.vocabulary_id != vocabulary_id for s in self.segments):
+            logger.info("存在未索引或词表不一致的分段，需要重建索引")
+            return False
+        
+        try:
+            blocks = [segment.load_counts() for segment in self.segments]
+            # 上一代之后新增的行的词频矩阵
+            new_blocks = []
+            start = 0
+            for block in blocks:
+                end = start + block.shape[0]
+                if end > carried:
+                    new_blocks.append(block if start >= carried else block[carried - start:])
+                start = end
+            same_vocabulary = previous is not None and previous.is_fitted and previous.vocabulary_id == vocabulary_id
+            if same_vocabulary:
+                vocabulary = previous.vectorizer.vocabulary
+                doc_freq = previous.doc_freq.copy()
+                for block in new_blocks:
+                    doc_freq += np.bincount(block.indices, minlength=len(vocabulary))
             else:
-                self.vectors = None
-                self.is_fitted = False
-        except ImportError as e:
-            logger.warning(f"sklearn导入失败，使用简单搜索: {e}")
-            self.vectorizer = None
-            self.vectors = None
-            self.is_fitted = False
+                vocabulary = self.storage.load_vocabulary(vocabulary_id)
+                doc_freq = np.zeros(len(vocabulary), dtype=np.float64)
+                for block in blocks:
+                    doc_freq += np.bincount(block.indices, minlength=len(vocabulary))
+            
+            if info.get("idf_file"):
+                idf = self.storage.load_array(info["idf_file"])
+            else:
+                idf = self._compute_idf(doc_freq, len(self.documents))
+            
+            if same_vocabulary and info.get("idf_file") and info["idf_file"] == previous.idf_file:
+                row_norms = [previous.row_norms[:carried]]
+                row_norms.extend(self._compute_row_norms(block, idf) for block in new_blocks)
+            else:
+                row_norms = [self._compute_row_norms(block, idf) for block in blocks]
+            
+            self.vectorizer = CountVectorizer(vocabulary=vocabulary, **VECTORIZER_PARAMS)
+            self.vocabulary_id = vocabulary_id
+            self.count_blocks = blocks
+            self.doc_freq = doc_freq
+            self.idf = idf
+            self.idf_file = info.get("idf_file")
+            self.row_norms = np.concatenate(row_norms)
+            self.is_fitted = True
+            self.idf_stale = bool(info.get("idf_stale", False))
+            self.docs_since_reweight = int(info.get("docs_since_reweight", 0))
+            self.docs_since_refit = int(info.get("docs_since_refit", 0))
+            return True
+        except Exception as e:
+            if self.read_only and isinstance(e, FileNotFoundError):
+                # 写进程已提交新的代数并清理了旧文件，由 open_read_only 重新读取 manifest
+                raise
+            logger.warning(f"加载持久化索引失败，将重新训练: {e}")
+            self._reset_index()
+            return False
+    
+    def _load_stats(self):
+        """恢复随 manifest 提交的集合统计；缺失或与分段不一致时从元数据重新统计"""
+        stats = CollectionStats.from_dict(self.storage.stats_info)
+        if stats is None or stats.total_chunks != len(self.documents) - self.n_deleted:
+            stats = CollectionStats()
+            stats.add(meta for row, meta in enumerate(self.metadata) if not self.deleted[row])
+        self.stats = stats
+    
+    def _bump_generation(self):
+        """递增索引代数（调用方持有锁）"""
+        self.index_generation += 1
+    
+    def _replace_segments(self, segments: List[Segment]):
+        """更新内存中的分段列表及墓碑掩码（调用方持有锁）"""
+        self.segments = segments
+        self.documents = LazyDocumentList(segments)
+        self.deleted = (np.concatenate([segment.deleted_mask for segment in segments])
+                        if segments else np.zeros(0, dtype=bool))
+        self.n_deleted = int(self.deleted.sum())
+    
+    def refit(self):
+        """
+        全量重建：重新学习词表并统计所有文档的词频，结果写成一个合并后的分段。
+        分词与写入在锁外进行，只在切换状态时持锁；期间追加的文档按新词表补充分词后一并提交，
+        期间发生压缩或清空（行号变化）时重新开始
+        """
+        self._check_writable()
+        with self._refit_lock:
+            while not self._try_refit():
+                logger.info("全量重建期间文档行号已变化，重新开始")
+    
+    @staticmethod
+    def _row_texts(segments: List[Segment], start: int, end: int) -> ChunkTexts:
+        """取出全局行号 [start, end) 的文档块文本"""
+        parts = []
+        segment_start = 0
+        for segment in segments:
+            segment_end = segment_start + segment.n_docs
+            if segment_end > start and segment_start < end:
+                texts = segment.load_texts()
+                lo, hi = max(start, segment_start) - segment_start, min(end, segment_end) - segment_start
+                parts.append(texts if hi - lo == segment.n_docs else texts.take(np.arange(lo, hi)))
+            segment_start = segment_end
+        return ChunkTexts.concat(parts)
+    
+    def _try_refit(self) -> bool:
+        """执行一次全量重建；行号在期间发生变化时放弃并返回 False"""
+        # 读取中的分段与新写入的分段在提交前不会被其他操作触发的垃圾回收清理
+        with self.storage.writing() as scope:
+            with self._lock:
+                metadata = self.metadata
+                segments = list(self.segments)
+                postings_blocks = list(self.postings_blocks)
+                covered = len(self.documents)
+                scope.pin(segments)
+            if not covered:
+                return True
+            
+            # 按块逐个解码文本交给向量化器，不物化全部文档块字符串
+            texts = ChunkTexts.concat([segment.load_texts() for segment in segments])
+            vectorizer = CountVectorizer(**VECTORIZER_PARAMS)
+            counts = vectorizer.fit_transform(iter(texts)).tocsr().astype(np.float64)
+            doc_freq = np.bincount(counts.indices, minlength=counts.shape[1]).astype(np.float64)
+            idf = self._compute_idf(doc_freq, counts.shape[0])
+            
+            vocabulary_id = self.storage.allocate_file_id(VOCABULARY_NAME_FORMAT)
+            self.storage.save_vocabulary(vocabulary_id, vectorizer.vocabulary_)
+            new_segments = [self.storage.write_segment(texts, metadata[:covered], counts, vocabulary_id,
+                                                       postings=PostingsBlock.concat(postings_blocks),
+                                                       merged_from=segments)]
+            count_blocks = [counts]
+            new_postings = [new_segments[0].load_postings()]
+            row_norms = [self._compute_row_norms(counts, idf)]
+            tail_docs = 0
+            idf_file = None
+            
+            while True:
+                with self._lock:
+                    if self.metadata is not metadata:
+                        # 压缩或清空改变了行号，本次写入的文件由之后的垃圾回收清理
+                        return False
+                    total = len(self.documents)
+                    if total == covered:
+                        self._commit_refit(vectorizer, vocabulary_id, new_segments, count_blocks, new_postings,
+                                           doc_freq, idf, idf_file, np.concatenate(row_norms), tail_docs)
+                        return True
+                    current = list(self.segments)
+                    scope.pin(current)
+                
+                # 重建期间追加的文档：按新词表分词，范数按本次的IDF计算（与增量添加一致，IDF标记为过期）
+                tail_texts = self._row_texts(current, covered, total)
+                tail_counts = vectorizer.transform(iter(tail_texts)).tocsr().astype(np.float64)
+                new_segments.append(self.storage.write_segment(tail_texts, metadata[covered:total], tail_counts,
+                                                               vocabulary_id,
+                                                               postings=PostingsBlock.build(list(tail_texts))))
+                count_blocks.append(tail_counts)
+                new_postings.append(new_segments[-1].load_postings())
+                row_norms.append(self._compute_row_norms(tail_counts, idf))
+                doc_freq = doc_freq + np.bincount(tail_counts.indices, minlength=doc_freq.shape[0])
+                if idf_file is None:
+                    idf_file = IDF_NAME_FORMAT.format(self.storage.allocate_file_id(IDF_NAME_FORMAT))
+                    self.storage.save_array(idf_file, idf)
+                tail_docs += total - covered
+                covered = total
+    
+    def _commit_refit(self, vectorizer, vocabulary_id: int, segments: List[Segment], count_blocks: List,
+                      postings_blocks: List[PostingsBlock], doc_freq, idf, idf_file: Optional[str],
+                      row_norms, tail_docs: int):
+        """切换到重建后的分段与索引状态（调用方持有锁）；重建不回收已删除的行，墓碑按当前状态保留"""
+        if self.n_deleted:
+            start = 0
+            for i, segment in enumerate(segments):
+                mask = self.deleted[start:start + segment.n_docs]
+                if mask.any():
+                    segments[i] = self.storage.with_tombstones(segment, mask)
+                start += segment.n_docs
+        
+        self.vectorizer = vectorizer
+        self.vocabulary_id = vocabulary_id
+        self.count_blocks = count_blocks
+        self.doc_freq = doc_freq
+        self.idf = idf
+        self.idf_file = idf_file
+        self.row_norms = row_norms
+        self.is_fitted = True
+        self.idf_stale = tail_docs > 0
+        self.docs_since_reweight = tail_docs
+        self.docs_since_refit = tail_docs
+        
+        self.storage.commit(segments, self._index_info())
+        self._replace_segments(segments)
+        # 行的内容与顺序不变，内存中的倒排索引无需调整
+        self.postings_blocks = postings_blocks
+        self._bump_generation()
+        self.storage.garbage_collect()
+    
+    def reweight(self):
+        """根据累计的文档频率重新计算IDF和行范数，不重新分词"""
+        self._check_writable()
+        with self._lock:
+            if not self.is_fitted:
+                return
+            self._apply_reweight()
+            self.storage.commit(self.segments, self._index_info())
+            self._bump_generation()
+            self.storage.garbage_collect()
+    
+    def _apply_reweight(self):
+        """重算IDF和行范数（调用方持有锁）"""
+        self.idf = self._compute_idf(self.doc_freq, len(self.documents))
+        self.row_norms = np.concatenate([self._compute_row_norms(block, self.idf) for block in self.count_blocks])
+        self.idf_file = None
+        self.idf_stale = False
+        self.docs_since_reweight = 0
+        logger.info(f"IDF权重已更新，文档数量: {len(self.documents)}")
+    
+    def _apply_new_counts(self, new_counts, count_towards_refit: bool = True):
+        """增量索引：登记新分段的词频并更新文档频率统计（调用方持有锁）"""
+        if not self.idf_stale:
+            # 文档频率即将偏离当前IDF，先保存正在使用的IDF以便重启后恢复
+            self.idf_file = IDF_NAME_FORMAT.format(self.storage.allocate_file_id(IDF_NAME_FORMAT))
+            self.storage.save_array(self.idf_file, self.idf)
+        
+        self.count_blocks.append(new_counts)
+        self.doc_freq += np.bincount(new_counts.indices, minlength=self.doc_freq.shape[0])
+        # 新文档的范数先按当前IDF计算，与旧文档保持一致
+        self.row_norms = np.concatenate([self.row_norms, self._compute_row_norms(new_counts, self.idf)])
+        self.idf_stale = True
+        self.docs_since_reweight += new_counts.shape[0]
+        if count_towards_refit:
+            self.docs_since_refit += new_counts.shape[0]
+        
+        if self.docs_since_reweight > self.reweight_threshold * len(self.documents):
+            self._apply_reweight()
+    
+    def needs_refit(self) -> bool:
+        """词表是否已明显落后于语料（新增文档比例超过阈值）"""
+        if not self.is_fitted:
+            return len(self.documents) > 0
+        return self.docs_since_refit > self.refit_threshold * len(self.documents)
+    
+    def optimize_index(self, full_refit: bool = False) -> Dict[str, Any]:
+        """可调度的索引维护：按需重算IDF，词表过期时全量重建"""
+        self._check_writable()
+        if not SKLEARN_AVAILABLE or not self.documents:
+            return {"reweighted": False, "refitted": False, "compacted": False}
+        
+        refitted = False
+        reweighted = False
+        compacted = self.compact() if self.n_deleted else False
+        # 等待进行中的后台重建，避免紧接着再重建一次
+        refit_thread = self._refit_thread
+        if refit_thread is not None:
+            refit_thread.join()
+        if full_refit or self.needs_refit():
+            self.refit()
+            refitted = True
+        elif self.idf_stale:
+            self.reweight()
+            reweighted = True
+        
+        return {"reweighted": reweighted, "refitted": refitted, "compacted": compacted,
+                "segments": len(self.segments)}
+    
+    def _find_small_segment_run(self):
+        """找出第一段连续的小分段（至少两个且词表一致），返回 [start, end)"""
+        run_start = None
+        for i, segment in enumerate(self.segments + [None]):
+            mergeable = (
+                segment is not None
+                and segment.n_docs < self.small_segment_docs
+                and (run_start is None or segment.vocabulary_id == self.segments[run_start].vocabulary_id)
+            )
+            if mergeable:
+                if run_start is None:
+                    run_start = i
+                continue
+            if run_start is not None and i - run_start >= 2:
+                return run_start, i
+            run_start = i if segment is not None and segment.n_docs < self.small_segment_docs else None
+        return None
+    
+    def merge_small_segments(self) -> bool:
+        """把一段连续的小分段合并为一个分段；读写在锁外进行，只在提交时短暂持锁"""
+        # 读取中的分段与新写入的分段在提交前不会被其他操作触发的垃圾回收清理
+        with self.storage.writing() as scope:
+            with self._lock:
+                run = self._find_small_segment_run()
+                if run is None:
+                    return False
+                start, end = run
+                old_segments = self.segments[start:end]
+                scope.pin(old_segments)
+            
+            texts = ChunkTexts.concat([segment.load_texts() for segment in old_segments])
+            metadatas = [meta for segment in old_segments for meta in segment.load_metadata()]
+            counts = None
+            if all(segment.has_counts for segment in old_segments):
+                counts = sp.vstack([segment.load_counts() for segment in old_segments], format="csr")
+            with self._lock:
+                old_blocks = self.postings_blocks[start:end]
+            merged = self.storage.write_segment(texts, metadatas, counts, old_segments[0].vocabulary_id,
+                                                postings=PostingsBlock.concat(old_blocks), merged_from=old_segments)
+            postings = merged.load_postings()
+            
+            with self._lock:
+                current = self.segments[start:end]
+                if len(current) != len(old_segments) or any(a is not b for a, b in zip(current, old_segments)):
+                    # 合并期间分段列表被重建（如全量重建或清空），放弃本次合并
+                    shutil.rmtree(merged.path, ignore_errors=True)
+                    return False
+                
+                deleted = np.concatenate([segment.deleted_mask for segment in old_segments])
+                if deleted.any():
+                    merged = self.storage.with_tombstones(merged, deleted)
+                segments = self.segments[:start] + [merged] + self.segments[end:]
+                self.storage.commit(segments, self._index_info())
+                self._replace_segments(segments)
+                if self.is_fitted and counts is not None:
+                    self.count_blocks = self.count_blocks[:start] + [counts] + self.count_blocks[end:]
+                # 全局行号不变，内存中的倒排索引无需调整
+                self.postings_blocks = self.postings_blocks[:start] + [postings] + self.postings_blocks[end:]
+                self.storage.garbage_collect()
+        
+        logger.info(f"已合并 {len(old_segments)} 个小分段，共 {len(texts)} 个文档")
+        return True
+    
+    def _merge_loop(self):
+        try:
+            while self.merge_small_segments():
+                pass
+        except Exception as e:
+            logger.error(f"后台合并分段失败: {e}")
+    
+    def _refit_loop(self):
+        try:
+            if self.needs_refit():
+                self.refit()
+        except Exception as e:
+            logger.error(f"后台全量重建失败: {e}")
+    
+    def _maybe_schedule_refit(self):
+        """词表明显落后于语料（见 needs_refit）时启动后台全量重建，新文档中的新词才能被向量检索命中"""
+        if self.read_only or not SKLEARN_AVAILABLE or not self.needs_refit():
+            return
+        if self._refit_thread is not None and self._refit_thread.is_alive():
+            return
+        self._refit_thread = threading.Thread(target=self._refit_loop, name="index-refit", daemon=True)
+        self._refit_thread.start()
+    
+    def _maybe_schedule_merge(self):
+        """小分段过多时启动后台合并线程"""
+        if self.read_only:
+            return
+        small = sum(1 for segment in self.segments if segment.n_docs < self.small_segment_docs)
+        if small <= self.max_small_segments:
+            return
+        if self._merge_thread is not None and self._merge_thread.is_alive():
+            return
+        self._merge_thread = threading.Thread(target=self._merge_loop, name="segment-merge", daemon=True)
+        self._merge_thread.start()
+    
+    def _search_state(self) -> Dict[str, Any]:
+        """
+        一份一致的检索快照（调用方持有锁）。压缩、重建与清空整体替换这些对象；追加文档时元数据列表与
+        倒排索引原地扩展，快照中的倒排索引是当时分段列表的副本，
+        因此候选行号总在快照的墓碑掩码、过滤掩码与元数据范围内
+        """
+        return {
+            "documents": self.documents,
+            "metadata": self.metadata,
+            "keyword_index": self.keyword_index.snapshot(),
+            "deleted": self.deleted if self.n_deleted else None,
+            "count_blocks": list(self.count_blocks),
+            "idf": self.idf,
+            "row_norms": self.row_norms,
+            "vectorizer": self.vectorizer,
+            "is_fitted": self.is_fitted,
+        }
+    
+    def _score(self, query_texts: List[str], rows: Optional[np.ndarray] = None,
+               state: Optional[Dict[str, Any]] = None):
+        """
+        计算查询与文档的余弦相似度，返回 (文档数, 查询数) 的矩阵；
+        给定 rows（升序的候选行号）时只对这些行打分，返回 (len(rows), 查询数)
+        """
+        if state is None:
+            with self._lock:
+                state = self._search_state()
+        blocks = state["count_blocks"]
+        idf = state["idf"]
+        row_norms = state["row_norms"]
+        vectorizer = state["vectorizer"]
+        
+        query_counts = vectorizer.transform(query_texts).tocsr().astype(np.float64)
+        weighted = query_counts.multiply(idf).tocsr()
+        query_norms = np.sqrt(weighted.multiply(weighted).sum(axis=1)).A1
+        query_norms[query_norms == 0] = 1.0
+        weighted = sp.diags(1.0 / query_norms) @ weighted
+        # 文档侧的IDF与归一化在查询侧完成：cos = C·(idf∘q) / |d|
+        query_matrix = weighted.multiply(idf).T.tocsr()
+        
+        if rows is None:
+            scores = np.vstack([(block @ query_matrix).toarray() for block in blocks])
+        else:
+            # 按分段切分候选行，只取出这些行参与矩阵乘法
+            starts = np.cumsum([0] + [block.shape[0] for block in blocks])
+            bounds = np.searchsorted(rows, starts)
+            parts = []
+            for i, block in enumerate(blocks):
+                local = rows[bounds[i]:bounds[i + 1]] - starts[i]
+                if local.size:
+                    parts.append((block[local] @ query_matrix).toarray())
+            scores = np.vstack(parts) if parts else np.zeros((0, len(query_texts)))
+            row_norms = row_norms[rows]
+        
+        row_norms = np.where(row_norms > 0, row_norms, 1.0)
+        return scores / row_norms[:, None]
     
     def _load_data(self, file_path: Path, default_value):
         """安全加载数据文件"""
@@ -78,14 +811,6 @@ class LightweightDocumentStore:
             logger.warning(f"加载数据文件失败 {file_path}: {e}")
         return default_value
     
-    def _save_data(self, file_path: Path, data):
-        """安全保存数据文件"""
-        try:
-            with open(file_path, 'wb') as f:
-                pickle.dump(data, f)
-        except Exception as e:
-            logger.error(f"保存数据文件失败 {file_path}: {e}")
-    
     def _clean_metadata(self, metadata: Dict) -> Dict:
         """清理元数据，确保所有值都是基本类型"""
         clean_metadata = {}
@@ -107,71 +832,258 @@ class LightweightDocumentStore:
         
         return clean_metadata
     
+    @staticmethod
+    def _filename_of(source: str) -> str:
+        """提取文件名，去除路径"""
+        return filename_of(source)
+    
+    def _rebuild_source_index(self):
+        """根据元数据重建 源路径/文件名 -> 文档块区间 的索引，以及 内容哈希 <-> 源路径 的登记表"""
+        index = self._new_source_index()
+        self._index_sources(0, self.metadata, self.deleted if self.n_deleted else None, index)
+        self._use_source_index(index)
+    
+    @staticmethod
+    def _new_source_index() -> Tuple[Dict, Dict, Dict, Dict]:
+        """(源路径 -> 文档块区间, 文件名 -> 源路径, 内容哈希 -> 源路径, 源路径 -> 内容哈希)"""
+        return {}, {}, {}, {}
+    
+    def _use_source_index(self, index: Tuple[Dict, Dict, Dict, Dict]):
+        """整体替换源索引（调用方持有锁）"""
+        self._source_chunks, self._filename_sources, self._hash_sources, self._source_hashes = index
+    
+    def _index_sources(self, start: int, metadatas: List[Dict], deleted: Optional[np.ndarray] = None,
+                       index: Optional[Tuple[Dict, Dict, Dict, Dict]] = None):
+        """
+        将从 start 开始的一批文档块登记到源索引（默认为当前使用的索引），区间为左闭右开；
+        deleted 与 metadatas 一一对应，已删除的行不登记
+        """
+        if index is None:
+            index = (self._source_chunks, self._filename_sources, self._hash_sources, self._source_hashes)
+        source_chunks, filename_sources, hash_sources, source_hashes = index
+        for offset, meta in enumerate(metadatas):
+            source = meta.get("source")
+            if not source:
+                continue
+            if deleted is not None and deleted[offset]:
+                continue
+            row = start + offset
+            content_hash = meta.get("content_hash")
+            if content_hash:
+                hash_sources.setdefault(content_hash, source)
+                source_hashes[source] = content_hash
+            ranges = source_chunks.get(source)
+            if ranges is None:
+                source_chunks[source] = [[row, row + 1]]
+                # dict 保持插入顺序，第一个来源即最早添加的来源
+                filename_sources.setdefault(self._filename_of(source), {})[source] = None
+            elif ranges[-1][1] == row:
+                ranges[-1][1] = row + 1
+            else:
+                ranges.append([row, row + 1])
+    
+    @staticmethod
+    def _subtract_rows(ranges: List[List[int]], rows: List[int]) -> List[List[int]]:
+        """从有序区间列表中去掉一批有序行号，返回新的区间列表"""
+        result = []
+        i = 0
+        for start, end in ranges:
+            cursor = start
+            while i < len(rows) and rows[i] < end:
+                row = rows[i]
+                i += 1
+                if row < cursor:
+                    continue
+                if row > cursor:
+                    result.append([cursor, row])
+                cursor = row + 1
+            if cursor < end:
+                result.append([cursor, end])
+        return result
+    
+    def _unindex_rows(self, rows, metadata: List[Dict], index: Optional[Tuple[Dict, Dict, Dict, Dict]] = None):
+        """
+        从源索引（默认为当前使用的索引）中移除一批行，代价与这些行及受影响来源的区间数成正比；
+        来源的行全部移除后一并移除其文件名与内容哈希登记，其他来源仍有相同哈希时改登记为该来源
+        """
+        if index is None:
+            index = (self._source_chunks, self._filename_sources, self._hash_sources, self._source_hashes)
+        source_chunks, filename_sources, hash_sources, source_hashes = index
+        by_source: Dict[str, List[int]] = {}
+        for row in sorted(int(row) for row in rows):
+            source = metadata[row].get("source")
+            if source in source_chunks:
+                by_source.setdefault(source, []).append(row)
+        
+        for source, removed in by_source.items():
+            ranges = self._subtract_rows(source_chunks[source], removed)
+            if ranges:
+                # 区间列表整体替换，不修改其他地方可能持有的旧列表
+                source_chunks[source] = ranges
+                if source in source_hashes:
+                    # 内容哈希可能只记录在被删除的行上（如分块导入的CSV），按剩余的行重新确定
+                    hashes = [metadata[row].get("content_hash") for start, end in ranges for row in range(start, end)]
+                    remaining = [h for h in hashes if h]
+                    if not remaining or remaining[-1] != source_hashes[source]:
+                        self._drop_source_hash(source, hash_sources, source_hashes)
+                    if remaining:
+                        hash_sources.setdefault(remaining[-1], source)
+                        source_hashes[source] = remaining[-1]
+                continue
+            
+            del source_chunks[source]
+            filename = self._filename_of(source)
+            sources = filename_sources.get(filename)
+            if sources is not None:
+                sources.pop(source, None)
+                if not sources:
+                    del filename_sources[filename]
+            self._drop_source_hash(source, hash_sources, source_hashes)
+    
+    @staticmethod
+    def _drop_source_hash(source: str, hash_sources: Dict, source_hashes: Dict):
+        content_hash = source_hashes.pop(source, None)
+        if content_hash is None or hash_sources.get(content_hash) != source:
+            return
+        del hash_sources[content_hash]
+        for other, other_hash in source_hashes.items():
+            if other_hash == content_hash:
+                hash_sources[content_hash] = other
+                break
+    
     def check_document_exists(self, source_path: str) -> bool:
         """检查文档是否已经存在（基于源文件路径）"""
-        for meta in self.metadata:
-            if meta.get("source") == source_path:
-                return True
-        return False
+        return source_path in self._source_chunks
+    
+    def get_source_by_hash(self, content_hash: str) -> Optional[str]:
+        """返回内容哈希相同的已入库源文件（没有则返回 None）"""
+        return self._hash_sources.get(content_hash)
+    
+    def get_source_hash(self, source_path: str) -> Optional[str]:
+        """返回源文件入库时的内容哈希；旧数据未记录哈希时返回 None"""
+        return self._source_hashes.get(source_path)
     
     def get_existing_sources(self) -> set:
         """获取所有已存在的文档源文件路径"""
-        sources = set()
-        for meta in self.metadata:
-            source = meta.get("source")
-            if source:
-                sources.add(source)
-        return sources
+        return set(self._source_chunks)
+    
+    def get_source_chunk_ranges(self, source_path: str) -> List[List[int]]:
+        """获取某个源文件对应的文档块区间列表"""
+        return [list(r) for r in self._source_chunks.get(source_path, [])]
     
-    def add(self, documents: List[str], metadatas: List[Dict], ids: List[str] = None):
-        """添加文档到存储，支持去重检查"""
+    def get_source_chunk_count(self, source_path: str) -> int:
+        """获取某个源文件的文档块数量"""
+        return sum(end - start for start, end in self._source_chunks.get(source_path, []))
+    
+    def add(self, documents: List[str], metadatas: List[Dict], ids: List[str] = None,
+            append: bool = False, texts: Optional[ChunkTexts] = None) -> int:
+        """
+        添加文档到存储，支持去重检查，返回实际添加的文档数；
+        append=True 时不检查来源是否已存在，用于分批写入同一来源（如分块导入的CSV）；
+        texts 为文档块的偏移表示（与 documents 一一对应），不提供时每个文档块单独保存
+        """
+        self._check_writable()
         try:
             # 检查是否有重复的源文件
             new_documents = []
             new_metadatas = []
+            kept_rows = []
             skipped_count = 0
             
             for i, (doc, meta) in enumerate(zip(documents, metadatas)):
                 source_path = meta.get("source")
-                if source_path and self.check_document_exists(source_path):
+                if source_path and not append and self.check_document_exists(source_path):
                     logger.info(f"文档已存在，跳过: {source_path}")
                     skipped_count += 1
                     continue
                 
                 new_documents.append(doc)
                 new_metadatas.append(self._clean_metadata(meta))
+                kept_rows.append(i)
             
             if not new_documents:
                 logger.info(f"所有文档都已存在，跳过添加")
-                return
+                return 0
             
-            # 清理元数据
-            cleaned_metadatas = [self._clean_metadata(meta) for meta in new_metadatas]
+            # 元数据已在上面清理过
+            cleaned_metadatas = new_metadatas
             
-            # 添加新文档
-            self.documents.extend(new_documents)
-            self.metadata.extend(cleaned_metadatas)
+            # 倒排表只依赖新文档本身，在锁外构建
+            postings = PostingsBlock.build(new_documents)
+            if texts is None:
+                texts = ChunkTexts.from_documents(new_documents)
+            elif skipped_count:
+                texts = texts.take(kept_rows)
             
-            # 重新训练向量化器
-            if SKLEARN_AVAILABLE and self.vectorizer:
-                self.vectors = self.vectorizer.fit_transform(self.documents)
-                self.is_fitted = True
+            # 新分段从写入到提交期间不会被其他操作触发的垃圾回收清理
+            with self.storage.writing():
+                while True:
+                    # 新文档按当前词表分词并写成一个新分段（锁外进行）；失败时回退为全量重建
+                    with self._lock:
+                        vectorizer = self.vectorizer if SKLEARN_AVAILABLE and self.is_fitted else None
+                        vocabulary_id = self.vocabulary_id
+                    counts = None
+                    if vectorizer is not None:
+                        try:
+                            counts = vectorizer.transform(new_documents).tocsr().astype(np.float64)
+                        except Exception as e:
+                            logger.error(f"增量索引失败，将全量重建: {e}")
+                            counts = None
+                    
+                    segment = self.storage.write_segment(
+                        texts, cleaned_metadatas, counts,
+                        vocabulary_id if counts is not None else None,
+                        postings=postings
+                    )
+                    # 内存中只保留分段文件的映射
+                    segment_postings = segment.load_postings()
+                    segment_columns = self._segment_columns(segment, cleaned_metadatas)
+                    
+                    with self._lock:
+                        if counts is not None and (not self.is_fitted or self.vocabulary_id != vocabulary_id):
+                            # 分词期间词表已被重建，按新词表重新分词
+                            shutil.rmtree(segment.path, ignore_errors=True)
+                            continue
+                        
+                        # 添加新文档
+                        start = len(self.documents)
+                        self._replace_segments(self.segments + [segment])
+                        self.metadata.extend(cleaned_metadatas)
+                        self._index_sources(start, cleaned_metadatas)
+                        self.stats.add(cleaned_metadatas)
+                        self.columns.append_block(segment_columns)
+                        self.postings_blocks.append(segment_postings)
+                        self.keyword_index.add_block(start, segment_postings)
+                        if counts is not None:
+                            self._apply_new_counts(counts)
+                        
+                        # 提交 manifest，此前的中断不会影响已有索引
+                        self.storage.commit(self.segments, self._index_info(), self.stats.to_dict())
+                        self._bump_generation()
+                    break
             
-            # 保存数据
-            self._save_data(self.documents_file, self.documents)
-            self._save_data(self.metadata_file, self.metadata)
-            if self.vectors is not None:
-                self._save_data(self.vectors_file, self.vectors)
+            if SKLEARN_AVAILABLE and counts is None:
+                self.refit()
+            else:
+                self._maybe_schedule_refit()
+            
+            self._maybe_schedule_merge()
             
             logger.info(f"成功添加 {len(new_documents)} 个新文档，跳过 {skipped_count} 个重复文档，总计 {len(self.documents)} 个")
+            return len(new_documents)
             
         except Exception as e:
             logger.error(f"添加文档失败: {e}")
             raise
     
-    def simple_search(self, query: str, n_results: int = 5):
-        """优化的关键词搜索（备用方案）"""
-        if not self.documents:
+    def simple_search(self, query: str, n_results: int = 5, mask: Optional[np.ndarray] = None,
+                      state: Optional[Dict[str, Any]] = None):
+        """基于倒排索引的关键词搜索（备用方案），只访问包含查询词的文档"""
+        if state is None:
+            with self._lock:
+                state = self._search_state()
+        documents, metadata = state["documents"], state["metadata"]
+        if not documents:
             return {
                 "documents": [[]],
                 "metadatas": [[]],
@@ -179,59 +1091,12 @@ class LightweightDocumentStore:
             }
         
         try:
-            query_lower = query.lower()
-            results = []
-            
-            # 预处理查询词，提取重要关键词
-            query_words = [word.strip() for word in query_lower.split() if len(word.strip()) > 2]
-            if not query_words:
-                query_words = [query_lower]
-            
-            for i, doc in enumerate(self.documents):
-                doc_lower = doc.lower()
-                # 计算更精确的匹配分数
-                score = 0
-                exact_matches = 0
-                partial_matches = 0
-                
-                for word in query_words:
-                    if word in doc_lower:
-                        # 完全匹配给予更高分数
-                        if f" {word} " in f" {doc_lower} ":
-                            exact_matches += 1
-                            score += 2
-                        else:
-                            partial_matches += 1
-                            score += 1
-                
-                # 考虑文档长度和匹配密度
-                if score > 0:
-                    # 归一化分数，考虑匹配密度
-                    doc_length = len(doc_lower.split())
-                    density_score = score / doc_length if doc_length > 0 else 0
-                    
-                    # 最终分数 = 匹配分数 + 密度分数
-                    final_score = (score * 0.7) + (density_score * 0.3)
-                    
-                    results.append({
-                        "index": i,
-                        "score": final_score,
-                        "exact_matches": exact_matches,
-                        "partial_matches": partial_matches,
-                        "document": doc,
-                        "metadata": self.metadata[i] if i < len(self.metadata) else {}
-                    })
-            
-            # 按分数排序，优先考虑完全匹配
-            results.sort(key=lambda x: (x["exact_matches"], x["score"]), reverse=True)
-            
-            # 取前n_results个结果
-            top_results = results[:n_results]
+            hits = state["keyword_index"].keyword_search(query, n_results, mask=mask)
             
             return {
-                "documents": [[r["document"] for r in top_results]],
-                "metadatas": [[r["metadata"] for r in top_results]],
-                "distances": [[1 - r["score"] for r in top_results]]  # 转换为距离
+                "documents": [[documents[i] for i, _ in hits]],
+                "metadatas": [[metadata[i] if i < len(metadata) else {} for i, _ in hits]],
+                "distances": [[1 - score for _, score in hits]]  # 转换为距离
             }
             
         except Exception as e:
@@ -242,110 +1107,368 @@ class LightweightDocumentStore:
                 "distances": [[]]
             }
     
-    def query(self, query_texts: List[str], n_results: int = 5):
-        """查询相似文档"""
-        if not self.is_fitted or not self.vectorizer:
+    @staticmethod
+    def _top_k_indices(scores, k: int):
+        """对每一列做部分排序取前k个，返回 (查询数, k) 的下标矩阵，按分数降序"""
+        n_docs = scores.shape[0]
+        k = min(k, n_docs)
+        if k <= 0:
+            return np.empty((scores.shape[1], 0), dtype=np.int64)
+        if k < n_docs:
+            candidates = np.argpartition(-scores, k - 1, axis=0)[:k]
+        else:
+            candidates = np.broadcast_to(np.arange(n_docs)[:, None], scores.shape)
+        candidate_scores = np.take_along_axis(scores, candidates, axis=0)
+        order = np.argsort(-candidate_scores, axis=0, kind="stable")
+        return np.take_along_axis(candidates, order, axis=0).T
+    
+    @staticmethod
+    def _hits_to_results(hits_per_query: List[List], to_distance, state: Dict[str, Any]) -> Dict[str, List]:
+        """把每个查询的 (文档下标, 分数) 列表转换为分组结果格式"""
+        documents, metadata = state["documents"], state["metadata"]
+        results = {"documents": [], "metadatas": [], "distances": []}
+        for hits in hits_per_query:
+            results["documents"].append([documents[i] for i, _ in hits])
+            results["metadatas"].append([metadata[i] if i < len(metadata) else {} for i, _ in hits])
+            results["distances"].append([to_distance(score) for _, score in hits])
+        return results
+    
+    def _simple_search_batch(self, query_texts: List[str], n_results: int, mask: Optional[np.ndarray] = None,
+                             state: Optional[Dict[str, Any]] = None):
+        """逐个查询执行简单搜索并合并为批量结果格式"""
+        results = {"documents": [], "metadatas": [], "distances": []}
+        for query in query_texts:
+            single = self.simple_search(query, n_results, mask=mask, state=state)
+            for key in results:
+                results[key].append(single[key][0])
+        return results
+    
+    def bm25_search(self, query_texts: List[str], n_results: int = 5, mask: Optional[np.ndarray] = None,
+                    state: Optional[Dict[str, Any]] = None):
+        """BM25 检索；分数无上界，距离取 1 / (1 + score) 以保持越小越相关；语料统计不计已删除的行"""
+        if state is None:
+            with self._lock:
+                state = self._search_state()
+        hits = [state["keyword_index"].bm25_search(query, n_results, mask=mask, deleted=state["deleted"])
+                for query in query_texts]
+        return self._hits_to_results(hits, lambda score: 1.0 / (1.0 + score), state)
+    
+    def query(self, query_texts: List[str], n_results: int = 5, scorer: Optional[str] = None,
+              filters: Optional[Dict[str, Any]] = None):
+        """
+        批量查询相似文档：一次向量化所有查询、一次稀疏矩阵乘法，结果按查询分组
+        
+        scorer 可选 tfidf（默认）、bm25 或 keyword，返回结果中的 "scorer" 为实际使用的打分方式；
+        filters 为元数据过滤条件，先生成候选行掩码，只对候选行打分；已删除（墓碑）的行总是被排除
+        """
+        scorer = scorer or DEFAULT_SCORER
+        if scorer not in SEARCH_SCORERS:
+            raise ValueError(f"不支持的打分方式: {scorer}")
+        
+        with self._lock:
+            mask = self.columns.mask(filters)
+            if self.n_deleted:
+                mask = ~self.deleted if mask is None else mask & ~self.deleted
+            state = self._search_state()
+        rows = None if mask is None else np.flatnonzero(mask)
+        
+        if not query_texts or (rows is not None and rows.size == 0):
+            empty = [[] for _ in query_texts]
+            return {"documents": empty, "metadatas": list(empty), "distances": list(empty), "scorer": scorer}
+        
+        if scorer == SCORER_BM25:
+            try:
+                results = self.bm25_search(query_texts, n_results, mask=mask, state=state)
+                results["scorer"] = SCORER_BM25
+                return results
+            except Exception as e:
+                logger.error(f"BM25搜索失败，回退到简单搜索: {e}")
+                scorer = SCORER_KEYWORD
+        
+        if scorer == SCORER_KEYWORD or not state["is_fitted"] or not state["vectorizer"]:
             # 使用简单搜索作为备用
-            logger.info("向量化器不可用，使用简单搜索")
-            return self.simple_search(query_texts[0], n_results)
+            if scorer != SCORER_KEYWORD:
+                logger.info("向量化器不可用，使用简单搜索")
+            results = self._simple_search_batch(query_texts, n_results, mask=mask, state=state)
+            results["scorer"] = SCORER_KEYWORD
+            return results
         
         try:
-            from sklearn.metrics.pairwise import cosine_similarity
-            import numpy as np
-            
-            query = query_texts[0]
-            query_vector = self.vectorizer.transform([query])
+            # 计算相似度，形状为 (候选文档数, 查询数)
+            similarities = self._score(query_texts, rows, state)
             
-            # 计算相似度
-            similarities = cosine_similarity(query_vector, self.vectors).flatten()
+            # 部分排序获取每个查询最相似的文档索引
+            top_indices = self._top_k_indices(similarities, n_results)
             
-            # 获取最相似的文档索引
-            top_indices = np.argsort(similarities)[::-1][:n_results]
-            
-            # 构建结果
-            results = {
-                "documents": [[self.documents[i] for i in top_indices]],
-                "metadatas": [[self.metadata[i] for i in top_indices]],
-                "distances": [[1 - similarities[i] for i in top_indices]]  # 转换为距离
-            }
+            # 构建结果，候选行下标映射回全局行号
+            results = {"documents": [], "metadatas": [], "distances": [], "scorer": SCORER_TFIDF}
+            for q, indices in enumerate(top_indices):
+                doc_indices = indices if rows is None else rows[indices]
+                results["documents"].append([state["documents"][i] for i in doc_indices])
+                results["metadatas"].append([state["metadata"][i] for i in doc_indices])
+                results["distances"].append([1 - similarities[i, q] for i in indices])  # 转换为距离
             
             return results
             
         except Exception as e:
             logger.error(f"向量搜索失败，回退到简单搜索: {e}")
-            return self.simple_search(query_texts[0], n_results)
+            results = self._simple_search_batch(query_texts, n_results, mask=mask, state=state)
+            results["scorer"] = SCORER_KEYWORD
+            return results
     
     def count(self):
-        """返回文档数量"""
-        count = len(self.documents)
-        logger.info(f"LightweightDocumentStore.count(): 当前文档数量 = {count}")
-        return count
+        """返回文档数量（不含已删除的文档块）"""
+        return self.stats.total_chunks
     
     def count_unique_sources(self):
         """返回唯一源文件数量（实际的PDF文档数量）"""
-        unique_sources = set()
-        for meta in self.metadata:
-            source = meta.get("source")
-            if source:
-                # 提取文件名，去除路径
-                filename = source.split('/')[-1] if '/' in source else source
-                unique_sources.add(filename)
-        
-        count = len(unique_sources)
-        logger.info(f"LightweightDocumentStore.count_unique_sources(): 唯一源文件数量 = {count}")
-        return count
+        return len(self.stats.files)
     
     def get_source_files_info(self):
-        """获取源文件详细信息"""
-        source_files = {}
-        for meta in self.metadata:
-            source = meta.get("source")
-            if source:
-                filename = source.split('/')[-1] if '/' in source else source
-                if filename not in source_files:
-                    source_files[filename] = {
-                        "filename": filename,
-                        "chunks_count": 0,
-                        "file_type": meta.get("type", "unknown"),
-                        "first_added": meta.get("processed_time", "unknown")
-                    }
-                source_files[filename]["chunks_count"] += 1
-        
-        return source_files
+        """获取源文件详细信息（增量维护的统计）"""
+        return self.stats.file_info()
+    
+    def _segment_starts(self) -> np.ndarray:
+        """每个分段第一行的全局行号"""
+        return np.cumsum([0] + [segment.n_docs for segment in self.segments])[:-1]
+    
+    def delete_chunks(self, rows) -> int:
+        """
+        按全局行号删除文档块：只为所在分段写入墓碑并提交 manifest，检索立即跳过这些行，
+        磁盘空间由后台压缩回收。返回实际新删除的行数
+        """
+        self._check_writable()
+        rows = np.unique(np.asarray(rows, dtype=np.int64))
+        with self._lock:
+            rows = rows[(rows >= 0) & (rows < len(self.documents))]
+            rows = rows[~self.deleted[rows]]
+            if rows.size == 0:
+                return 0
+            
+            starts = self._segment_starts()
+            owners = np.searchsorted(starts, rows, side="right") - 1
+            segments = list(self.segments)
+            for i in np.unique(owners):
+                mask = segments[i].deleted_mask.copy()
+                mask[rows[owners == i] - starts[i]] = True
+                # 分段对象被替换，进行中的合并/压缩会检测到并放弃提交
+                segments[i] = self.storage.with_tombstones(segments[i], mask)
+            
+            self.stats.remove(self.metadata[row] for row in rows)
+            self.storage.commit(segments, self._index_info(), self.stats.to_dict())
+            self._replace_segments(segments)
+            self._unindex_rows(rows, self.metadata)
+            self._bump_generation()
+            self.storage.garbage_collect()
+        
+        logger.info(f"已标记删除 {rows.size} 个文档块，待回收 {self.n_deleted} 个")
+        self._maybe_schedule_compaction()
+        return int(rows.size)
+    
+    def delete_source(self, source: str) -> Dict[str, Any]:
+        """删除某个源文件的全部文档块；source 既可以是完整源路径，也可以是文件名"""
+        with self._lock:
+            if source in self._source_chunks:
+                sources = [source]
+            else:
+                sources = list(self._filename_sources.get(self._filename_of(source), {}))
+            rows = [row for src in sources for start, end in self._source_chunks[src] for row in range(start, end)]
+        
+        deleted = self.delete_chunks(rows) if rows else 0
+        return {"sources": sources, "deleted_chunks": deleted}
+    
+    def compact(self) -> bool:
+        """
+        压缩：重写含墓碑的分段以回收空间，并重建词频矩阵、倒排表与元数据列。
+        读写、分词以及覆盖全部语料的索引结构（倒排索引、元数据列、源索引、文档频率与行范数）都在锁外构建，
+        提交时只追加快照之后新增的分段并整体替换；快照中的分段已被替换（删除、合并、重建）时放弃本次压缩
+        """
+        self._check_writable()
+        # 读取中的分段与重写的分段在提交前不会被其他操作触发的垃圾回收清理
+        with self.storage.writing() as scope:
+            with self._lock:
+                snapshot = list(self.segments)
+                if not any(segment.n_deleted for segment in snapshot):
+                    return False
+                metadata = self.metadata
+                postings_blocks = list(self.postings_blocks)
+                count_blocks = list(self.count_blocks) if self.is_fitted else None
+                scope.pin(snapshot)
+            
+            new_segments, new_metadata, new_postings, new_columns, new_counts, written = [], [], [], [], [], []
+            start = 0
+            for i, segment in enumerate(snapshot):
+                end = start + segment.n_docs
+                metas = metadata[start:end]
+                counts = count_blocks[i] if count_blocks is not None else None
+                block = postings_blocks[i]
+                if segment.n_deleted:
+                    keep = np.flatnonzero(~segment.deleted_mask)
+                    if keep.size == 0:
+                        start = end
+                        continue
+                    texts = segment.load_texts().take(keep)
+                    metas = [metas[j] for j in keep]
+                    if counts is not None:
+                        counts = counts[keep].tocsr()
+                    segment = self.storage.write_segment(texts, metas, counts,
+                                                         segment.vocabulary_id if counts is not None else None,
+                                                         postings=PostingsBlock.build(list(texts)))
+                    written.append(segment)
+                    block = segment.load_postings()
+                new_segments.append(segment)
+                new_metadata.extend(metas)
+                new_postings.append(block)
+                new_columns.append(self._segment_columns(segment, metas))
+                new_counts.append(counts)
+                start = end
+            
+            # 压缩后的行没有墓碑，新的全局行号下的索引结构全部在锁外构建
+            keyword_index = self._build_keyword_index(new_postings)
+            columns = MetadataColumns()
+            for block in new_columns:
+                columns.append_block(block)
+            source_index = self._new_source_index()
+            self._index_sources(0, new_metadata, index=source_index)
+            if count_blocks is not None and new_counts:
+                doc_freq = np.zeros(self.doc_freq.shape[0], dtype=np.float64)
+                for block in new_counts:
+                    doc_freq += np.bincount(block.indices, minlength=doc_freq.shape[0])
+                idf = self._compute_idf(doc_freq, len(new_metadata))
+                row_norms = np.concatenate([self._compute_row_norms(block, idf) for block in new_counts])
+            
+            with self._lock:
+                current = self.segments[:len(snapshot)]
+                if len(current) != len(snapshot) or any(a is not b for a, b in zip(current, snapshot)):
+                    for segment in written:
+                        shutil.rmtree(segment.path, ignore_errors=True)
+                    logger.info("压缩期间分段已变化，放弃本次压缩")
+                    return False
+                
+                # 快照之后新增的分段：只把这部分追加到新结构中
+                tail_start = sum(segment.n_docs for segment in snapshot)
+                tail_metadata = self.metadata[tail_start:]
+                tail_postings = self.postings_blocks[len(snapshot):]
+                new_start = len(new_metadata)
+                for block in tail_postings:
+                    keyword_index.add_block(new_start, block)
+                    new_start += block.n_docs
+                columns.append(tail_metadata)
+                tail_deleted = self.deleted[tail_start:]
+                self._index_sources(len(new_metadata), tail_metadata,
+                                    tail_deleted if tail_deleted.any() else None, source_index)
+                
+                segments = new_segments + self.segments[len(snapshot):]
+                reclaimed = tail_start - len(new_metadata)
+                # 全局行号已变化，整体替换而不是原地修改，正在执行的查询仍使用旧快照
+                self._replace_segments(segments)
+                new_metadata.extend(tail_metadata)
+                self.metadata = new_metadata
+                self.postings_blocks = new_postings + tail_postings
+                self.keyword_index = keyword_index
+                self.columns = columns
+                self._use_source_index(source_index)
+                if count_blocks is not None:
+                    tail_counts = self.count_blocks[len(snapshot):]
+                    if not new_counts and not tail_counts:
+                        self._reset_index()
+                    elif not new_counts:
+                        self.count_blocks = tail_counts
+                        self.doc_freq = np.zeros(self.doc_freq.shape[0], dtype=np.float64)
+                        for block in tail_counts:
+                            self.doc_freq += np.bincount(block.indices, minlength=self.doc_freq.shape[0])
+                        self._apply_reweight()
+                    else:
+                        self.count_blocks = new_counts
+                        self.doc_freq = doc_freq
+                        self.idf = idf
+                        self.idf_file = None
+                        self.row_norms = row_norms
+                        self.idf_stale = False
+                        self.docs_since_reweight = 0
+                        # 快照之后新增的文档与增量添加一样按当前IDF计算范数（已计入重建阈值，不再重复计入）
+                        for block in tail_counts:
+                            self._apply_new_counts(block, count_towards_refit=False)
+                
+                self.storage.commit(self.segments, self._index_info())
+                self._bump_generation()
+                self.storage.garbage_collect()
+        
+        logger.info(f"压缩完成，回收 {reclaimed} 个已删除文档块，剩余 {len(self.documents)} 个")
+        return True
+    
+    def _compact_loop(self):
+        try:
+            self.compact()
+        except Exception as e:
+            logger.error(f"后台压缩失败: {e}")
+    
+    def _maybe_schedule_compaction(self):
+        """已删除文档块占比超过阈值时启动后台压缩线程"""
+        if self.read_only:
+            return
+        if not self.documents or self.n_deleted <= self.compaction_threshold * len(self.documents):
+            return
+        if self._compact_thread is not None and self._compact_thread.is_alive():
+            return
+        self._compact_thread = threading.Thread(target=self._compact_loop, name="segment-compact", daemon=True)
+        self._compact_thread.start()
     
     def delete_collection(self):
         """删除集合"""
+        self._check_writable()
         try:
-            if self.documents_file.exists():
-                self.documents_file.unlink()
-            if self.vectors_file.exists():
-                self.vectors_file.unlink()
-            if self.metadata_file.exists():
-                self.metadata_file.unlink()
-            
-            self.documents = []
-            self.vectors = None
-            self.metadata = []
-            self.is_fitted = False
+            with self._lock:
+                self.storage.clear()
+                if self.documents_file.exists():
+                    self.documents_file.unlink()
+                if self.vectors_file.exists():
+                    self.vectors_file.unlink()
+                if self.metadata_file.exists():
+                    self.metadata_file.unlink()
+                shutil.rmtree(self.legacy_index_dir, ignore_errors=True)
+                
+                self._replace_segments([])
+                self.metadata = []
+                self.postings_blocks = []
+                # 替换而不是原地清空，进行中的检索仍使用旧的倒排索引
+                self.keyword_index = InvertedIndex()
+                self.columns.clear()
+                self._rebuild_source_index()
+                self.stats = CollectionStats()
+                self._reset_index()
+                self._bump_generation()
             
             logger.info("集合已删除")
         except Exception as e:
             logger.error(f"删除集合失败: {e}")
 
 class LinguisticKnowledgeBase:
-    def __init__(self, db_path: str = "./knowledge_db", openai_api_key: str = None):
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, openai_api_key: str = None, read_only: bool = False):
         """
         初始化语言学知识库
         
         Args:
             db_path: 知识库路径
             openai_api_key: OpenAI API密钥（仅用于embedding模型）
+            read_only: 只读副本（多进程服务中的读进程），通过 reload_if_changed 跟随写进程提交的新代数
         """
         self.db_path = db_path
+        self.read_only = read_only
         
         # 统一使用轻量级存储方案
-        self.collection = LightweightDocumentStore(db_path)
-        logger.info("使用轻量级文档存储方案")
+        if read_only:
+            self.collection = LightweightDocumentStore.open_read_only(db_path)
+            logger.info("使用轻量级文档存储方案（只读副本）")
+        else:
+            self.collection = LightweightDocumentStore(db_path)
+            logger.info("使用轻量级文档存储方案")
+        
+        # 检索结果缓存，SEARCH_CACHE_SIZE=0 时禁用
+        self.search_cache = SearchCache(int(os.getenv("SEARCH_CACHE_SIZE", "256")))
+        
+        # PDF提取结果缓存，清空知识库时保留，重建时免去重新解析；EXTRACTION_CACHE_MAX_MB=0 时禁用
+        self.extraction_cache = ExtractionCache(Path(db_path) / "extraction_cache", EXTRACTION_CACHE_VERSION)
         
         # Embedding模型选择
         if openai_api_key:
@@ -364,12 +1487,8 @@ class LinguisticKnowledgeBase:
             self.embedding_method = "轻量级 TF-IDF"
             logger.info("使用轻量级 TF-IDF embedding 模型")
         
-        # 文本分割器
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
-        )
+        # 文本分割器（与PDF流式切块使用相同参数）
+        self.text_splitter = make_text_splitter()
         
         logger.info(f"知识库初始化完成，路径: {db_path}")
         logger.info(f"Embedding方法: {self.embedding_method}")
@@ -377,62 +1496,71 @@ class LinguisticKnowledgeBase:
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         """从PDF文件中提取文本"""
         try:
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                text = ""
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-                return text
+            return extract_pdf_text(pdf_path)
         except Exception as e:
             logger.error(f"提取PDF文本失败 {pdf_path}: {e}")
             return ""
     
+    def extract_chunks_from_pdf(self, pdf_path: str, content_hash: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """按页流式提取并切块，返回 {"chunks", "pages", "characters"}，失败返回 None；给定内容哈希时使用提取缓存"""
+        try:
+            cached = self.extraction_cache.get(content_hash)
+            if cached is not None:
+                return cached
+            result = extract_pdf_chunks(pdf_path)
+            self.extraction_cache.put(content_hash, result)
+            return result
+        except Exception as e:
+            logger.error(f"提取PDF文本失败 {pdf_path}: {e}")
+            return None
+    
     def process_csv_data(self, csv_path: str, collection_name: str = None) -> List[Dict]:
-        """处理CSV数据，转换为文档格式"""
+        """处理CSV数据，转换为文档格式（一次返回全部行，大文件请用 ingest_csv 分块导入）"""
         try:
-            df = pd.read_csv(csv_path)
             documents = []
-            
-            # 将每行数据转换为文档
-            for idx, row in df.iterrows():
-                # 创建文档内容
-                content = f"数据记录 {idx + 1}:\n"
-                for col, value in row.items():
-                    if pd.notna(value):
-                        content += f"{col}: {value}\n"
-                
-                # 清理元数据，确保所有值都是基本类型
-                clean_metadata = {
-                    "source": csv_path,
-                    "type": "csv_data",
-                    "row_index": idx,
-                    "columns": str(list(df.columns))  # 转换为字符串
-                }
-                
-                # 添加行数据，但确保值是基本类型
-                for col, value in row.items():
-                    if pd.notna(value):
-                        # 处理不同类型的值
-                        if isinstance(value, (list, tuple)):
-                            clean_metadata[f"{col}_list"] = str(value)
-                        elif isinstance(value, dict):
-                            clean_metadata[f"{col}_dict"] = str(value)
-                        elif isinstance(value, (int, float, str, bool)) or value is None:
-                            clean_metadata[col] = value
-                        else:
-                            # 其他类型转换为字符串
-                            clean_metadata[col] = str(value)
-                
-                documents.append({
-                    "content": content,
-                    "metadata": clean_metadata
-                })
-            
+            for chunk in iter_csv_documents(csv_path):
+                documents.extend(chunk)
             return documents
         except Exception as e:
             logger.error(f"处理CSV数据失败 {csv_path}: {e}")
             return []
     
+    def ingest_csv(self, csv_path: str, content_hash: Optional[str] = None, chunk_rows: int = CSV_CHUNK_ROWS) -> Dict:
+        """
+        分块读取CSV并逐块写入索引，返回 add_documents 的汇总并附带 "rows"（已写入的行数）。
+        给定内容哈希时先按哈希去重（内容已入库时不读取CSV），同一路径的旧数据（内容已变化、未记录哈希，
+        或上次导入中断留下的部分行）整体替换；内容哈希只随最后一块写入，导入完成前该来源不会被当作已处理。
+        未给定内容哈希时第一块按来源去重，后续块追加到同一来源
+        """
+        summary = {"added_chunks": 0, "skipped_duplicates": [], "reindexed": [], "rows": 0}
+        if content_hash:
+            probe = {"metadata": {"source": csv_path, "content_hash": content_hash}}
+            if not self._resolve_content_changes([probe], summary, replace=True):
+                return summary
+        
+        chunks = iter_csv_documents(csv_path, chunk_rows)
+        documents = next(chunks, None)
+        first = True
+        while documents is not None:
+            # 预读下一块以判断当前块是否为最后一块
+            next_documents = next(chunks, None)
+            if content_hash and next_documents is None:
+                for doc in documents:
+                    doc["metadata"]["content_hash"] = content_hash
+            result = self.add_documents(documents, append=bool(content_hash) or not first)
+            summary["skipped_duplicates"].extend(result["skipped_duplicates"])
+            summary["reindexed"].extend(result["reindexed"])
+            if result["added_chunks"]:
+                summary["added_chunks"] += result["added_chunks"]
+                summary["rows"] += len(documents)
+            elif first:
+                break
+            documents = next_documents
+            first = False
+        
+        logger.info(f"CSV导入完成: {csv_path}，共 {summary['rows']} 行")
+        return summary
+    
     def _clean_metadata(self, metadata: Dict) -> Dict:
         """清理元数据，确保所有值都是基本类型"""
         clean_metadata = {}
@@ -454,39 +1582,169 @@ class LinguisticKnowledgeBase:
         
         return clean_metadata
 
-    def add_documents(self, documents: List[Dict], collection_name: str = None):
-        """添加文档到向量数据库"""
+    def find_source_by_hash(self, content_hash: str) -> Optional[str]:
+        """查找内容相同（哈希一致）的已入库源文件"""
+        return self.collection.get_source_by_hash(content_hash)
+    
+    def drop_superseded_source(self, source: Optional[str], existing_source: str) -> int:
+        """
+        source 的新内容与另一路径已入库的内容相同而被跳过时，删除 source 旧内容的文档块，
+        否则修改前的内容会一直留在检索结果中；返回删除的文档块数
+        """
+        if not source or source == existing_source or not self.collection.check_document_exists(source):
+            return 0
+        deleted = self.collection.delete_source(source)["deleted_chunks"]
+        logger.info(f"文档内容已变化且与 {existing_source} 相同，删除旧文档块: {source} ({deleted} 个)")
+        return deleted
+    
+    def _resolve_content_changes(self, documents: List[Dict], summary: Dict, replace: bool = False) -> List[Dict]:
+        """
+        按元数据中的 content_hash 去重：内容已入库（任意路径）的文档跳过，
+        其路径下旧内容的文档块随之删除；
+        同一路径但内容已变化的文档先删除旧的文档块，再按新内容重新索引；
+        旧数据没有记录哈希时无法判断是否变化，只有 replace=True 时才替换
+        """
+        resolved = []
+        for doc in documents:
+            metadata = doc.get("metadata", {})
+            content_hash = metadata.get("content_hash")
+            source = metadata.get("source")
+            if not content_hash:
+                resolved.append(doc)
+                continue
+            
+            existing = self.collection.get_source_by_hash(content_hash)
+            if existing:
+                logger.info(f"内容相同的文档已存在，跳过: {source} (已有: {existing})")
+                removed = self.drop_superseded_source(source, existing)
+                summary["skipped_duplicates"].append({"source": source, "existing_source": existing,
+                                                      "removed_chunks": removed})
+                continue
+            
+            old_hash = self.collection.get_source_hash(source) if source else None
+            if old_hash:
+                changed = old_hash != content_hash
+            else:
+                changed = replace and bool(source) and self.collection.check_document_exists(source)
+            if changed:
+                logger.info(f"文档内容已变化，重新索引: {source}")
+                self.collection.delete_source(source)
+                summary["reindexed"].append(source)
+            resolved.append(doc)
+        return resolved
+    
+    @staticmethod
+    def _locate_chunks(doc: Dict, chunks: List[Dict]) -> Tuple[str, List[Tuple[int, int]]]:
+        """
+        返回文档的整体文本以及每个文档块在其中的字符区间。
+        有原文时在原文中依次查找各块；按页切好的块没有原文，按块上的 char_start/char_end 拼回，
+        块之间被切分器去掉的空白以空格补齐；找不到或不一致的块追加到文本末尾。
+        拼回的文本是整篇文档的又一份拷贝，写入段后文档块只以偏移引用它
+        """
+        content = doc.get("content")
+        if content:
+            text = content
+            located = []
+            cursor = 0
+            for chunk in chunks:
+                start = text.find(chunk["content"], cursor)
+                if start < 0:
+                    located.append(None)
+                    continue
+                located.append((start, start + len(chunk["content"])))
+                cursor = start + 1
+        else:
+            pieces = []
+            position = 0
+            for chunk in sorted((c for c in chunks if "char_start" in c), key=lambda c: c["char_start"]):
+                start = chunk["char_start"]
+                if start > position:
+                    pieces.append(" " * (start - position))
+                    position = start
+                tail = chunk["content"][position - start:]
+                pieces.append(tail)
+                position += len(tail)
+            text = "".join(pieces)
+            located = []
+            for chunk in chunks:
+                start, end = chunk.get("char_start"), chunk.get("char_end")
+                if start is not None and text[start:end] == chunk["content"]:
+                    located.append((start, end))
+                else:
+                    located.append(None)
+        
+        if all(span is not None for span in located):
+            return text, located
+        pieces = [text]
+        length = len(text)
+        for i, (chunk, span) in enumerate(zip(chunks, located)):
+            if span is None:
+                pieces.append(chunk["content"])
+                located[i] = (length, length + len(chunk["content"]))
+                length += len(chunk["content"])
+        return "".join(pieces), located
+    
+    def add_documents(self, documents: List[Dict], collection_name: str = None, append: bool = False,
+                      replace: bool = False) -> Dict:
+        """
+        添加文档到向量数据库；返回 {"added_chunks", "skipped_duplicates", "reindexed"}。
+        元数据带 content_hash 的文档按内容去重，内容变化的同路径文档会被重新索引；
+        append=True 表示追加到已入库的同一来源（分批导入的后续批次），跳过去重；
+        replace=True 表示调用方已确认内容变化，旧数据中未记录哈希的同路径文档也会被替换
+        """
+        summary = {"added_chunks": 0, "skipped_duplicates": [], "reindexed": []}
         try:
             if not documents:
                 logger.warning("没有文档需要添加")
-                return
+                return summary
+            
+            if not append:
+                documents = self._resolve_content_changes(documents, summary, replace)
+            if not documents:
+                return summary
             
-            # 分割文档
+            # 分割文档；已按页切好的文档（"chunks"，见 pdf_extraction.chunk_pages）直接使用，
+            # 块上的偏移与页码写入元数据；每个文档的文本只保存一份，文档块以偏移表示
             all_chunks = []
+            texts = []
+            spans = []
             for doc in documents:
-                if not doc.get("content") or not doc["content"].strip():
+                if doc.get("chunks"):
+                    chunks = [chunk for chunk in doc["chunks"] if chunk["content"].strip()]
+                elif not doc.get("content") or not doc["content"].strip():
                     logger.warning(f"跳过空内容文档: {doc.get('metadata', {}).get('source', 'unknown')}")
                     continue
+                elif len(doc["content"]) <= CHUNK_SIZE:
+                    # 不超过一个块的短文档（如CSV行）无需切分
+                    chunks = [{"content": doc["content"].strip()}]
+                else:
+                    chunks = [{"content": chunk} for chunk in self.text_splitter.split_text(doc["content"])
+                              if chunk.strip()]  # 只添加非空块
+                if not chunks:
+                    continue
+                
+                text, chunk_spans = self._locate_chunks(doc, chunks)
+                spans.extend((len(texts), start, end) for start, end in chunk_spans)
+                texts.append(text)
                 
-                chunks = self.text_splitter.split_text(doc["content"])
                 for i, chunk in enumerate(chunks):
-                    if chunk.strip():  # 只添加非空块
-                        # 清理元数据
-                        clean_metadata = self._clean_metadata(doc["metadata"])
-                        clean_metadata.update({
-                            "chunk_index": i,
-                            "total_chunks": len(chunks),
-                            "chunk_size": len(chunk)
-                        })
-                        
-                        all_chunks.append({
-                            "content": chunk,
-                            "metadata": clean_metadata
-                        })
+                    # 清理元数据
+                    clean_metadata = self._clean_metadata(doc["metadata"])
+                    clean_metadata.update({key: value for key, value in chunk.items() if key != "content"})
+                    clean_metadata.update({
+                        "chunk_index": i,
+                        "total_chunks": len(chunks),
+                        "chunk_size": len(chunk["content"])
+                    })
+                    
+                    all_chunks.append({
+                        "content": chunk["content"],
+                        "metadata": clean_metadata
+                    })
             
             if not all_chunks:
                 logger.warning("所有文档块都为空，无法添加到知识库")
-                return
+                return summary
             
             # 生成唯一ID
             import uuid
@@ -494,19 +1752,22 @@ class LinguisticKnowledgeBase:
             
             # 添加到存储
             try:
-                self.collection.add(
+                added = self.collection.add(
                     documents=[chunk["content"] for chunk in all_chunks],
                     metadatas=[chunk["metadata"] for chunk in all_chunks],
-                    ids=chunk_ids
+                    ids=chunk_ids,
+                    append=append,
+                    texts=ChunkTexts.from_texts(texts, spans)
                 )
                 
-                logger.info(f"成功添加 {len(all_chunks)} 个文档块到知识库")
+                logger.info(f"成功添加 {added} 个文档块到知识库")
                 
-                # 记录添加的文档信息
-                for doc in documents:
-                    source = doc.get("metadata", {}).get("source", "unknown")
-                    file_type = doc.get("metadata", {}).get("file_type", "unknown")
-                    logger.info(f"文档已处理: {source} ({file_type})")
+                # 记录添加的文档信息（同一来源只记录一次）
+                for source in dict.fromkeys(doc.get("metadata", {}).get("source", "unknown") for doc in documents):
+                    logger.info(f"文档已处理: {source}")
+                
+                summary["added_chunks"] = added
+                return summary
                     
             except Exception as e:
                 logger.error(f"向存储添加文档失败: {e}")
@@ -516,48 +1777,163 @@ class LinguisticKnowledgeBase:
             logger.error(f"添加文档失败: {e}")
             raise Exception(f"文档处理失败: {str(e)}")
     
-    def search(self, query: str, n_results: int = 5) -> List[Dict]:
-        """搜索相关文档"""
+    @staticmethod
+    def _format_results(results: Dict, query_index: int) -> List[Dict]:
+        """把存储层的分组结果转换为单个查询的结果列表"""
+        formatted_results = []
+        documents = results["documents"][query_index] if len(results["documents"]) > query_index else []
+        metadatas = results["metadatas"][query_index] if len(results["metadatas"]) > query_index else []
+        distances = results["distances"][query_index] if len(results["distances"]) > query_index else []
+        for i, doc in enumerate(documents):
+            formatted_results.append({
+                "content": doc,
+                "metadata": metadatas[i] if i < len(metadatas) else {},
+                "distance": distances[i] if i < len(distances) else None
+            })
+        return formatted_results
+    
+    def search_with_info(self, query: str, n_results: int = 5, scorer: Optional[str] = None,
+                         filters: Optional[Dict[str, Any]] = None) -> Dict:
+        """
+        搜索相关文档，同时返回实际使用的打分方式与结果所属的 manifest 代数（各进程一致，用于分页游标）；
+        结果经过 LRU 缓存
+        """
+        key = make_cache_key(query, n_results, scorer or DEFAULT_SCORER, filters)
+        # 只读副本重新加载时会整体替换集合，本次查询固定使用同一个集合
+        collection = self.collection
+        generation = collection.index_generation
+        manifest_generation = collection.storage.generation
+        cached = self.search_cache.get(key, generation)
+        if cached is not None:
+            return {"results": [dict(r) for r in cached["results"]], "scorer": cached["scorer"],
+                    "generation": manifest_generation}
+        
         try:
             # 使用存储的查询方法
-            results = self.collection.query(
+            results = collection.query(
                 query_texts=[query],
-                n_results=n_results
+                n_results=n_results,
+                scorer=scorer,
+                filters=filters
             )
             
             # 格式化结果
-            formatted_results = []
-            if results["documents"] and results["documents"][0]:
-                for i, doc in enumerate(results["documents"][0]):
-                    formatted_results.append({
-                        "content": doc,
-                        "metadata": results["metadatas"][0][i] if results["metadatas"] and results["metadatas"][0] else {},
-                        "distance": results["distances"][0][i] if results["distances"] and results["distances"][0] else None
-                    })
-            
-            return formatted_results
+            entry = {"results": self._format_results(results, 0), "scorer": results.get("scorer")}
+            self.search_cache.put(key, entry, generation)
+            return {"results": [dict(r) for r in entry["results"]], "scorer": entry["scorer"],
+                    "generation": manifest_generation}
             
         except Exception as e:
             logger.error(f"搜索失败: {e}")
-            return []
+            return {"results": [], "scorer": None, "generation": manifest_generation}
     
-    def get_collection_info(self) -> Dict:
-        """获取集合信息"""
+    def search(self, query: str, n_results: int = 5, scorer: Optional[str] = None,
+               filters: Optional[Dict[str, Any]] = None) -> List[Dict]:
+        """搜索相关文档"""
+        return self.search_with_info(query, n_results, scorer, filters)["results"]
+    
+    def search_batch(self, queries: List[str], n_results: int = 5, scorer: Optional[str] = None,
+                     filters: Optional[Dict[str, Any]] = None) -> List[List[Dict]]:
+        """批量搜索，未命中缓存的查询在一次矩阵运算中完成，返回与查询一一对应的结果列表"""
+        return self.search_batch_with_info(queries, n_results, scorer, filters)["results"]
+    
+    def search_batch_with_info(self, queries: List[str], n_results: int = 5, scorer: Optional[str] = None,
+                               filters: Optional[Dict[str, Any]] = None) -> Dict:
+        """批量搜索，同时返回实际使用的打分方式"""
+        collection = self.collection
+        generation = collection.index_generation
+        keys = [make_cache_key(query, n_results, scorer or DEFAULT_SCORER, filters) for query in queries]
+        batch_results: List[Optional[List[Dict]]] = []
+        used_scorer = None
+        missing = []
+        for i, key in enumerate(keys):
+            cached = self.search_cache.get(key, generation)
+            batch_results.append(None if cached is None else [dict(r) for r in cached["results"]])
+            if cached is None:
+                missing.append(i)
+            elif used_scorer is None:
+                used_scorer = cached["scorer"]
+        
+        if not missing:
+            return {"results": batch_results, "scorer": used_scorer}
+        
+        try:
+            results = collection.query(
+                query_texts=[queries[i] for i in missing],
+                n_results=n_results,
+                scorer=scorer,
+                filters=filters
+            )
+            for j, i in enumerate(missing):
+                formatted = self._format_results(results, j)
+                self.search_cache.put(keys[i], {"results": formatted, "scorer": results.get("scorer")}, generation)
+                batch_results[i] = [dict(r) for r in formatted]
+            return {"results": batch_results, "scorer": results.get("scorer")}
+            
+        except Exception as e:
+            logger.error(f"批量搜索失败: {e}")
+            return {"results": [r if r is not None else [] for r in batch_results], "scorer": used_scorer}
+    
+    def search_many(self, requests: List[Dict[str, Any]]) -> List[Dict]:
+        """
+        多个查询各自指定结果数、打分方式与过滤条件：打分方式与过滤条件相同的查询归为一组，
+        每组一次向量化与矩阵运算（取组内最大的结果数，再按各查询截断）。
+        requests 的元素为 {"query", "n_results", "scorer", "filters"}，返回与之一一对应的 {"results", "scorer"}
+        """
+        groups: Dict[Tuple, List[int]] = {}
+        for i, spec in enumerate(requests):
+            group_key = make_cache_key("", 0, spec.get("scorer") or DEFAULT_SCORER, spec.get("filters"))[2:]
+            groups.setdefault(group_key, []).append(i)
+        
+        outputs: List[Optional[Dict]] = [None] * len(requests)
+        for indices in groups.values():
+            first = requests[indices[0]]
+            n_results = max(requests[i]["n_results"] for i in indices)
+            batch = self.search_batch_with_info(
+                [requests[i]["query"] for i in indices], n_results, first.get("scorer"), first.get("filters")
+            )
+            for j, i in enumerate(indices):
+                outputs[i] = {"results": batch["results"][j][:requests[i]["n_results"]], "scorer": batch["scorer"]}
+        return outputs
+    
+    def reload_if_changed(self) -> bool:
+        """
+        只读副本：写进程提交了新的 manifest 时重新打开分段（未变化的分段复用已加载的数据），
+        加载完成后整体替换集合，进行中的查询继续使用旧集合。返回是否重新加载
+        """
+        if not self.read_only or not self.collection.storage.manifest_changed():
+            return False
+        previous = self.collection
+        self.collection = LightweightDocumentStore.open_read_only(self.db_path, previous=previous)
+        logger.info(f"已切换到索引第 {self.collection.storage.generation} 代，文档数量: {self.collection.count()}")
+        return True
+    
+    def get_extraction_cache_stats(self) -> Dict:
+        """PDF提取缓存的命中统计"""
+        return self.extraction_cache.stats()
+    
+    def get_search_cache_stats(self) -> Dict:
+        """检索缓存的命中统计"""
+        return self.search_cache.stats()
+    
+    def get_collection_info(self, include_files: bool = True) -> Dict:
+        """获取集合信息（读取增量维护的统计）；include_files=False 时不返回逐个文件的信息"""
         try:
             total_chunks = self.collection.count()
             unique_sources = self.collection.count_unique_sources()
-            source_files_info = self.collection.get_source_files_info()
             
-            logger.info(f"获取集合信息: 文档块数量 = {total_chunks}, 唯一源文件数量 = {unique_sources}, 数据库路径 = {self.db_path}")
+            logger.debug(f"获取集合信息: 文档块数量 = {total_chunks}, 唯一源文件数量 = {unique_sources}, 数据库路径 = {self.db_path}")
             
-            return {
+            info = {
                 "total_documents": total_chunks,  # 文档块数量
                 "total_source_files": unique_sources,  # 实际PDF文档数量
-                "source_files_info": source_files_info,  # 源文件详细信息
                 "collection_name": "linguistic_knowledge",
                 "database_path": self.db_path,
                 "embedding_method": "OpenAI" if self.embedding_method == "OpenAI" else "轻量级 TF-IDF"
             }
+            if include_files:
+                info["source_files_info"] = self.collection.get_source_files_info()  # 源文件详细信息
+            return info
         except Exception as e:
             logger.error(f"获取集合信息失败: {e}")
             return {}
@@ -569,14 +1945,30 @@ class LinguisticKnowledgeBase:
             logger.info("集合已清空")
         except Exception as e:
             logger.error(f"清空集合失败: {e}")
+    
+    def delete_source(self, source: str) -> Dict:
+        """删除某个源文件（完整源路径或文件名）的全部文档块"""
+        result = self.collection.delete_source(source)
+        logger.info(f"删除源文件 {source}: {result['deleted_chunks']} 个文档块")
+        return result
+    
+    def optimize_index(self, full_refit: bool = False) -> Dict:
+        """维护索引：回收已删除的文档块，重算IDF权重，必要时重建词表"""
+        try:
+            result = self.collection.optimize_index(full_refit=full_refit)
+            logger.info(f"索引维护完成: {result}")
+            return result
+        except Exception as e:
+            logger.error(f"索引维护失败: {e}")
+            raise
 
 # 全局知识库实例
 knowledge_base = None
 
-def init_knowledge_base(openai_api_key: str = None):
+def init_knowledge_base(openai_api_key: str = None, read_only: bool = False):
     """初始化全局知识库实例"""
     global knowledge_base
-    knowledge_base = LinguisticKnowledgeBase(openai_api_key=openai_api_key)
+    knowledge_base = LinguisticKnowledgeBase(openai_api_key=openai_api_key, read_only=read_only)
     return knowledge_base
 
 def get_knowledge_base() -> LinguisticKnowledgeBase:
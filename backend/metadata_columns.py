@@ -0,0 +1,162 @@
+"""
+列式元数据与过滤条件
+常用过滤字段按列做字典编码（每行一个整数编码），过滤条件先在取值字典上求值，
+再用一次数组查表得到候选行掩码，检索只对候选行打分。
+每个分段保存一份自己的取值字典与编码矩阵，读取时内存映射
+"""
+
+import json
+import logging
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 支持过滤的元数据字段
+FILTERABLE_FIELDS = ("type", "file_type", "source", "filename", "authors", "publication_date")
+
+# 支持的比较操作：{"字段": {"gte": "2010", "contains": "Smith"}}
+FILTER_OPERATORS = ("eq", "in", "gt", "gte", "lt", "lte", "contains")
+
+# 编码 0 表示该行没有这个字段
+MISSING_CODE = 0
+
+# 分段中的列文件：取值字典（JSON）与编码矩阵（每个字段一行）
+COLUMN_VALUES_NAME = "columns.json"
+COLUMN_CODES_NAME = "columns.npy"
+
+
+def validate_filters(filters: Optional[Dict[str, Any]]):
+    """检查过滤条件的字段与操作是否受支持，不合法时抛出 ValueError"""
+    if not filters:
+        return
+    if not isinstance(filters, dict):
+        raise ValueError("过滤条件必须是对象")
+    for field, condition in filters.items():
+        if field not in FILTERABLE_FIELDS:
+            raise ValueError(f"不支持过滤的字段: {field}。支持的字段: {', '.join(FILTERABLE_FIELDS)}")
+        if isinstance(condition, dict):
+            unknown = [op for op in condition if op not in FILTER_OPERATORS]
+            if unknown:
+                raise ValueError(f"不支持的过滤操作: {', '.join(unknown)}。支持的操作: {', '.join(FILTER_OPERATORS)}")
+
+
+def _matches(value, condition) -> bool:
+    """判断一个取值是否满足条件；范围比较按字符串进行（日期使用 ISO 格式即可）"""
+    if isinstance(condition, list):
+        return value in condition
+    if not isinstance(condition, dict):
+        return value == condition
+
+    for op, expected in condition.items():
+        if op == "eq" and value != expected:
+            return False
+        if op == "in" and value not in expected:
+            return False
+        if op == "contains" and str(expected).lower() not in str(value).lower():
+            return False
+        if op in ("gt", "gte", "lt", "lte"):
+            left, right = str(value), str(expected)
+            if op == "gt" and not left > right:
+                return False
+            if op == "gte" and not left >= right:
+                return False
+            if op == "lt" and not left < right:
+                return False
+            if op == "lte" and not left <= right:
+                return False
+    return True
+
+
+class ColumnBlock:
+    """一段连续行（一个分段）的字典编码列：每个字段一份取值字典（下标即编码），编码矩阵每个字段一行"""
+
+    def __init__(self, fields, values: Dict[str, List[Any]], codes: np.ndarray):
+        self.fields = tuple(fields)
+        self.values = values
+        self.codes = codes
+
+    @property
+    def n_rows(self) -> int:
+        return int(self.codes.shape[1])
+
+    @classmethod
+    def build(cls, metadatas: List[Dict], fields=FILTERABLE_FIELDS) -> "ColumnBlock":
+        """对一批行做字典编码，代价与行数成正比"""
+        fields = tuple(fields)
+        values = {field: [None] for field in fields}
+        codes = np.zeros((len(fields), len(metadatas)), dtype=np.int32)
+        for i, field in enumerate(fields):
+            field_values = values[field]
+            lookup: Dict[Any, int] = {}
+            for row, meta in enumerate(metadatas):
+                value = meta.get(field)
+                if value is None:
+                    continue
+                code = lookup.get(value)
+                if code is None:
+                    code = lookup[value] = len(field_values)
+                    field_values.append(value)
+                codes[i, row] = code
+        return cls(fields, values, codes)
+
+    def save(self, directory: Path):
+        """取值不能序列化为JSON时抛出 TypeError/ValueError，由调用方决定是否跳过"""
+        data = json.dumps({"fields": list(self.fields), "values": self.values}, ensure_ascii=False)
+        with open(directory / COLUMN_VALUES_NAME, "w", encoding="utf-8") as f:
+            f.write(data)
+        np.save(directory / COLUMN_CODES_NAME, self.codes)
+
+    @classmethod
+    def load(cls, directory: Path, fields=FILTERABLE_FIELDS) -> Optional["ColumnBlock"]:
+        """内存映射编码矩阵；缺少列文件或字段与当前不一致时返回 None"""
+        if not (directory / COLUMN_VALUES_NAME).exists():
+            return None
+        with open(directory / COLUMN_VALUES_NAME, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if tuple(data["fields"]) != tuple(fields):
+            return None
+        return cls(fields, data["values"], np.load(directory / COLUMN_CODES_NAME, mmap_mode="r"))
+
+    def mask(self, filters: Dict[str, Any]) -> np.ndarray:
+        mask = np.ones(self.n_rows, dtype=bool)
+        for field, condition in filters.items():
+            values = self.values[field]
+            # 条件只在取值字典上求值，再通过查表作用到所有行
+            table = np.zeros(len(values), dtype=bool)
+            for code in range(1, len(values)):
+                table[code] = _matches(values[code], condition)
+            mask &= table[self.codes[self.fields.index(field)]]
+        return mask
+
+
+class MetadataColumns:
+    """按行号顺序排列的各分段元数据列"""
+
+    def __init__(self, fields=FILTERABLE_FIELDS):
+        self.fields = tuple(fields)
+        self.clear()
+
+    def clear(self):
+        self.blocks: List[ColumnBlock] = []
+        self.n_rows = 0
+
+    def append(self, metadatas: List[Dict]):
+        """为新增的行追加编码，代价与新增行数成正比"""
+        self.append_block(ColumnBlock.build(metadatas, self.fields))
+
+    def append_block(self, block: ColumnBlock):
+        """追加一个分段已编码的列"""
+        self.blocks.append(block)
+        self.n_rows += block.n_rows
+
+    def mask(self, filters: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """根据过滤条件生成候选行掩码；没有过滤条件时返回 None"""
+        if not filters:
+            return None
+        validate_filters(filters)
+        if not self.blocks:
+            return np.zeros(0, dtype=bool)
+        return np.concatenate([block.mask(filters) for block in self.blocks])
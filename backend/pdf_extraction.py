@@ -0,0 +1,208 @@
+"""
+PDF文本提取
+提取函数放在独立的轻量模块中，进程池的工作进程只需导入本模块（不加载知识库和索引）；
+按页流式读取并边读边切块，解析与切分过程中缓冲的文本只有单页加上一个小的切块窗口，
+每个文档块记录全局字符偏移与起止页码。
+切好的块仍按文档汇总成一个列表返回，其大小与整篇文本成正比（块之间有重叠，约为全文的 1.25 倍）：
+结果要从工作进程一次性传回，提取缓存按内容哈希整份保存，并且同一文档的所有块在一次写入中作为一个段提交，
+来源要么完整入库要么不入库，按内容哈希去重才不会把只写入一部分的来源当作已处理。
+批量任务通过 extract_pdfs 并行提取，结果按完成顺序交给唯一的索引写入方
+"""
+
+import asyncio
+import logging
+from bisect import bisect_right
+from typing import AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Any
+
+import PyPDF2
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from executors import get_process_pool, run_in_process, run_in_thread, PDF_EXTRACT_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# 文档块大小与重叠，知识库的文本切分器使用同一组参数
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+# 切块窗口：缓冲的文本达到该长度时切分一次，最后一块留到下一轮与后续页面一起切分
+CHUNK_WINDOW = CHUNK_SIZE * 8
+
+# 提取器版本：提取或切块逻辑变化时递增，使提取缓存失效
+EXTRACTOR_VERSION = 1
+# 提取缓存的版本键，包含影响切块结果的参数
+EXTRACTION_CACHE_VERSION = f"v{EXTRACTOR_VERSION}-c{CHUNK_SIZE}-o{CHUNK_OVERLAP}"
+
+
+def make_text_splitter() -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        length_function=len,
+    )
+
+
+def iter_pdf_pages(pdf_path: str) -> Iterator[Tuple[int, str]]:
+    """逐页产出 (页码, 文本)，页码从1开始；页面按需解析，不会一次读入整本书的文本"""
+    with open(pdf_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        for page_number, page in enumerate(pdf_reader.pages, start=1):
+            yield page_number, page.extract_text() or ""
+
+
+def extract_pdf_text(pdf_path: str) -> str:
+    """从PDF文件中提取全部文本（每页以换行结尾），失败时抛出异常"""
+    return "".join(text + "\n" for _, text in iter_pdf_pages(pdf_path))
+
+
+def chunk_pages(pages: Iterable[Tuple[int, str]], splitter: Optional[RecursiveCharacterTextSplitter] = None,
+                window: int = CHUNK_WINDOW) -> Iterator[Dict[str, Any]]:
+    """
+    把逐页文本边读边切块，产出 {"content", "char_start", "char_end", "page_start", "page_end"}。
+    偏移是在整篇文本（每页以换行结尾）中的全局字符位置；每次切分窗口时最后一块不输出，
+    而是与后续页面一起重新切分，因此块边界与整篇切分基本一致，不会在窗口边界处截断
+    """
+    splitter = splitter or make_text_splitter()
+    page_starts: List[int] = []
+    page_numbers: List[int] = []
+    buffer = ""
+    buffer_start = 0
+    total = 0
+
+    def page_of(position: int) -> int:
+        return page_numbers[max(0, bisect_right(page_starts, position) - 1)]
+
+    def flush(final: bool):
+        nonlocal buffer, buffer_start
+        chunks = [chunk for chunk in splitter.split_text(buffer) if chunk.strip()]
+        located = []
+        cursor = 0
+        for chunk in chunks:
+            local = buffer.find(chunk, cursor)
+            if local < 0:
+                local = cursor
+            located.append((local, chunk))
+            cursor = local + 1
+        if not final:
+            if len(located) < 2:
+                return
+            # 最后一块可能在窗口边界处被截断，留待下一轮
+            carry_start = located[-1][0]
+            located = located[:-1]
+        for local, chunk in located:
+            start = buffer_start + local
+            end = start + len(chunk)
+            yield {
+                "content": chunk,
+                "char_start": start,
+                "char_end": end,
+                "page_start": page_of(start),
+                "page_end": page_of(end - 1),
+            }
+        if not final:
+            buffer = buffer[carry_start:]
+            buffer_start += carry_start
+
+    for page_number, text in pages:
+        text += "\n"
+        page_starts.append(total)
+        page_numbers.append(page_number)
+        total += len(text)
+        buffer += text
+        if len(buffer) >= window:
+            yield from flush(final=False)
+    if buffer.strip():
+        yield from flush(final=True)
+
+
+def extract_pdf_chunks(pdf_path: str) -> Dict[str, Any]:
+    """
+    流式提取并切块，返回 {"chunks": [...], "pages": 页数, "characters": 字符数}。
+    逐页读取与切分只缓冲单页加切块窗口，但整个文档的块会汇总到 chunks 中（原因见模块说明）
+    """
+    stats = {"pages": 0, "characters": 0}
+
+    def pages():
+        for page_number, text in iter_pdf_pages(pdf_path):
+            stats["pages"] = page_number
+            stats["characters"] += len(text) + 1
+            yield page_number, text
+
+    chunks = list(chunk_pages(pages()))
+    return {"chunks": chunks, **stats}
+
+
+def _extract_worker(pdf_path: str) -> Tuple[str, Optional[Dict[str, Any]], Optional[str]]:
+    """工作进程入口：返回 (路径, 切块结果, 错误信息)，异常转为错误信息以便逐个文件汇报"""
+    try:
+        return pdf_path, extract_pdf_chunks(pdf_path), None
+    except Exception as e:
+        return pdf_path, None, str(e)
+
+
+async def extract_pdf_chunks_async(pdf_path: str, content_hash: Optional[str] = None,
+                                   cache=None) -> Optional[Dict[str, Any]]:
+    """
+    在进程池中流式提取并切块单个PDF，失败时记录日志并返回 None；
+    给定内容哈希与提取缓存（ExtractionCache）时优先使用缓存，提取成功后写入缓存
+    """
+    if cache is not None and content_hash:
+        cached = await run_in_thread("io", cache.get, content_hash)
+        if cached is not None:
+            return cached
+
+    _, result, error = await run_in_process("extract", _extract_worker, pdf_path)
+    if error:
+        logger.error(f"提取PDF文本失败 {pdf_path}: {error}")
+    elif cache is not None and content_hash:
+        await run_in_thread("io", cache.put, content_hash, result)
+    return result
+
+
+async def extract_pdfs(paths: List[str], max_workers: Optional[int] = None,
+                       is_cancelled: Callable[[], bool] = lambda: False,
+                       content_hashes: Optional[Dict[str, str]] = None, cache=None
+                       ) -> AsyncIterator[Tuple[str, Optional[Dict[str, Any]], Optional[str]]]:
+    """
+    在共享进程池中并行提取并切块PDF，按完成顺序逐个产出 (路径, 切块结果, 错误信息)。
+    同时在途的文件数限制为进程数的两倍，避免写入方较慢时堆积大量已提取的文本；
+    is_cancelled 返回 True 后不再提交新文件，已排队的文件被取消。
+    给定 content_hashes（路径 -> 内容哈希）与提取缓存时，命中缓存的文件直接产出，不进入进程池
+    """
+    max_workers = max(1, max_workers or PDF_EXTRACT_WORKERS)
+    loop = asyncio.get_running_loop()
+    content_hashes = content_hashes or {}
+
+    misses = []
+    for path in paths:
+        if is_cancelled():
+            return
+        cached = None
+        if cache is not None and content_hashes.get(path):
+            cached = await run_in_thread("io", cache.get, content_hashes[path])
+        if cached is None:
+            misses.append(path)
+        else:
+            yield path, cached, None
+
+    pending_paths = list(reversed(misses))
+    in_flight = set()
+
+    executor = get_process_pool()
+    try:
+        while pending_paths or in_flight:
+            while pending_paths and len(in_flight) < max_workers * 2 and not is_cancelled():
+                in_flight.add(loop.run_in_executor(executor, _extract_worker, pending_paths.pop()))
+            if not in_flight:
+                break
+
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                path, result, error = future.result()
+                if error is None and cache is not None and content_hashes.get(path):
+                    await run_in_thread("io", cache.put, content_hashes[path], result)
+                yield path, result, error
+    finally:
+        # 取消尚未开始的提取，进程池由执行层统一管理
+        for future in in_flight:
+            future.cancel()
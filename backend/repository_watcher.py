@@ -0,0 +1,180 @@
+"""
+repository 目录监视
+保存目录中PDF文件的 (修改时间, 大小, 内容哈希) 快照，定期（或在文件系统事件触发时）重新扫描并与快照比较，
+只把新增、内容变化和已删除的文件交给知识库处理；修改时间与大小未变的文件沿用快照中的哈希，不重新读取。
+安装了 watchfiles 时使用系统文件事件（Linux 上为 inotify）触发扫描，否则按固定间隔轮询
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from segment_store import atomic_write_bytes
+from executors import run_in_thread
+
+try:
+    from watchfiles import awatch
+    WATCHFILES_AVAILABLE = True
+except ImportError:
+    WATCHFILES_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# 是否启用目录监视
+WATCH_REPOSITORY = os.getenv("WATCH_REPOSITORY", "true").lower() == "true"
+# 轮询间隔（秒）；使用文件事件时作为兜底的全量扫描间隔
+WATCH_POLL_INTERVAL = float(os.getenv("WATCH_POLL_INTERVAL", "10"))
+# 最近这段时间内仍在修改的文件视为正在写入，留到下次扫描
+WATCH_SETTLE_SECONDS = float(os.getenv("WATCH_SETTLE_SECONDS", "2"))
+
+
+class RepositoryWatcher:
+    """
+    目录快照比较器；on_changes(changed, deleted) 负责把变化应用到知识库，
+    changed 为 路径 -> {"hash": 新内容哈希, "previous_hash": 快照中的旧哈希（新文件为 None）}，
+    返回 False 表示暂时无法处理（如上一批仍在导入），快照保持不变，下次扫描重新比较
+    """
+
+    def __init__(self, directory: Path, snapshot_path: Path,
+                 on_changes: Callable[[Dict[str, Dict[str, Optional[str]]], List[str]], Awaitable[bool]],
+                 hash_file: Callable[[str], str], poll_interval: float = WATCH_POLL_INTERVAL):
+        self.directory = Path(directory)
+        self.snapshot_path = Path(snapshot_path)
+        self.on_changes = on_changes
+        self.hash_file = hash_file
+        self.poll_interval = poll_interval
+        self.mode = "watchfiles" if WATCHFILES_AVAILABLE else "polling"
+        # 路径 -> {"mtime_ns", "size", "hash"}
+        self.snapshot: Dict[str, Dict[str, Any]] = self._load_snapshot()
+        self._task: Optional[asyncio.Task] = None
+        self._stop: Optional[asyncio.Event] = None
+        self._scan_lock: Optional[asyncio.Lock] = None
+        self.last_scan: Optional[float] = None
+        self.last_changes: Dict[str, int] = {"changed": 0, "deleted": 0}
+        self.scans = 0
+
+    def _load_snapshot(self) -> Dict[str, Dict[str, Any]]:
+        if not self.snapshot_path.exists():
+            return {}
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"读取目录快照失败 {self.snapshot_path}: {e}")
+            return {}
+
+    def _save_snapshot(self, snapshot: Dict[str, Dict[str, Any]]):
+        atomic_write_bytes(self.snapshot_path, json.dumps(snapshot, ensure_ascii=False).encode("utf-8"))
+
+    def _stat_files(self) -> Dict[str, os.stat_result]:
+        """列出目录下的PDF文件及其状态（路径写法与批量任务一致）"""
+        files = {}
+        if not self.directory.exists():
+            return files
+        for path in self.directory.rglob("*.pdf"):
+            try:
+                files[str(path)] = path.stat()
+            except OSError:
+                continue
+        return files
+
+    def _build_snapshot(self) -> Dict[str, Any]:
+        """
+        扫描目录并与旧快照比较，返回新快照以及内容变化（新增或哈希不同，附新旧哈希）和已删除的文件；
+        正在写入的文件不计入新快照
+        """
+        now = time.time()
+        snapshot, changed = {}, {}
+        for path, stat in self._stat_files().items():
+            previous = self.snapshot.get(path)
+            if previous and previous["mtime_ns"] == stat.st_mtime_ns and previous["size"] == stat.st_size:
+                snapshot[path] = previous
+                continue
+            if now - stat.st_mtime < WATCH_SETTLE_SECONDS:
+                if previous:
+                    snapshot[path] = previous
+                continue
+            try:
+                content_hash = self.hash_file(path)
+            except OSError:
+                continue
+            snapshot[path] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "hash": content_hash}
+            if not previous or previous["hash"] != content_hash:
+                changed[path] = {"hash": content_hash, "previous_hash": previous["hash"] if previous else None}
+        deleted = [path for path in self.snapshot if path not in snapshot]
+        return {"snapshot": snapshot, "changed": dict(sorted(changed.items())), "deleted": sorted(deleted)}
+
+    async def scan(self) -> Dict[str, int]:
+        """扫描一次并应用变化，返回本次变化的文件数"""
+        if self._scan_lock is None:
+            self._scan_lock = asyncio.Lock()
+        async with self._scan_lock:
+            result = await run_in_thread("io", self._build_snapshot)
+            self.scans += 1
+            self.last_scan = time.time()
+            changes = {"changed": len(result["changed"]), "deleted": len(result["deleted"])}
+            if result["changed"] or result["deleted"]:
+                logger.info(f"repository 目录变化: {changes['changed']} 个新增或修改，{changes['deleted']} 个删除")
+                if not await self.on_changes(result["changed"], result["deleted"]):
+                    return {"changed": 0, "deleted": 0}
+                self.last_changes = changes
+            if result["snapshot"] != self.snapshot:
+                self.snapshot = result["snapshot"]
+                await run_in_thread("io", self._save_snapshot, self.snapshot)
+            return changes
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._stop = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+            logger.info(f"开始监视 repository 目录（{self.mode}）: {self.directory}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._stop.set()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while not self._stop.is_set():
+            try:
+                await self.scan()
+            except Exception as e:
+                logger.error(f"扫描 repository 目录失败: {e}")
+            await self._wait_for_change()
+
+    async def _wait_for_change(self):
+        """等待文件事件或轮询间隔；文件事件之后稍等片刻，合并连续的写入"""
+        if self.mode == "watchfiles" and self.directory.exists():
+            try:
+                async for _ in awatch(self.directory, stop_event=self._stop,
+                                      rust_timeout=int(self.poll_interval * 1000), yield_on_timeout=True):
+                    await asyncio.sleep(WATCH_SETTLE_SECONDS)
+                    return
+            except Exception as e:
+                logger.warning(f"文件事件监视失败，改为轮询: {e}")
+                self.mode = "polling"
+        try:
+            await asyncio.wait_for(self._stop.wait(), timeout=self.poll_interval)
+        except asyncio.TimeoutError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self._task is not None and not self._task.done(),
+            "mode": self.mode,
+            "directory": str(self.directory),
+            "files": len(self.snapshot),
+            "scans": self.scans,
+            "last_scan": self.last_scan,
+            "last_changes": self.last_changes,
+            "poll_interval": self.poll_interval,
+        }
@@ -0,0 +1,92 @@
+"""
+检索结果缓存
+LRU 缓存，键为 (规范化查询, 结果数, 打分方式, 过滤条件)；
+索引每次变更都会递增代数，代数变化时整个缓存失效
+"""
+
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+def make_cache_key(query: str, n_results: int, scorer: Optional[str],
+                   filters: Optional[Dict[str, Any]]) -> Tuple:
+    """规范化查询（小写、合并空白）并与其他参数组成缓存键"""
+    normalized = " ".join(query.lower().split())
+    filters_key = json.dumps(filters, sort_keys=True, ensure_ascii=False, default=str) if filters else ""
+    return normalized, int(n_results), scorer or "", filters_key
+
+
+class SearchCache:
+    """按索引代数失效的 LRU 检索缓存，线程安全"""
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple, Any]" = OrderedDict()
+        self._generation: Optional[int] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def _check_generation(self, generation: int):
+        """索引代数变化时清空缓存（调用方持有锁）"""
+        if self._generation != generation:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._generation = generation
+
+    def get(self, key: Tuple, generation: int):
+        """命中时返回缓存值并移到最近使用端，未命中返回 None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._check_generation(generation)
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Tuple, value: Any, generation: int):
+        """写入缓存；若结果计算期间索引已变更则丢弃"""
+        if not self.enabled:
+            return
+        with self._lock:
+            # 代数单调递增，比缓存当前代数旧的结果已过期
+            if self._generation is not None and generation < self._generation:
+                return
+            self._check_generation(generation)
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "generation": self._generation,
+            }
@@ -0,0 +1,197 @@
+"""
+检索响应整形
+按需把完整文档块换成命中词附近的高亮片段、只返回指定的元数据字段，
+深层结果分页用的不透明游标（绑定索引代数），以及批量检索中跨查询的文档块去重；不指定这些参数时响应与原来一致
+"""
+
+import re
+import json
+import base64
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from inverted_index import tokenize
+from search_cache import make_cache_key
+
+# 片段长度上下限（字符）
+MIN_SNIPPET_CHARS = 40
+MAX_SNIPPET_CHARS = 2000
+# 片段起点在第一个命中词之前保留的上下文比例
+SNIPPET_LEADING_CONTEXT = 0.25
+# 片段边界向空白处对齐时最多移动的字符数
+SNIPPET_BOUNDARY_SLACK = 20
+ELLIPSIS = "…"
+# 分页检索一次取回的页数，见 page_fetch_size
+PAGE_PREFETCH = 4
+
+
+def highlight_terms(query: str) -> List[str]:
+    """需要高亮的查询词（与关键词检索一致：优先使用长度大于2的词）"""
+    tokens = tokenize(query)
+    words = [word for word in tokens if len(word) > 2] or tokens
+    return list(dict.fromkeys(words))
+
+
+def compile_highlighter(terms: List[str]) -> Optional["re.Pattern"]:
+    """匹配以查询词开头的词（与关键词检索的前缀匹配一致），长词优先"""
+    if not terms:
+        return None
+    alternatives = "|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True))
+    return re.compile(rf"\b(?:{alternatives})\w*", re.IGNORECASE)
+
+
+def _snap_start(text: str, start: int) -> int:
+    """片段起点后移到词边界"""
+    if start <= 0:
+        return 0
+    space = text.find(" ", start, start + SNIPPET_BOUNDARY_SLACK)
+    return space + 1 if space != -1 else start
+
+
+def _snap_end(text: str, end: int) -> int:
+    """片段终点前移到词边界"""
+    if end >= len(text):
+        return len(text)
+    space = text.rfind(" ", end - SNIPPET_BOUNDARY_SLACK, end)
+    return space if space != -1 else end
+
+
+def make_snippet(text: str, pattern: Optional["re.Pattern"], max_chars: int) -> Tuple[str, List[List[int]]]:
+    """
+    选取命中词最密集的一段（不超过 max_chars 个字符）作为片段，
+    返回 (片段, 高亮区间)，区间为片段内的 [起, 止) 字符下标；没有命中时取开头
+    """
+    matches = [m.span() for m in pattern.finditer(text)] if pattern is not None else []
+    if matches:
+        # 双指针找出窗口内命中数最多的起始命中
+        best, best_count, j = 0, 0, 0
+        for i, (start, _) in enumerate(matches):
+            j = max(j, i)
+            while j < len(matches) and matches[j][1] <= start + max_chars:
+                j += 1
+            if j - i > best_count:
+                best, best_count = i, j - i
+        start = max(0, matches[best][0] - int(max_chars * SNIPPET_LEADING_CONTEXT))
+    else:
+        start = 0
+    end = min(len(text), start + max_chars)
+    start = max(0, end - max_chars)
+    start, end = _snap_start(text, start), _snap_end(text, end)
+
+    prefix = ELLIPSIS if start > 0 else ""
+    suffix = ELLIPSIS if end < len(text) else ""
+    shift = len(prefix) - start
+    highlights = [[s + shift, e + shift] for s, e in matches if s >= start and e <= end]
+    return prefix + text[start:end] + suffix, highlights
+
+
+def project_metadata(metadata: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+    """只保留指定字段；fields 为 None 时原样返回"""
+    if fields is None:
+        return metadata
+    return {field: metadata[field] for field in fields if field in metadata}
+
+
+def _shape_result(result: Dict[str, Any], pattern: Optional["re.Pattern"], snippet_chars: Optional[int],
+                  fields: Optional[List[str]], exclude: Tuple[str, ...] = ()) -> Dict[str, Any]:
+    item = {key: value for key, value in result.items() if key not in ("content", "metadata") + exclude}
+    content = result.get("content") or ""
+    if snippet_chars is None:
+        item["content"] = content
+    else:
+        item["snippet"], item["highlights"] = make_snippet(content, pattern, snippet_chars)
+        item["content_length"] = len(content)
+    item["metadata"] = project_metadata(result.get("metadata") or {}, fields)
+    return item
+
+
+def shape_results(results: List[Dict[str, Any]], query: str, snippet_chars: Optional[int] = None,
+                  fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    按请求整形检索结果：指定 snippet_chars 时用高亮片段（snippet/highlights/content_length）代替完整内容，
+    指定 fields 时只返回这些元数据字段
+    """
+    if snippet_chars is None and fields is None:
+        return results
+    pattern = compile_highlighter(highlight_terms(query)) if snippet_chars is not None else None
+    return [_shape_result(result, pattern, snippet_chars, fields) for result in results]
+
+
+def chunk_identity(result: Dict[str, Any]) -> Tuple[str, str]:
+    """文档块的标识：来源与内容都相同的结果视为同一个文档块"""
+    return (result.get("metadata") or {}).get("source") or "", result.get("content") or ""
+
+
+def merge_batch_results(queries: List[str], grouped: List[List[Dict[str, Any]]],
+                        snippet_chars: Optional[int] = None,
+                        fields: Optional[List[str]] = None) -> Tuple[List[Dict[str, Any]], List[List[Dict[str, Any]]]]:
+    """
+    合并多个查询的结果，多个查询命中的同一文档块只返回一次。
+    返回 (文档块列表, 每个查询的命中列表)，命中为 {"chunk": 文档块下标, "distance": 距离}，按相关性排序；
+    指定 snippet_chars 时，片段按第一个命中该文档块的查询截取
+    """
+    positions: Dict[Tuple[str, str], int] = {}
+    chunks: List[Dict[str, Any]] = []
+    hits: List[List[Dict[str, Any]]] = []
+    patterns: Dict[int, Optional["re.Pattern"]] = {}
+    for q, results in enumerate(grouped):
+        query_hits = []
+        for result in results:
+            key = chunk_identity(result)
+            position = positions.get(key)
+            if position is None:
+                if snippet_chars is not None and q not in patterns:
+                    patterns[q] = compile_highlighter(highlight_terms(queries[q]))
+                position = positions[key] = len(chunks)
+                chunks.append(_shape_result(result, patterns.get(q), snippet_chars, fields, exclude=("distance",)))
+            query_hits.append({"chunk": position, "distance": result.get("distance")})
+        hits.append(query_hits)
+    return chunks, hits
+
+
+class StaleCursorError(ValueError):
+    """游标产生之后索引已经更新，按新的结果顺序翻页会重复或遗漏结果"""
+
+
+def query_fingerprint(query: str, scorer: Optional[str], filters: Optional[Dict[str, Any]]) -> str:
+    """查询的指纹，游标只能用于产生它的同一查询"""
+    key = make_cache_key(query, 0, scorer, filters)
+    return hashlib.sha1(json.dumps(key, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+
+def page_fetch_size(offset: int, n_results: int) -> int:
+    """
+    分页检索时一次取回的结果数：按 PAGE_PREFETCH 页对齐向上取整，并多取一条用于判断是否还有下一页。
+    同一窗口内的后续页使用相同的检索参数，直接命中同一代数的检索缓存，不再重新检索
+    """
+    window = PAGE_PREFETCH * n_results
+    return -(-(offset + n_results + 1) // window) * window
+
+
+def encode_cursor(fingerprint: str, offset: int, generation: int) -> str:
+    """游标记录查询指纹、下一页的起始位置，以及产生它的索引代数"""
+    payload = json.dumps({"q": fingerprint, "o": offset, "g": generation}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, fingerprint: str) -> Tuple[int, int]:
+    """解析游标得到 (下一页的起始位置, 索引代数)；游标无效或属于其他查询时抛出 ValueError"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        offset = int(payload["o"])
+        generation = int(payload["g"])
+        cursor_fingerprint = payload["q"]
+    except Exception:
+        raise ValueError("无效的分页游标")
+    if cursor_fingerprint != fingerprint or offset < 0:
+        raise ValueError("分页游标与当前查询不匹配")
+    return offset, generation
+
+
+def check_cursor_generation(cursor_generation: int, generation: int):
+    """游标所属的索引代数与本次检索不同时抛出 StaleCursorError"""
+    if cursor_generation != generation:
+        raise StaleCursorError(
+            f"索引已更新（游标属于第 {cursor_generation} 代，当前为第 {generation} 代），请不带游标重新检索"
+        )
@@ -0,0 +1,624 @@
+"""
+追加式分段存储
+每次写入生成一个不可变分段（文本、元数据、元数据列、词频矩阵、倒排表各自成文件），
+由一个很小的 manifest.json 原子提交；未被 manifest 引用的分段视为未完成写入。
+除元数据外的数组文件都以内存映射方式读取，多个只读进程共享同一份页缓存
+"""
+
+import os
+import re
+import mmap
+import json
+import pickle
+import shutil
+import logging
+import threading
+from contextlib import contextmanager
+from bisect import bisect_right
+from pathlib import Path
+from typing import List, Dict, Any, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+from inverted_index import PostingsBlock
+from metadata_columns import ColumnBlock, COLUMN_VALUES_NAME, COLUMN_CODES_NAME
+
+try:
+    import scipy.sparse as sp
+    SCIPY_AVAILABLE = True
+except ImportError:
+    SCIPY_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# 存储格式版本，格式变化时递增
+SEGMENT_FORMAT_VERSION = 1
+
+MANIFEST_NAME = "manifest.json"
+SEGMENTS_DIR_NAME = "segments"
+
+# 分段文本格式：旧分段每个文档块一个字符串（documents.pkl），
+# 新分段每个源文档只存一份文本（text.bin），文档块以偏移表示
+TEXT_FORMAT_BLOBS = "blobs"
+TEXT_ENCODING = "utf-8"
+# PDF提取的文本可能含有孤立代理字符，原样往返
+TEXT_ERRORS = "surrogatepass"
+
+VOCABULARY_NAME_FORMAT = "vocabulary_{:06d}.json"
+IDF_NAME_FORMAT = "idf_{:06d}.npy"
+# 分段目录、墓碑、词表与IDF文件名中的编号（均由同一个计数器分配）
+FILE_ID_PATTERN = re.compile(r"_(\d+)(?:\.|$)")
+
+
+def atomic_write_bytes(path: Path, data: bytes):
+    """先写临时文件并落盘，再用 os.replace 原子替换"""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(path.parent)
+
+
+def atomic_write_json(path: Path, data: Any):
+    """原子写入JSON文件"""
+    atomic_write_bytes(path, json.dumps(data, ensure_ascii=False, indent=1).encode("utf-8"))
+
+
+def _fsync_file(path: Path):
+    """已写入的文件内容落盘"""
+    fd = os.open(path, os.O_RDWR)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _fsync_dir(directory: Path):
+    """目录项落盘（Windows 不支持对目录 fsync，忽略即可）"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class ChunkTexts:
+    """
+    文档块文本的偏移表示：每个源文档一份UTF-8文本（blob），每个文档块是
+    (blob编号, 起始字节, 结束字节)，重叠切块的文本不再重复保存
+    """
+
+    def __init__(self, blobs: List[bytes], spans: np.ndarray):
+        self.blobs = blobs
+        self.spans = np.asarray(spans, dtype=np.int64).reshape(-1, 3)
+
+    def __len__(self):
+        return len(self.spans)
+
+    def __getitem__(self, index: int) -> str:
+        blob, start, end = self.spans[index]
+        return self.blobs[blob][start:end].decode(TEXT_ENCODING, TEXT_ERRORS)
+
+    def __iter__(self):
+        for i in range(len(self.spans)):
+            yield self[i]
+
+    @classmethod
+    def from_documents(cls, documents: Iterable[str]) -> "ChunkTexts":
+        """每个文档块单独作为一份文本（无重叠可共享的文档，如CSV行、旧分段）"""
+        blobs = [doc.encode(TEXT_ENCODING, TEXT_ERRORS) for doc in documents]
+        spans = np.zeros((len(blobs), 3), dtype=np.int64)
+        spans[:, 0] = np.arange(len(blobs))
+        spans[:, 2] = [len(blob) for blob in blobs]
+        return cls(blobs, spans)
+
+    @classmethod
+    def from_texts(cls, texts: List[str], char_spans: List[Tuple[int, int, int]]) -> "ChunkTexts":
+        """由源文档文本与字符偏移 (文本编号, 起始字符, 结束字符) 构建，字符偏移换算为字节偏移"""
+        blobs = [text.encode(TEXT_ENCODING, TEXT_ERRORS) for text in texts]
+        positions_by_blob: Dict[int, set] = {}
+        for blob, start, end in char_spans:
+            positions_by_blob.setdefault(blob, set()).update((start, end))
+
+        byte_offsets: List[Optional[Dict[int, int]]] = []
+        for i, text in enumerate(texts):
+            if len(blobs[i]) == len(text):
+                # 纯ASCII文本，字符偏移即字节偏移
+                byte_offsets.append(None)
+                continue
+            positions = sorted(positions_by_blob.get(i, ()))
+            mapping, previous, position_bytes = {}, 0, 0
+            for position in positions:
+                position_bytes += len(text[previous:position].encode(TEXT_ENCODING, TEXT_ERRORS))
+                mapping[position] = position_bytes
+                previous = position
+            byte_offsets.append(mapping)
+
+        spans = np.empty((len(char_spans), 3), dtype=np.int64)
+        for row, (blob, start, end) in enumerate(char_spans):
+            mapping = byte_offsets[blob]
+            spans[row] = (blob, start, end) if mapping is None else (blob, mapping[start], mapping[end])
+        return cls(blobs, spans)
+
+    @classmethod
+    def concat(cls, parts: List["ChunkTexts"]) -> "ChunkTexts":
+        blobs: List[bytes] = []
+        spans = []
+        for part in parts:
+            shifted = part.spans.copy()
+            shifted[:, 0] += len(blobs)
+            blobs.extend(part.blobs)
+            spans.append(shifted)
+        return cls(blobs, np.concatenate(spans) if spans else np.zeros((0, 3), dtype=np.int64))
+
+    def take(self, rows) -> "ChunkTexts":
+        """选取部分文档块，不再被引用的文本随之丢弃"""
+        spans = self.spans[np.asarray(rows, dtype=np.int64)]
+        used, remapped = np.unique(spans[:, 0], return_inverse=True)
+        spans = spans.copy()
+        spans[:, 0] = remapped
+        return ChunkTexts([self.blobs[i] for i in used], spans)
+
+
+class SegmentTexts(Sequence):
+    """新格式分段的文档块文本：内存映射 text.bin，按下标访问时才解码对应的字节区间"""
+
+    def __init__(self, path: Path):
+        self._spans = np.load(path / "spans.npy", mmap_mode="r")
+        with open(path / "text.bin", "rb") as f:
+            # 空文件不能映射
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+
+    def __len__(self):
+        return len(self._spans)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        _, start, end = self._spans[index]
+        return self._data[start:end].decode(TEXT_ENCODING, TEXT_ERRORS)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class Segment:
+    """一个不可变分段，文本按需加载，词频矩阵以内存映射方式读取"""
+
+    def __init__(self, path: Path, info: Dict[str, Any]):
+        self.path = path
+        self.info = info
+        self.name = info["name"]
+        self.n_docs = int(info["n_docs"])
+        self._documents: Optional[Sequence[str]] = None
+        self._deleted: Optional[np.ndarray] = None
+
+    @property
+    def has_counts(self) -> bool:
+        return self.info.get("counts_shape") is not None
+
+    @property
+    def has_postings(self) -> bool:
+        return bool(self.info.get("has_postings"))
+
+    @property
+    def has_columns(self) -> bool:
+        return bool(self.info.get("has_columns"))
+
+    @property
+    def merged_from(self) -> List[str]:
+        """按顺序合并而成的分段名（行的内容与顺序不变，如合并小分段、全量重建）"""
+        return self.info.get("merged_from", [])
+
+    @property
+    def vocabulary_id(self) -> Optional[int]:
+        return self.info.get("vocabulary_id")
+
+    @property
+    def tombstones_file(self) -> Optional[str]:
+        return self.info.get("tombstones")
+    
+    @property
+    def deleted_mask(self) -> np.ndarray:
+        """已标记删除（墓碑）的行掩码，长度为分段文档数"""
+        if self._deleted is None:
+            mask = np.zeros(self.n_docs, dtype=bool)
+            if self.tombstones_file:
+                mask[np.load(self.path.parent / self.tombstones_file)] = True
+            self._deleted = mask
+        return self._deleted
+    
+    @property
+    def n_deleted(self) -> int:
+        return int(self.info.get("n_deleted", 0))
+    
+    @property
+    def text_format(self) -> Optional[str]:
+        return self.info.get("text_format")
+
+    @property
+    def documents(self) -> Sequence[str]:
+        """首次访问时才打开文本；新格式按偏移逐块解码，旧格式整体加载 documents.pkl"""
+        if self._documents is None:
+            if self.text_format == TEXT_FORMAT_BLOBS:
+                self._documents = SegmentTexts(self.path)
+            else:
+                with open(self.path / "documents.pkl", "rb") as f:
+                    self._documents = pickle.load(f)
+        return self._documents
+
+    def load_texts(self) -> ChunkTexts:
+        """读取偏移表示的全部文本（用于合并、压缩等重写分段的操作）"""
+        if self.text_format != TEXT_FORMAT_BLOBS:
+            return ChunkTexts.from_documents(self.documents)
+        with open(self.path / "text.bin", "rb") as f:
+            data = f.read()
+        offsets = np.load(self.path / "blobs.npy")
+        spans = np.load(self.path / "spans.npy")
+        blobs = [data[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+        spans[:, 1:] -= offsets[spans[:, 0]][:, None]
+        return ChunkTexts(blobs, spans)
+
+    @property
+    def documents_loaded(self) -> bool:
+        return self._documents is not None
+
+    def open_texts(self) -> Sequence[str]:
+        """立即打开文本（只读副本使用，之后文件被删除也不影响已打开的映射）"""
+        return self.documents
+
+    def adopt_texts(self, other: "Segment"):
+        """复用同名分段已打开的文本（分段内容不可变）"""
+        self._documents = other._documents
+
+    def load_metadata(self) -> List[Dict]:
+        with open(self.path / "metadata.pkl", "rb") as f:
+            return pickle.load(f)
+
+    def load_columns(self) -> Optional[ColumnBlock]:
+        """以内存映射加载该分段的元数据列；旧分段没有列文件时返回 None"""
+        if not self.has_columns:
+            return None
+        return ColumnBlock.load(self.path)
+
+    def load_postings(self):
+        """加载该分段的倒排表（新格式内存映射）"""
+        if not self.has_postings:
+            return None
+        return PostingsBlock.load(self.path)
+
+    def load_counts(self):
+        """以只读内存映射加载CSR词频矩阵"""
+        if not self.has_counts:
+            return None
+        return sp.csr_matrix(
+            (
+                np.load(self.path / "counts_data.npy", mmap_mode="r"),
+                np.load(self.path / "counts_indices.npy", mmap_mode="r"),
+                np.load(self.path / "counts_indptr.npy", mmap_mode="r"),
+            ),
+            shape=tuple(self.info["counts_shape"]),
+            copy=False,
+        )
+
+
+class LazyDocumentList(Sequence):
+    """跨分段的只读文档序列，按下标访问时才加载对应分段的文本"""
+
+    def __init__(self, segments: List[Segment]):
+        self._segments = segments
+        self._offsets = []
+        total = 0
+        for segment in segments:
+            self._offsets.append(total)
+            total += segment.n_docs
+        self._total = total
+
+    def __len__(self):
+        return self._total
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._total))]
+        if index < 0:
+            index += self._total
+        if index < 0 or index >= self._total:
+            raise IndexError("document index out of range")
+        seg_idx = bisect_right(self._offsets, index) - 1
+        return self._segments[seg_idx].documents[index - self._offsets[seg_idx]]
+
+    def __iter__(self):
+        for segment in self._segments:
+            yield from segment.documents
+
+
+class WriteScope:
+    """一次进行中的写入：本次分配编号的下限，以及正在读取的已提交分段（垃圾回收时都予以保留）"""
+
+    def __init__(self, floor: int, lock: threading.Lock):
+        self.floor = floor
+        self.pinned: set = set()
+        self._lock = lock
+
+    def pin(self, segments: Iterable[Segment]):
+        """保留作为输入读取的分段；应在取分段快照的同一临界区内调用，之后替换它们的提交也不会清理其文件"""
+        names = set()
+        for segment in segments:
+            names.add(segment.name)
+            if segment.tombstones_file:
+                names.add(segment.tombstones_file)
+        with self._lock:
+            self.pinned |= names
+
+
+class SegmentStorage:
+    """分段存储的磁盘布局与 manifest 管理"""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.segments_dir = self.root / SEGMENTS_DIR_NAME
+        self.manifest_file = self.root / MANIFEST_NAME
+        self.segments_dir.mkdir(parents=True, exist_ok=True)
+        # 先记录 manifest 的文件状态再读取，读取期间被替换时下次检查仍会发现变化
+        self._manifest_stat = self._stat_manifest()
+        self.manifest = self._read_manifest()
+        # 分段编号独立于 manifest 副本分配，避免并发写入（如后台合并）复用编号
+        self._id_lock = threading.Lock()
+        self._next_segment_id = int(self.manifest["next_segment_id"])
+        # 进行中的写入（写分段到提交之间），垃圾回收不清理其分配的文件与读取中的分段
+        self._write_scopes: List[WriteScope] = []
+
+    def _empty_manifest(self) -> Dict[str, Any]:
+        return {
+            "format_version": SEGMENT_FORMAT_VERSION,
+            "generation": 0,
+            "next_segment_id": 1,
+            "segments": [],
+            "index": {},
+        }
+
+    def _read_manifest(self) -> Dict[str, Any]:
+        if not self.manifest_file.exists():
+            return self._empty_manifest()
+        try:
+            with open(self.manifest_file, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("format_version") != SEGMENT_FORMAT_VERSION:
+                logger.warning(f"分段存储版本不匹配: {manifest.get('format_version')}")
+                return self._empty_manifest()
+            return manifest
+        except Exception as e:
+            logger.error(f"读取manifest失败 {self.manifest_file}: {e}")
+            return self._empty_manifest()
+
+    def _stat_manifest(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.manifest_file)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def manifest_changed(self) -> bool:
+        """manifest 是否已被其他进程替换（原子替换会改变 inode）；只读副本据此判断是否需要重新加载"""
+        return self._stat_manifest() != self._manifest_stat
+
+    @property
+    def exists(self) -> bool:
+        return self.manifest_file.exists()
+
+    @property
+    def generation(self) -> int:
+        return int(self.manifest.get("generation", 0))
+
+    @property
+    def index_info(self) -> Dict[str, Any]:
+        return self.manifest.get("index", {})
+
+    @property
+    def stats_info(self) -> Dict[str, Any]:
+        return self.manifest.get("stats", {})
+
+    def open_segments(self) -> List[Segment]:
+        """按 manifest 顺序打开所有已提交的分段"""
+        return [Segment(self.segments_dir / info["name"], info) for info in self.manifest["segments"]]
+
+    def allocate_id(self) -> int:
+        """分配一个新编号（分段、墓碑、词表与IDF文件共用）"""
+        with self._id_lock:
+            file_id = self._next_segment_id
+            self._next_segment_id += 1
+        return file_id
+
+    def allocate_file_id(self, name_format: str) -> int:
+        """为词表、IDF等文件分配编号；旧版本按代数命名这些文件，跳过已存在的同名文件"""
+        while True:
+            file_id = self.allocate_id()
+            if not (self.segments_dir / name_format.format(file_id)).exists():
+                return file_id
+
+    @contextmanager
+    def writing(self):
+        """
+        标记一次进行中的写入：从写分段（或词表、墓碑）到提交 manifest 之间，
+        其他操作触发的垃圾回收不会清理本次写入分配的文件，以及通过 scope.pin 登记的输入分段；
+        未提交的文件在写入结束后的回收中清理
+        """
+        with self._id_lock:
+            scope = WriteScope(self._next_segment_id, self._id_lock)
+            self._write_scopes.append(scope)
+        try:
+            yield scope
+        finally:
+            with self._id_lock:
+                self._write_scopes.remove(scope)
+
+    def write_segment(self, texts: ChunkTexts, metadatas: List[Dict], counts=None,
+                      vocabulary_id: Optional[int] = None, postings: Optional[PostingsBlock] = None,
+                      merged_from: Optional[List[Segment]] = None) -> Segment:
+        """
+        写入一个新分段（尚未提交），先写入临时目录再重命名；
+        文本写入 text.bin（每个源文档一份），文档块的绝对字节区间写入 spans.npy；
+        merged_from 为按顺序原样合并的输入分段，只读副本据此复用这些行已加载的数据；
+        所有文件与目录落盘后才返回，之后提交的 manifest 不会指向不完整的分段。
+        调用方应在 writing() 中写入并提交，否则提交前可能被并发的垃圾回收清理
+        """
+        name = f"seg_{self.allocate_id():06d}"
+        tmp_path = self.segments_dir / f"{name}.tmp"
+        final_path = self.segments_dir / name
+
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        tmp_path.mkdir()
+        offsets = np.zeros(len(texts.blobs) + 1, dtype=np.int64)
+        with open(tmp_path / "text.bin", "wb") as f:
+            for i, blob in enumerate(texts.blobs):
+                f.write(blob)
+                offsets[i + 1] = offsets[i] + len(blob)
+        spans = texts.spans.copy()
+        spans[:, 1:] += offsets[spans[:, 0]][:, None]
+        np.save(tmp_path / "blobs.npy", offsets)
+        np.save(tmp_path / "spans.npy", spans)
+        with open(tmp_path / "metadata.pkl", "wb") as f:
+            pickle.dump(list(metadatas), f)
+
+        info: Dict[str, Any] = {"name": name, "n_docs": len(texts), "counts_shape": None,
+                                "vocabulary_id": None, "has_postings": postings is not None,
+                                "text_format": TEXT_FORMAT_BLOBS, "n_blobs": len(texts.blobs)}
+        try:
+            ColumnBlock.build(metadatas).save(tmp_path)
+            info["has_columns"] = True
+        except (TypeError, ValueError) as e:
+            # 未清理的旧元数据可能含有不能序列化的取值，加载时改为从元数据编码
+            logger.warning(f"元数据列无法保存，将在加载时重新编码: {e}")
+            for leftover in (tmp_path / COLUMN_VALUES_NAME, tmp_path / COLUMN_CODES_NAME):
+                leftover.unlink(missing_ok=True)
+        if merged_from:
+            info["merged_from"] = [segment.name for segment in merged_from]
+        if postings is not None:
+            postings.save(tmp_path)
+            info["total_tokens"] = postings.total_tokens
+        if counts is not None:
+            np.save(tmp_path / "counts_data.npy", counts.data)
+            np.save(tmp_path / "counts_indices.npy", counts.indices)
+            np.save(tmp_path / "counts_indptr.npy", counts.indptr)
+            info["counts_shape"] = list(counts.shape)
+            info["vocabulary_id"] = vocabulary_id
+
+        for entry in tmp_path.iterdir():
+            _fsync_file(entry)
+        _fsync_dir(tmp_path)
+        shutil.rmtree(final_path, ignore_errors=True)
+        tmp_path.rename(final_path)
+        _fsync_dir(self.segments_dir)
+
+        return Segment(final_path, info)
+
+    def with_tombstones(self, segment: Segment, deleted_mask: np.ndarray) -> Segment:
+        """
+        返回带有新墓碑集合的分段对象（尚未提交）；分段文件本身不变，
+        墓碑以单独的行号文件保存，旧的墓碑文件在提交后由垃圾回收清理
+        """
+        info = dict(segment.info)
+        info.pop("tombstones", None)
+        info["n_deleted"] = int(deleted_mask.sum())
+        if info["n_deleted"]:
+            info["tombstones"] = f"tombstones_{self.allocate_id():06d}.npy"
+            with open(self.segments_dir / info["tombstones"], "wb") as f:
+                np.save(f, np.flatnonzero(deleted_mask).astype(np.int32))
+                f.flush()
+                os.fsync(f.fileno())
+            _fsync_dir(self.segments_dir)
+        
+        updated = Segment(segment.path, info)
+        updated._documents = segment._documents
+        updated._deleted = np.array(deleted_mask, dtype=bool)
+        return updated
+    
+    def commit(self, segments: List[Segment], index_info: Optional[Dict[str, Any]] = None,
+               stats: Optional[Dict[str, Any]] = None) -> int:
+        """原子提交新的分段列表，返回新的代数；index_info / stats 为 None 时沿用上一代的值"""
+        manifest = dict(self.manifest)
+        with self._id_lock:
+            manifest["next_segment_id"] = self._next_segment_id
+        manifest["segments"] = [segment.info for segment in segments]
+        if index_info is not None:
+            manifest["index"] = index_info
+        if stats is not None:
+            manifest["stats"] = stats
+        manifest["generation"] = self.generation + 1
+        atomic_write_json(self.manifest_file, manifest)
+        self.manifest = manifest
+        return manifest["generation"]
+
+    def save_vocabulary(self, vocabulary_id: int, vocabulary: Dict[str, int]):
+        path = self.segments_dir / VOCABULARY_NAME_FORMAT.format(vocabulary_id)
+        atomic_write_bytes(path, json.dumps({term: int(col) for term, col in vocabulary.items()},
+                                            ensure_ascii=False).encode("utf-8"))
+
+    def load_vocabulary(self, vocabulary_id: int) -> Dict[str, int]:
+        with open(self.segments_dir / VOCABULARY_NAME_FORMAT.format(vocabulary_id), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_array(self, name: str, array):
+        """保存小型索引数组（如IDF），文件名应包含代数以避免覆盖已提交版本"""
+        with open(self.segments_dir / name, "wb") as f:
+            np.save(f, array)
+            f.flush()
+            os.fsync(f.fileno())
+        _fsync_dir(self.segments_dir)
+
+    def load_array(self, name: str):
+        return np.load(self.segments_dir / name)
+
+    def garbage_collect(self):
+        """
+        清理未被 manifest 引用的分段目录与索引文件（中断写入或合并后的残留）；
+        进行中的写入分配的文件（编号不小于最早的写入下限）及其读取中的分段留待下次清理
+        """
+        referenced = {info["name"] for info in self.manifest["segments"]}
+        referenced.update(info["tombstones"] for info in self.manifest["segments"] if info.get("tombstones"))
+        index_info = self.index_info
+        if index_info.get("vocabulary_id") is not None:
+            referenced.add(VOCABULARY_NAME_FORMAT.format(int(index_info["vocabulary_id"])))
+        if index_info.get("idf_file"):
+            referenced.add(index_info["idf_file"])
+
+        with self._id_lock:
+            floor = min(scope.floor for scope in self._write_scopes) if self._write_scopes else None
+            for scope in self._write_scopes:
+                referenced |= scope.pinned
+
+        for entry in self.segments_dir.iterdir():
+            if entry.name in referenced:
+                continue
+            if floor is not None:
+                match = FILE_ID_PATTERN.search(entry.name)
+                if match and int(match.group(1)) >= floor:
+                    continue
+            try:
+                if entry.is_dir():
+                    shutil.rmtree(entry)
+                else:
+                    entry.unlink()
+            except OSError as e:
+                # Windows 下被内存映射的文件无法删除，留待下次清理
+                logger.debug(f"暂时无法删除 {entry}: {e}")
+
+    def clear(self):
+        """先提交一个空的 manifest，再删除所有分段；代数继续递增，按代数判断的状态（如分页游标）不会与清空前混淆"""
+        manifest = self._empty_manifest()
+        with self._id_lock:
+            # 编号继续递增，避免仍在进行的后台写入与新分段重名
+            manifest["next_segment_id"] = self._next_segment_id
+        manifest["generation"] = self.generation + 1
+        atomic_write_json(self.manifest_file, manifest)
+        self.manifest = manifest
+        shutil.rmtree(self.segments_dir, ignore_errors=True)
+        self.segments_dir.mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,179 @@
+"""
+多进程服务
+同一个知识库目录只有一个写进程：它负责导入、删除与索引维护，每次修改都以新的 manifest 代数原子提交；
+其余工作进程为只读副本，内存映射已提交的分段，发现 manifest 被替换后在后台加载新代数并整体切换。
+写进程由知识库目录下 writer.lock 的文件锁选出；只读副本把写入类请求转发给 WRITER_URL。
+文本、词频矩阵、倒排表与元数据列通过页缓存在进程间共享；元数据字典、源索引、墓碑掩码与行范数
+仍由每个副本各自加载（追加、删除与合并后增量更新，压缩或清空后整体重新加载）
+"""
+
+import os
+import asyncio
+import logging
+from pathlib import Path
+from typing import Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+
+from executors import run_in_thread
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+ROLE_WRITER = "writer"
+ROLE_READER = "reader"
+
+# auto：抢到写锁的进程为写进程，其余为只读副本；writer / reader：指定角色（指定 writer 但锁已被占用时降为只读）
+SERVING_ROLE = os.getenv("SERVING_ROLE", "auto").lower()
+# 写进程地址，只读副本把写入类请求转发到这里；未配置时这类请求返回 503
+WRITER_URL = os.getenv("WRITER_URL", "").rstrip("/")
+# 只读副本检查 manifest 是否更新的间隔（秒）
+INDEX_REFRESH_INTERVAL = float(os.getenv("INDEX_REFRESH_INTERVAL", "1"))
+# 转发到写进程的请求超时（秒），上传与导入可能较慢
+WRITER_PROXY_TIMEOUT = float(os.getenv("WRITER_PROXY_TIMEOUT", "600"))
+
+# 只读副本自己处理的接口，其余 /api 请求转发给写进程
+READER_ROUTES = {
+    "/api/search",
+    "/api/search/batch",
+    "/api/status",
+    "/api/info",
+    "/api/progress",
+    "/api/health",
+    "/api/search-cache",
+}
+
+# 不应转发的逐跳头
+HOP_BY_HOP_HEADERS = {"host", "connection", "keep-alive", "transfer-encoding", "te", "trailer", "upgrade",
+                      "proxy-authorization", "proxy-authenticate"}
+
+
+class WriterLock:
+    """知识库目录下的排他文件锁，持有者为写进程；进程退出时由操作系统释放"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._file = None
+
+    def acquire(self) -> bool:
+        if not FCNTL_AVAILABLE:
+            # 无 fcntl 的平台（Windows）只支持单进程服务
+            logger.warning("当前平台不支持文件锁，按单进程写入方式运行")
+            return True
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        f = open(self.path, "a+")
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        f.seek(0)
+        f.truncate()
+        f.write(str(os.getpid()))
+        f.flush()
+        self._file = f
+        return True
+
+    def release(self):
+        if self._file is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+
+def elect_role(db_path: str) -> Tuple[str, Optional[WriterLock]]:
+    """确定本进程的角色，返回 (角色, 写锁)；只读副本不持有写锁"""
+    if SERVING_ROLE == ROLE_READER:
+        return ROLE_READER, None
+    lock = WriterLock(Path(db_path) / "writer.lock")
+    if lock.acquire():
+        return ROLE_WRITER, lock
+    if SERVING_ROLE == ROLE_WRITER:
+        logger.warning(f"知识库 {db_path} 已有写进程，本进程改为只读副本")
+    return ROLE_READER, None
+
+
+class IndexRefresher:
+    """只读副本的后台任务：定期检查 manifest，有新代数时在线程中加载并切换"""
+
+    def __init__(self, knowledge_base, interval: float = INDEX_REFRESH_INTERVAL):
+        self.knowledge_base = knowledge_base
+        self.interval = interval
+        self.reloads = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                if await run_in_thread("ingest", self.knowledge_base.reload_if_changed):
+                    self.reloads += 1
+            except Exception as e:
+                logger.error(f"加载新的索引代数失败: {e}")
+
+
+class WriterProxy:
+    """把请求原样（流式）转发给写进程"""
+
+    def __init__(self, base_url: str, timeout: float = WRITER_PROXY_TIMEOUT):
+        self.base_url = base_url
+        self._client = httpx.AsyncClient(timeout=timeout)
+
+    async def forward(self, request: Request):
+        url = self.base_url + request.url.path
+        if request.url.query:
+            url += "?" + request.url.query
+        headers = [(key, value) for key, value in request.headers.raw
+                   if key.decode("latin-1").lower() not in HOP_BY_HOP_HEADERS]
+        upstream_request = self._client.build_request(request.method, url, headers=headers,
+                                                      content=request.stream())
+        try:
+            upstream = await self._client.send(upstream_request, stream=True)
+        except httpx.HTTPError as e:
+            logger.error(f"转发请求到写进程失败 {request.url.path}: {e}")
+            return JSONResponse(status_code=503, content={"detail": f"写进程不可用: {e}"})
+        response_headers = {key: value for key, value in upstream.headers.items()
+                            if key.lower() not in HOP_BY_HOP_HEADERS}
+        return StreamingResponse(upstream.aiter_raw(), status_code=upstream.status_code,
+                                 headers=response_headers, background=BackgroundTask(upstream.aclose))
+
+    async def close(self):
+        await self._client.aclose()
+
+
+def make_writer_proxy() -> Optional[WriterProxy]:
+    """只读副本的写请求转发；未配置 WRITER_URL 或缺少 httpx 时返回 None"""
+    if not WRITER_URL:
+        return None
+    if not HTTPX_AVAILABLE:
+        logger.warning("httpx 未安装，只读副本无法转发写入请求")
+        return None
+    # 每个转发请求都会产生一条 httpx 日志
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    return WriterProxy(WRITER_URL)
@@ -6,6 +6,8 @@
 """
 
 import os
+import sys
+import subprocess
 import uvicorn
 from pathlib import Path
 from dotenv import load_dotenv
@@ -15,6 +17,17 @@ env_file = Path(__file__).parent / '.env'
 if env_file.exists():
     load_dotenv(env_file)
 
+def start_writer(log_level: str):
+    """启动独立的写进程（只监听本机），负责导入、任务队列、目录监视与索引维护"""
+    writer_port = int(os.getenv("WRITER_PORT", "8001"))
+    env = dict(os.environ, SERVING_ROLE="writer")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--host", "127.0.0.1",
+         "--port", str(writer_port), "--log-level", log_level],
+        env=env
+    )
+    return process, f"http://127.0.0.1:{writer_port}"
+
 def main():
     """主启动函数"""
     # 从环境变量获取配置
@@ -22,25 +35,54 @@ def main():
     port = int(os.getenv("PORT", "8000"))
     reload = os.getenv("RELOAD", "true").lower() == "true"
     log_level = os.getenv("LOG_LEVEL", "info")
+    # 只读工作进程数；大于1时另启一个写进程，工作进程内存映射共享同一份索引
+    workers = int(os.getenv("WORKERS", "1"))
+    if workers > 1 and reload:
+        print("⚠️  多工作进程模式不支持热重载，已关闭")
+        reload = False
     
     print(f"🚀 启动语言学知识库API服务器")
     print(f"📍 主机: {host}")
     print(f"🔌 端口: {port}")
     print(f"🔄 热重载: {reload}")
+    print(f"👥 工作进程: {workers}")
     print(f"📝 日志级别: {log_level}")
     print(f"🌍 环境: {os.getenv('ENVIRONMENT', 'development')}")
     print(f"🐍 使用: Python uvicorn")
     print(f"💡 提示: 也可以使用 'uv run uvicorn api:app --host {host} --port {port} --reload'")
     
-    # 启动服务器
-    uvicorn.run(
-        "api:app",
-        host=host,
-        port=port,
-        reload=reload,
-        log_level=log_level,
-        access_log=True
-    )
+    if workers <= 1:
+        # 启动服务器
+        uvicorn.run(
+            "api:app",
+            host=host,
+            port=port,
+            reload=reload,
+            log_level=log_level,
+            access_log=True
+        )
+        return
+    
+    # 多工作进程：一个写进程 + 若干只读副本，写入类请求由副本转发给写进程
+    writer, writer_url = start_writer(log_level)
+    print(f"✍️  写进程: {writer_url} (pid {writer.pid})")
+    os.environ["SERVING_ROLE"] = "reader"
+    os.environ["WRITER_URL"] = writer_url
+    try:
+        uvicorn.run(
+            "api:app",
+            host=host,
+            port=port,
+            workers=workers,
+            log_level=log_level,
+            access_log=True
+        )
+    finally:
+        writer.terminate()
+        try:
+            writer.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            writer.kill()
 
 if __name__ == "__main__":
     main()
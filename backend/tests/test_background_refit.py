@@ -0,0 +1,51 @@
+"""
+增量添加后的词表重建回归测试
+第一次添加确定词表，之后的添加只按旧词表分词；新增文档超过阈值后应在后台重建词表，
+新词才能被 TF-IDF 检索命中
+
+用法（在 backend 目录下）:
+    python -m unittest discover -s tests
+"""
+
+import sys
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from knowledge_base import LightweightDocumentStore  # noqa: E402
+
+
+class BackgroundRefitTest(unittest.TestCase):
+    def setUp(self):
+        self.db_path = tempfile.mkdtemp()
+        self.store = LightweightDocumentStore(self.db_path)
+        self.store.max_small_segments = 10 ** 6
+
+    def tearDown(self):
+        shutil.rmtree(self.db_path, ignore_errors=True)
+
+    def test_new_terms_become_searchable_after_adds(self):
+        store = self.store
+        store.add([f"phoneme inventory survey part {i}" for i in range(4)],
+                  [{"source": "/papers/first.pdf"} for _ in range(4)])
+        self.assertNotIn("ergativity", store.vectorizer.vocabulary_)
+
+        for paper in range(5):
+            store.add([f"ergativity and case marking, section {i}" for i in range(4)],
+                      [{"source": f"/papers/upload_{paper}.pdf"} for _ in range(4)])
+        if store._refit_thread is not None:
+            store._refit_thread.join()
+
+        self.assertFalse(store.needs_refit())
+        self.assertIn("ergativity", store.vectorizer.vocabulary_)
+        results = store.query(["ergativity"], 3, scorer="tfidf")
+        self.assertEqual(results["scorer"], "tfidf")
+        self.assertTrue(all(meta["source"].startswith("/papers/upload_") for meta in results["metadatas"][0]))
+        self.assertTrue(all(distance < 1.0 for distance in results["distances"][0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
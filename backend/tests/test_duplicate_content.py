@@ -0,0 +1,59 @@
+"""
+路径内容改成与其他已入库文件相同时的回归测试
+新内容按重复跳过，但该路径修改前的文档块应被删除，不能继续出现在检索结果中
+
+用法（在 backend 目录下）:
+    python -m unittest discover -s tests
+"""
+
+import sys
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from knowledge_base import LinguisticKnowledgeBase  # noqa: E402
+
+
+def document(source: str, content: str, content_hash: str):
+    return {"content": content, "metadata": {"source": source, "type": "txt", "content_hash": content_hash}}
+
+
+class DuplicateContentTest(unittest.TestCase):
+    def setUp(self):
+        self.db_path = tempfile.mkdtemp()
+        self.kb = LinguisticKnowledgeBase(db_path=self.db_path)
+        self.store = self.kb.collection
+        self.store.max_small_segments = 10 ** 6
+        self.store.compaction_threshold = 1.0
+        self.kb.add_documents([document("/corpus/x.txt", "ergativity in basque verbal morphology", "hx"),
+                               document("/corpus/y.txt", "vowel harmony in turkish suffixes", "hy")])
+
+    def tearDown(self):
+        if self.store._refit_thread is not None:
+            self.store._refit_thread.join()
+        shutil.rmtree(self.db_path, ignore_errors=True)
+
+    def test_modified_path_matching_other_source_drops_old_chunks(self):
+        summary = self.kb.add_documents([document("/corpus/x.txt", "vowel harmony in turkish suffixes", "hy")])
+
+        self.assertEqual(summary["added_chunks"], 0)
+        self.assertEqual(summary["skipped_duplicates"],
+                         [{"source": "/corpus/x.txt", "existing_source": "/corpus/y.txt", "removed_chunks": 1}])
+        self.assertFalse(self.store.check_document_exists("/corpus/x.txt"))
+        self.assertIsNone(self.store.get_source_by_hash("hx"))
+        results = self.store.query(["ergativity basque"], 5, scorer="keyword")
+        self.assertEqual(results["documents"][0], [])
+
+    def test_unchanged_duplicate_keeps_existing_source(self):
+        summary = self.kb.add_documents([document("/corpus/z.txt", "vowel harmony in turkish suffixes", "hy")])
+
+        self.assertEqual(summary["skipped_duplicates"][0]["removed_chunks"], 0)
+        self.assertTrue(self.store.check_document_exists("/corpus/x.txt"))
+        self.assertTrue(self.store.check_document_exists("/corpus/y.txt"))
+
+
+if __name__ == "__main__":
+    unittest.main()
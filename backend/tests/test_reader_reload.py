@@ -0,0 +1,90 @@
+"""
+只读副本增量重新加载的回归测试
+写进程追加分段、删除文档块后，在上一代副本基础上重新加载的结果应与从头打开的副本一致，
+倒排表与元数据列以内存映射方式打开
+
+用法（在 backend 目录下）:
+    python -m unittest discover -s tests
+"""
+
+import sys
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from knowledge_base import LightweightDocumentStore  # noqa: E402
+
+QUERY = "ergativity alignment"
+
+
+def make_documents(prefix: str, count: int):
+    documents = [f"{prefix} {i} ergativity alignment, {'verbal' if i % 2 else 'nominal'} marking" for i in range(count)]
+    metadatas = [{"source": f"/corpus/{prefix}_{i // 3}.txt", "type": "txt" if i % 2 else "pdf"}
+                 for i in range(count)]
+    return documents, metadatas
+
+
+class ReaderReloadTest(unittest.TestCase):
+    def setUp(self):
+        self.db_path = tempfile.mkdtemp()
+        self.writer = LightweightDocumentStore(self.db_path)
+        # 不触发后台合并与压缩，上一代的行号保持不变
+        self.writer.max_small_segments = 10 ** 6
+        self.writer.compaction_threshold = 1.0
+        self.writer.add(*make_documents("base", 12))
+
+    def tearDown(self):
+        if self.writer._refit_thread is not None:
+            self.writer._refit_thread.join()
+        shutil.rmtree(self.db_path, ignore_errors=True)
+
+    def assert_same_store(self, reloaded, fresh):
+        self.assertEqual(reloaded.metadata, fresh.metadata)
+        self.assertEqual(reloaded._source_chunks, fresh._source_chunks)
+        self.assertEqual(reloaded._filename_sources, fresh._filename_sources)
+        np.testing.assert_array_equal(reloaded.columns.mask({"type": "txt"}), fresh.columns.mask({"type": "txt"}))
+        if fresh.is_fitted:
+            np.testing.assert_allclose(reloaded.doc_freq, fresh.doc_freq)
+            np.testing.assert_allclose(reloaded.row_norms, fresh.row_norms)
+        for scorer in ("tfidf", "bm25", "keyword"):
+            expected = fresh.query([QUERY], 10, scorer=scorer)
+            results = reloaded.query([QUERY], 10, scorer=scorer)
+            self.assertEqual(results["metadatas"], expected["metadatas"])
+            np.testing.assert_allclose(results["distances"], expected["distances"])
+
+    def test_reload_after_add_and_delete_matches_fresh_open(self):
+        reader = LightweightDocumentStore.open_read_only(self.db_path)
+        self.assertIsInstance(reader.postings_blocks[0].doc_ids, np.memmap)
+        self.assertIsInstance(reader.columns.blocks[0].codes, np.memmap)
+
+        self.writer.add(*make_documents("late", 9))
+        self.writer.delete_chunks([0, 1, 2, 4, 13])
+        reloaded = LightweightDocumentStore.open_read_only(self.db_path, previous=reader)
+        self.assertNotIn("/corpus/base_0.txt", reloaded._source_chunks)
+        self.assert_same_store(reloaded, LightweightDocumentStore.open_read_only(self.db_path))
+        # 上一代副本不受影响
+        self.assertEqual(len(reader.metadata), 12)
+        self.assertIn("/corpus/base_0.txt", reader._source_chunks)
+
+    def test_reload_after_merge_reuses_rows(self):
+        reader = LightweightDocumentStore.open_read_only(self.db_path)
+        self.writer.add(*make_documents("late", 9))
+        self.writer.max_small_segments = 0
+        while self.writer.merge_small_segments():
+            pass
+        # 合并的输入包括上一代之后追加的分段
+        self.assertEqual(len(self.writer.segments), 1)
+        self.assertEqual(self.writer.segments[0].merged_from[0], reader.segments[0].name)
+
+        reloaded = LightweightDocumentStore.open_read_only(self.db_path, previous=reader)
+        self.assertEqual(reloaded._carried_rows(reader), 12)
+        self.assert_same_store(reloaded, LightweightDocumentStore.open_read_only(self.db_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
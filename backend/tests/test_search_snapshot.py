@@ -0,0 +1,103 @@
+"""
+检索快照与并发追加的回归测试
+检索在锁外使用 _search_state() 的快照，追加文档会原地扩展倒排索引与元数据；
+快照之后追加的行不应出现在候选中，带过滤条件或墓碑掩码的检索不应越界
+
+用法（在 backend 目录下）:
+    python -m unittest discover -s tests
+"""
+
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from knowledge_base import LightweightDocumentStore  # noqa: E402
+
+QUERY = "ergativity alignment"
+
+
+def make_documents(prefix: str, count: int):
+    documents = [f"{prefix} {i} ergativity alignment in split systems, filler text {i}" for i in range(count)]
+    metadatas = [{"source": f"/corpus/{prefix}_{i}.txt", "type": "txt" if i % 2 else "pdf"} for i in range(count)]
+    return documents, metadatas
+
+
+class SearchDuringAddTest(unittest.TestCase):
+    def setUp(self):
+        self.db_path = tempfile.mkdtemp()
+        self.store = LightweightDocumentStore(self.db_path)
+        # 不触发后台合并，行号只由本测试的追加决定
+        self.store.max_small_segments = 10 ** 6
+        self.store.add(*make_documents("base", 20))
+
+    def tearDown(self):
+        shutil.rmtree(self.db_path, ignore_errors=True)
+
+    def snapshot(self, filters=None):
+        """与 query() 相同：在锁内生成候选掩码与检索快照"""
+        store = self.store
+        with store._lock:
+            mask = store.columns.mask(filters)
+            if store.n_deleted:
+                mask = ~store.deleted if mask is None else mask & ~store.deleted
+            return mask, store._search_state()
+
+    def test_filtered_search_ignores_rows_added_after_snapshot(self):
+        mask, state = self.snapshot({"type": "txt"})
+        n_rows = len(state["documents"])
+        self.store.add(*make_documents("late", 30))
+
+        index = state["keyword_index"]
+        for hits in (index.bm25_search(QUERY, 50, mask=mask, deleted=state["deleted"]),
+                     index.keyword_search(QUERY, 50, mask=mask)):
+            self.assertTrue(hits)
+            self.assertTrue(all(row < n_rows and mask[row] for row, _ in hits))
+
+        results = self.store.bm25_search([QUERY], 50, mask=mask, state=state)
+        self.assertEqual(len(results["documents"][0]), int(mask.sum()))
+
+    def test_tombstoned_search_ignores_rows_added_after_snapshot(self):
+        self.store.delete_source("/corpus/base_0.txt")
+        mask, state = self.snapshot()
+        n_rows = len(state["documents"])
+        self.store.add(*make_documents("late", 30))
+
+        index = state["keyword_index"]
+        hits = index.bm25_search(QUERY, 50, mask=mask, deleted=state["deleted"])
+        self.assertEqual(sorted(row for row, _ in hits), list(range(1, n_rows)))
+        hits = index.keyword_search(QUERY, 50, mask=mask)
+        self.assertEqual(sorted(row for row, _ in hits), list(range(1, n_rows)))
+
+    def test_concurrent_queries_during_adds(self):
+        self.store.delete_source("/corpus/base_1.txt")
+        errors = []
+        stop = threading.Event()
+
+        def search():
+            while not stop.is_set():
+                for scorer in ("bm25", "keyword"):
+                    results = self.store.query([QUERY], 5, scorer=scorer, filters={"type": "pdf"})
+                    # 出错时 BM25 会回退为关键词检索，关键词检索会返回空结果
+                    if results["scorer"] != scorer or not results["documents"][0]:
+                        errors.append(scorer)
+
+        searchers = [threading.Thread(target=search) for _ in range(4)]
+        for thread in searchers:
+            thread.start()
+        try:
+            for batch in range(20):
+                self.store.add(*make_documents(f"batch{batch}", 10))
+        finally:
+            stop.set()
+            for thread in searchers:
+                thread.join()
+        self.assertEqual(errors, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
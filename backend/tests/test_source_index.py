@@ -0,0 +1,71 @@
+"""
+删除文档块后源索引的增量维护回归测试
+delete_chunks 只从受影响的来源中移除被删除的行，结果应与按元数据完整重建的源索引一致
+
+用法（在 backend 目录下）:
+    python -m unittest discover -s tests
+"""
+
+import sys
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from knowledge_base import LightweightDocumentStore  # noqa: E402
+
+
+class SourceIndexDeleteTest(unittest.TestCase):
+    def setUp(self):
+        self.db_path = tempfile.mkdtemp()
+        self.store = LightweightDocumentStore(self.db_path)
+        # 不触发后台合并与压缩，行号只由本测试的追加决定
+        self.store.max_small_segments = 10 ** 6
+        self.store.compaction_threshold = 1.0
+        for name, content_hash in (("a", "h1"), ("b", "h2"), ("c", "h1"), ("d", None)):
+            metadatas = [{"source": f"/corpus/{name}.txt"} for _ in range(5)]
+            if content_hash:
+                # 与分块导入的CSV相同，内容哈希只记录在最后一个文档块上
+                metadatas[-1]["content_hash"] = content_hash
+            self.store.add([f"{name} chunk {i}" for i in range(5)], metadatas)
+
+    def tearDown(self):
+        if self.store._refit_thread is not None:
+            self.store._refit_thread.join()
+        shutil.rmtree(self.db_path, ignore_errors=True)
+
+    def source_index(self):
+        store = self.store
+        return ({source: [list(r) for r in ranges] for source, ranges in store._source_chunks.items()},
+                {filename: list(sources) for filename, sources in store._filename_sources.items()},
+                dict(store._hash_sources), dict(store._source_hashes))
+
+    def assert_matches_rebuild(self):
+        incremental = self.source_index()
+        self.store._rebuild_source_index()
+        self.assertEqual(incremental, self.source_index())
+
+    def test_partial_delete_splits_ranges(self):
+        self.store.delete_chunks([1, 3, 10, 11])
+        self.assertEqual(self.store._source_chunks["/corpus/a.txt"], [[0, 1], [2, 3], [4, 5]])
+        self.assert_matches_rebuild()
+
+    def test_deleting_hashed_chunk_drops_hash(self):
+        self.store.delete_chunks([4])
+        self.assertNotIn("/corpus/a.txt", self.store._source_hashes)
+        self.assertEqual(self.store._hash_sources["h1"], "/corpus/c.txt")
+        self.assert_matches_rebuild()
+
+    def test_full_delete_drops_source(self):
+        self.store.delete_chunks(range(0, 5))
+        self.store.delete_chunks(range(15, 20))
+        self.assertNotIn("/corpus/a.txt", self.store._source_chunks)
+        self.assertNotIn("a.txt", self.store._filename_sources)
+        self.assertNotIn("d.txt", self.store._filename_sources)
+        self.assert_matches_rebuild()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,202 @@
+"""
+流式接收 multipart 上传
+直接解析请求体流：文件字段边接收边写入暂存文件并计算 SHA-256，大小超过上限时立即中止；
+不经过 Starlette 的表单解析（它会先读完整个请求体，并把超过 1MB 的文件先缓存到临时文件，相当于写两遍磁盘）
+"""
+
+import uuid
+import hashlib
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from fastapi import Request
+
+from executors import run_in_thread
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+    from python_multipart.exceptions import MultipartParseError
+except ImportError:
+    from multipart.multipart import MultipartParser, parse_options_header
+    from multipart.exceptions import MultipartParseError
+
+logger = logging.getLogger(__name__)
+
+# 攒够这么多字节再交给线程池写入，内存中最多缓存一块
+WRITE_BLOCK_SIZE = 1024 * 1024
+# 普通表单字段（标题、摘要等）的大小上限
+MAX_FIELD_SIZE = 64 * 1024
+# 除文件内容外，请求体中边界、表单头与普通字段的余量；Content-Length 超过 上限 + 余量 时不读请求体直接拒绝
+MAX_FORM_OVERHEAD = 1024 * 1024
+
+
+class UploadRejected(Exception):
+    """上传不符合要求，status_code 为应返回的 HTTP 状态码"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class StreamedUpload:
+    """已写入暂存文件的上传：原文件名、暂存路径、内容哈希、字节数以及同一请求中的普通表单字段"""
+
+    def __init__(self, filename: str, path: Path, content_hash: str, size: int, fields: Dict[str, str]):
+        self.filename = filename
+        self.path = path
+        self.content_hash = content_hash
+        self.size = size
+        self.fields = fields
+
+
+class _MultipartReceiver:
+    """MultipartParser 的回调：文件内容缓存为块，由调用方在线程池中写入；普通字段保存在内存"""
+
+    def __init__(self, staging_dir: Path, max_size: int, suffixes: Iterable[str], file_field: str):
+        self.staging_dir = staging_dir
+        self.max_size = max_size
+        self.suffixes = tuple(suffixes)
+        self.file_field = file_field
+        self.fields: Dict[str, str] = {}
+        self.filename: Optional[str] = None
+        self.path: Optional[Path] = None
+        self.size = 0
+        self.pending: List[bytes] = []
+        self.pending_bytes = 0
+        self._digest = hashlib.sha256()
+        self._file = None
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+        self._part_name: Optional[str] = None
+        self._part_value: Optional[bytearray] = None
+        self._in_file = False
+
+    def callbacks(self) -> Dict[str, object]:
+        return {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        }
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._part_name = None
+        self._part_value = None
+        self._in_file = False
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[bytes(self._header_field).lower()] = bytes(self._header_value)
+        self._header_field.clear()
+        self._header_value.clear()
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition"))
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        filename = options.get(b"filename")
+        if name != self.file_field or filename is None:
+            self._part_name = name
+            self._part_value = bytearray()
+            return
+        if self.filename is not None:
+            raise UploadRejected(400, "一次只能上传一个文件")
+        self.filename = Path(filename.decode("utf-8", "replace")).name
+        suffix = self.filename.split(".")[-1].lower() if "." in self.filename else ""
+        if suffix not in self.suffixes:
+            raise UploadRejected(400, f"不支持的文件类型: {suffix}。支持的类型: {', '.join(self.suffixes)}")
+        self.path = self.staging_dir / f"{uuid.uuid4().hex}.{suffix}.part"
+        self._in_file = True
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._in_file:
+            self.size += end - start
+            if self.size > self.max_size:
+                raise UploadRejected(413, f"文件过大。最大允许: {self.max_size / 1024 / 1024:.0f}MB")
+            # 解析器复用输入缓冲区，需要复制
+            self.pending.append(bytes(data[start:end]))
+            self.pending_bytes += end - start
+        elif self._part_value is not None:
+            self._part_value += data[start:end]
+            if len(self._part_value) > MAX_FIELD_SIZE:
+                raise UploadRejected(413, f"表单字段 {self._part_name} 过大")
+
+    def _on_part_end(self):
+        if self._part_value is not None and self._part_name:
+            self.fields[self._part_name] = self._part_value.decode("utf-8", "replace")
+        self._in_file = False
+
+    def take_pending(self) -> List[bytes]:
+        blocks, self.pending, self.pending_bytes = self.pending, [], 0
+        return blocks
+
+    def write_blocks(self, blocks: List[bytes]):
+        """在线程池中执行：哈希并追加写入暂存文件"""
+        if self._file is None:
+            self.staging_dir.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "wb")
+        for block in blocks:
+            self._digest.update(block)
+            self._file.write(block)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def discard(self):
+        self.close()
+        if self.path is not None:
+            self.path.unlink(missing_ok=True)
+
+    def hexdigest(self) -> str:
+        return self._digest.hexdigest()
+
+
+async def receive_upload(request: Request, staging_dir: Path, max_size: int, suffixes: Iterable[str],
+                         file_field: str = "file") -> StreamedUpload:
+    """
+    从请求体流中解析 multipart 表单，把文件字段（后缀须在 suffixes 中）写入 staging_dir 下的暂存文件，
+    同一遍计算内容哈希；Content-Length 已超过上限时不读取请求体，接收过程中超过上限时立即中止并删除已写入的部分。
+    不符合要求时抛出 UploadRejected
+    """
+    media_type, options = parse_options_header(request.headers.get("content-type"))
+    boundary = options.get(b"boundary")
+    if media_type != b"multipart/form-data" or not boundary:
+        raise UploadRejected(400, "请使用 multipart/form-data 上传文件")
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_size + MAX_FORM_OVERHEAD:
+        raise UploadRejected(
+            413, f"文件过大: {int(content_length) / 1024 / 1024:.1f}MB。最大允许: {max_size / 1024 / 1024:.0f}MB"
+        )
+
+    receiver = _MultipartReceiver(staging_dir, max_size, suffixes, file_field)
+    parser = MultipartParser(boundary, receiver.callbacks())
+    try:
+        try:
+            async for chunk in request.stream():
+                parser.write(chunk)
+                if receiver.pending_bytes >= WRITE_BLOCK_SIZE:
+                    await run_in_thread("io", receiver.write_blocks, receiver.take_pending())
+            parser.finalize()
+        except MultipartParseError as e:
+            raise UploadRejected(400, f"上传内容格式错误: {e}")
+        if receiver.filename is None:
+            raise UploadRejected(400, f"缺少上传文件字段 {file_field}")
+        await run_in_thread("io", receiver.write_blocks, receiver.take_pending())
+        receiver.close()
+    except BaseException:
+        receiver.discard()
+        raise
+    return StreamedUpload(receiver.filename, receiver.path, receiver.hexdigest(), receiver.size, receiver.fields)
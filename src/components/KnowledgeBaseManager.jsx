@@ -160,7 +160,10 @@ const KnowledgeBaseManager = () => {
     
     try {
       const result = await cancelCurrentTask();
-      if (result.status === 'success') {
+      if (result.status === 'success' && result.job_status === 'running') {
+        // 运行中的任务在当前文件处理完后停止，继续轮询任务状态直到其结束
+        setMessage(lang === 'zh' ? '正在取消，当前文件处理完后停止' : 'Cancelling after the current file');
+      } else if (result.status === 'success') {
         setMessage(lang === 'zh' ? '任务已取消' : 'Task cancelled');
         setTaskStatus(null);
         setTaskId(null);